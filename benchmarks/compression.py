@@ -0,0 +1,82 @@
+""" Benchmark of the CPU cost and the bytes saved by compressing response
+    bodies of list_reports and list_last.
+
+    Run from the root of the repository:
+
+        python -m benchmarks.compression --reports 500 1000 5000
+"""
+import argparse
+import base64
+import datetime
+import gzip
+import random
+import timeit
+
+from src.layers.voltage_common.voltage_common import compression
+from src.layers.voltage_common.voltage_common.serialization import dumps
+
+
+def generate_reports(station: str, n_reports: int) -> list[dict]:
+    """ Reports of a station every 12 hours, as returned by list_reports.
+    """
+    start = datetime.datetime(2023, 1, 1)
+    return [
+        {
+            "station": station,
+            "date": (start + datetime.timedelta(hours=12 * ii)).isoformat(),
+            "battery": round(100 + random.random() * 100, 2),
+            "panel": round(100 + random.random() * 100, 2),
+        }
+        for ii in range(n_reports)
+    ]
+
+
+def compressors() -> dict:
+    cases = {
+        f"gzip {level}": lambda data, level=level: gzip.compress(data, compresslevel=level, mtime=0)
+        for level in (1, 6, 9)
+    }
+    if compression.brotli is not None:
+        for quality in (1, 5, 11):
+            cases[f"brotli {quality}"] = (
+                lambda data, quality=quality: compression.brotli.compress(data, quality=quality)
+            )
+    else:
+        print("brotli is not installed, skipping its cases")
+    return cases
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", "-r", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    bodies = {
+        f"list_reports, {n} reports": dumps(
+            {"reports": generate_reports("Caracol", n), "nextKey": None})
+        for n in args.reports
+    }
+    bodies["list_last, 200 stations"] = dumps({
+        "reports": [generate_reports(f"Station {ii:03d}", 1)[0] for ii in range(200)]
+    })
+
+    for name, body in bodies.items():
+        data = body.encode()
+        print(f"\n{name}: {len(data) / 1024:.1f} KiB (best of {args.repeat})")
+        for method, compress in compressors().items():
+            best = min(timeit.repeat(lambda: compress(data), number=1, repeat=args.repeat))
+            # The body is sent base64 encoded through API Gateway, but the
+            # client downloads the compressed bytes
+            compressed = compress(data)
+            encoded = base64.b64encode(compressed)
+            print(
+                f"{method:<10} {best * 1000:8.2f} ms  "
+                f"{len(compressed) / 1024:8.1f} KiB  "
+                f"ratio {len(data) / len(compressed):5.1f}  "
+                f"base64 {len(encoded) / 1024:8.1f} KiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
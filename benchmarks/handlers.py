@@ -0,0 +1,337 @@
+""" Load and latency benchmark of the handlers of all the functions.
+
+    Seeds the tables with the reports of a fleet of stations, invokes each
+    lambda_handler in process with API Gateway and DynamoDB stream events,
+    and prints throughput, latency percentiles and peak memory per endpoint
+    as JSON, so the results of two commits can be compared.
+
+    The tables are mocked with moto by default, pass --endpoint-url to use
+    DynamoDB Local instead. moto answers in process, so its latencies leave
+    out the network but include the CPU time of moto itself.
+
+    Run from the root of the repository:
+
+        python -m benchmarks.handlers --stations 100 --days 730 --output bench.json
+        python -m benchmarks.handlers --cases list_reports last_report --iterations 200
+"""
+import argparse
+import contextlib
+import datetime
+from decimal import Decimal
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+from boto3.dynamodb.types import TypeSerializer
+import numpy as np
+
+from tests.ddb_table import create_table_if_not_exist
+from tests.unit.lambda_args import generate_event, generate_stream_event, get_context
+from src.layers.voltage_common.voltage_common import dynamodb
+from src.layers.voltage_common.voltage_common.reports import FLEET_PARTITION, LOW_BATTERY_ALERT
+
+# The data ends on a fixed date, so runs on different days are comparable
+END_DATE = datetime.datetime(2024, 1, 1)
+BATCH_WRITE_SIZE = 25
+TABLES = {
+    "REPORTS_TABLE": "BenchReports",
+    "LAST_REPORTS_TABLE": "BenchLastReports",
+    "REPORT_COUNTS_TABLE": "BenchReportCounts",
+    "ROLLUPS_TABLE": "BenchRollups",
+}
+# Low battery threshold of new_report, used to raise the seeded alerts
+LOW_BATTERY_THRESHOLD = 10
+HEADERS = {"Accept-Encoding": "gzip, br"}
+
+
+def log(message: str) -> None:
+    print(message, file=sys.stderr, flush=True)
+
+
+def generate_reports(stations: list[str], days: int, samples_per_day: int, seed: int) -> list[dict]:
+    """ Reports of every station at every sample of the period, oldest
+        first. A few stations end with a low battery and a few stopped
+        reporting some days before the end.
+    """
+    rng = np.random.default_rng(seed)
+    step = datetime.timedelta(hours=24 / samples_per_day)
+    n_dates = days * samples_per_day
+    dates = [(END_DATE - step * ii).isoformat() for ii in range(n_dates, 0, -1)]
+    reports = []
+    for station in stations:
+        battery = np.round(rng.uniform(11, 14, n_dates), 2)
+        panel = np.round(rng.uniform(0, 20, n_dates), 2)
+        if rng.random() < 0.05:
+            battery[-1] = 9.5
+        n_reported = n_dates - 3 * samples_per_day if rng.random() < 0.1 else n_dates
+        reports.extend(
+            {"station": station, "date": date, "battery": str(bat), "panel": str(pan)}
+            for date, bat, pan in zip(dates[:n_reported], battery.tolist(), panel.tolist())
+        )
+    return reports
+
+
+def put_items(client, table_name: str, items: list[dict]) -> None:
+    """ Write items given as Python values with BatchWriteItem.
+    """
+    serializer = TypeSerializer()
+    for ii in range(0, len(items), BATCH_WRITE_SIZE):
+        request_items = {table_name: [
+            {"PutRequest": {"Item": {key: serializer.serialize(value) for key, value in item.items()}}}
+            for item in items[ii:ii + BATCH_WRITE_SIZE]
+        ]}
+        while request_items:
+            request_items = client.batch_write_item(RequestItems=request_items).get("UnprocessedItems")
+
+
+def seed_tables(client, reports: list[dict]) -> None:
+    """ Fill the tables as the functions would have after ingesting the
+        reports: the last reports with their alerts, the counts per day and
+        the rollups of the stream consumer.
+    """
+    from src.report_rollups.report_rollups import aggregate_records
+
+    put_items(client, os.environ["REPORTS_TABLE"], [
+        {**rep, "battery": Decimal(rep["battery"]), "panel": Decimal(rep["panel"])} for rep in reports
+    ])
+
+    last_reports = {}
+    counts = {}
+    for rep in reports:
+        last_reports[rep["station"]] = rep
+        key = (rep["station"], rep["date"][:10])
+        counts[key] = counts.get(key, 0) + 1
+    last_items = []
+    for rep in last_reports.values():
+        item = {**rep, "battery": Decimal(rep["battery"]), "panel": Decimal(rep["panel"]), "fleet": FLEET_PARTITION}
+        if item["battery"] < LOW_BATTERY_THRESHOLD:
+            item.update({"alert": LOW_BATTERY_ALERT, "alert_since": rep["date"]})
+        last_items.append(item)
+    put_items(client, os.environ["LAST_REPORTS_TABLE"], last_items)
+    put_items(client, os.environ["REPORT_COUNTS_TABLE"], [
+        {"station": station, "day": day, "count": count} for (station, day), count in counts.items()
+    ])
+
+    rollups = aggregate_records(generate_stream_event(reports)["Records"])
+    put_items(client, os.environ["ROLLUPS_TABLE"], [
+        {"station": station, "bucket": bucket, **rollup} for (station, bucket), rollup in rollups.items()
+    ])
+
+
+def get_cases(stations: list[str]) -> dict[str, tuple[Callable, Callable[[int], dict]]]:
+    """ Handler and event factory of each endpoint. The factories take the
+        number of the invocation, so consecutive invocations query different
+        stations.
+    """
+    from src.alerts.alerts import lambda_handler as alerts
+    from src.last_report.last_report import lambda_handler as last_report
+    from src.list_last.list_last import lambda_handler as list_last
+    from src.list_reports.list_reports import lambda_handler as list_reports
+    from src.new_report.new_report import batch_handler, lambda_handler as new_report
+    from src.report_counts.report_counts import lambda_handler as report_counts
+    from src.report_rollups.report_rollups import lambda_handler as report_rollups
+    from src.report_series.report_series import lambda_handler as report_series
+    from src.stale_stations.stale_stations import lambda_handler as stale_stations
+
+    month_start = (END_DATE - datetime.timedelta(days=30)).isoformat()
+    end = END_DATE.isoformat()
+
+    def station(ii: int) -> str:
+        return stations[ii % len(stations)]
+
+    def some_stations(ii: int) -> str:
+        return ",".join(station(ii + jj) for jj in range(10))
+
+    def path_event(ii: int, **query) -> dict:
+        return generate_event(
+            path_params={"station": station(ii)}, query_string_params=query or None, headers=HEADERS)
+
+    def new_reports(ii: int, n_reports: int) -> list[dict]:
+        date = END_DATE + datetime.timedelta(minutes=ii)
+        return [
+            {
+                "station": station(ii * n_reports + jj),
+                "date": (date + datetime.timedelta(seconds=jj)).strftime("%Y/%m/%d,%H:%M:%S"),
+                "battery": 12.5,
+                "panel": 14.0,
+            }
+            for jj in range(n_reports)
+        ]
+
+    def stream_event(ii: int) -> dict:
+        reports = new_reports(ii, 500)
+        for rep in reports:
+            rep["date"] = datetime.datetime.strptime(rep["date"], "%Y/%m/%d,%H:%M:%S").isoformat()
+        return generate_stream_event(reports)
+
+    return {
+        "list_reports": (list_reports, lambda ii: path_event(ii)),
+        "list_reports_columnar": (list_reports, lambda ii: path_event(ii, format="columnar")),
+        "list_reports_month": (
+            list_reports, lambda ii: path_event(ii, start_date=month_start, end_date=end)),
+        "list_reports_stations": (list_reports, lambda ii: generate_event(
+            query_string_params={"stations": some_stations(ii), "start_date": month_start},
+            headers=HEADERS)),
+        "last_report": (last_report, lambda ii: path_event(ii)),
+        "list_last": (list_last, lambda ii: generate_event(headers=HEADERS)),
+        "list_last_stations": (list_last, lambda ii: generate_event(
+            query_string_params={"stations": some_stations(ii)}, headers=HEADERS)),
+        "report_counts": (report_counts, lambda ii: path_event(ii)),
+        "report_series_1h_month": (
+            report_series,
+            lambda ii: path_event(ii, resolution="1h", start_date=month_start, end_date=end)),
+        "report_series_1d": (report_series, lambda ii: path_event(ii, resolution="1d")),
+        "alerts": (alerts, lambda ii: generate_event(headers=HEADERS)),
+        "stale_stations": (stale_stations, lambda ii: generate_event(
+            query_string_params={"older_than": "PT24H"}, headers=HEADERS)),
+        # The writes go last, so they do not change the data of the reads
+        "new_report": (new_report, lambda ii: generate_event(body=new_reports(ii, 1)[0])),
+        "new_report_batch": (batch_handler, lambda ii: generate_event(
+            body={"reports": new_reports(ii, 100)})),
+        "report_rollups": (report_rollups, stream_event),
+    }
+
+
+def percentile(latencies: list[float], pct: int) -> float:
+    return statistics.quantiles(latencies, n=100, method="inclusive")[pct - 1]
+
+
+def run_case(
+        handler: Callable,
+        make_event: Callable[[int], dict],
+        iterations: int,
+        memory_runs: int
+) -> dict:
+    """ Time the invocations of a handler, then measure the peak memory of a
+        few more under tracemalloc, which slows them down too much to time
+        them at once.
+    """
+    context = get_context()
+    events = [make_event(ii) for ii in range(iterations + memory_runs + 1)]
+    status_codes = {}
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Warm up the clients, the connections and the caches
+        handler(events[0], context)
+        start = time.perf_counter()
+        for event in events[1:iterations + 1]:
+            invocation_start = time.perf_counter()
+            output = handler(event, context)
+            latencies.append((time.perf_counter() - invocation_start) * 1000)
+            status = str(output.get("statusCode", "ok"))
+            status_codes[status] = status_codes.get(status, 0) + 1
+        elapsed = time.perf_counter() - start
+
+        peak = 0
+        tracemalloc.start()
+        for event in events[iterations + 1:]:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            handler(event, context)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+        tracemalloc.stop()
+
+    return {
+        "invocations": iterations,
+        "throughput_per_s": round(iterations / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "peak_memory_kib": round(peak / 1024, 1),
+        "status_codes": status_codes,
+    }
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", type=int, default=100)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--samples-per-day", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", "-n", type=int, default=50)
+    parser.add_argument("--memory-runs", type=int, default=3,
+                        help="Invocations measured under tracemalloc")
+    parser.add_argument("--cases", nargs="+", help="Endpoints to run, all of them if not given")
+    parser.add_argument("--endpoint-url", help="DynamoDB Local endpoint, moto is used if not given")
+    parser.add_argument("--output", "-o", help="File to write the results to, stdout if not given")
+    args = parser.parse_args()
+
+    # The layer sends the requests of the tables with local in their names
+    # to the local endpoint
+    suffix = "Local" if args.endpoint_url else ""
+    for var, table_name in TABLES.items():
+        os.environ[var] = f"{table_name}{suffix}"
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-2")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+    if args.endpoint_url:
+        dynamodb.LOCAL_ENDPOINT_URL = args.endpoint_url
+    else:
+        from moto import mock_dynamodb
+        mock_dynamodb().start()
+
+    stations = [f"Station {ii:03d}" for ii in range(args.stations)]
+    cases = get_cases(stations)
+    unknown = set(args.cases or []) - set(cases)
+    if unknown:
+        parser.error(f"Unknown cases {', '.join(sorted(unknown))}. Choose from {', '.join(cases)}")
+
+    start = time.perf_counter()
+    for table_name in TABLES:
+        table_name = os.environ[table_name]
+        create_table_if_not_exist(dynamodb.get_dynamodb_resource(table_name), table_name, "localhost")
+    reports = generate_reports(stations, args.days, args.samples_per_day, args.seed)
+    log(f"Seeding {len(reports)} reports of {len(stations)} stations...")
+    seed_tables(dynamodb.get_dynamodb_client(os.environ["REPORTS_TABLE"]), reports)
+    seed_seconds = time.perf_counter() - start
+    log(f"Seeded the tables in {seed_seconds:.1f} s")
+
+    results = {}
+    for name, (handler, make_event) in cases.items():
+        if args.cases and name not in args.cases:
+            continue
+        results[name] = run_case(handler, make_event, args.iterations, args.memory_runs)
+        log(f"{name:<24} p50 {results[name]['p50_ms']:8.2f} ms  p99 {results[name]['p99_ms']:8.2f} ms")
+
+    output = json.dumps({
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "backend": "dynamodb-local" if args.endpoint_url else "moto",
+        "config": {
+            "stations": args.stations,
+            "days": args.days,
+            "samples_per_day": args.samples_per_day,
+            "reports": len(reports),
+            "iterations": args.iterations,
+            "seed": args.seed,
+        },
+        "seed_seconds": round(seed_seconds, 1),
+        "results": results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+""" Benchmark of the ingest latency of new_report with each of the write
+    modes of INGEST_WRITE_MODE.
+
+    The tables are mocked with moto by default. moto answers in-process, so
+    pass --rtt-ms to add the network round trip of every request, or point
+    the benchmark to DynamoDB Local with --endpoint-url. moto copies all its
+    tables on every transaction, so the transaction mode is only measured
+    fairly against DynamoDB Local.
+
+    Run from the root of the repository:
+
+        python -m benchmarks.ingest --reports 500 --rtt-ms 5
+        python -m benchmarks.ingest --endpoint-url http://localhost:8000
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import random
+import statistics
+import time
+
+from tests.ddb_table import create_table_if_not_exist
+from tests.unit.lambda_args import generate_event, get_context
+from src.layers.voltage_common.voltage_common import dynamodb
+
+MODES = ("sequential", "transaction", "concurrent")
+
+
+def generate_bodies(station: str, n_reports: int, late_fraction: float) -> list[dict]:
+    """ Reports of a station every 10 minutes, with a fraction of them sent
+        after a newer report.
+    """
+    start = datetime.datetime(2023, 1, 1)
+    dates = [start + datetime.timedelta(minutes=10 * ii) for ii in range(n_reports)]
+    for ii in range(1, n_reports):
+        if random.random() < late_fraction:
+            dates[ii - 1], dates[ii] = dates[ii], dates[ii - 1]
+    return [
+        {
+            "station": station,
+            "date": date.strftime("%Y/%m/%d,%H:%M:%S"),
+            "battery": round(10 + random.random() * 5, 2),
+            "panel": round(10 + random.random() * 10, 2),
+        }
+        for date in dates
+    ]
+
+
+def percentile(latencies: list[float], pct: int) -> float:
+    return statistics.quantiles(latencies, n=100, method="inclusive")[pct - 1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", "-r", type=int, default=500)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--late-fraction", type=float, default=0.05)
+    parser.add_argument("--rtt-ms", type=float, default=0.,
+                        help="Delay added to every DynamoDB request")
+    parser.add_argument("--endpoint-url", help="DynamoDB Local endpoint, moto is used if not given")
+    args = parser.parse_args()
+
+    # The layer sends the requests of the tables with local in their names
+    # to the local endpoint
+    suffix = "Local" if args.endpoint_url else ""
+    os.environ["REPORTS_TABLE"] = f"BenchReports{suffix}"
+    os.environ["LAST_REPORTS_TABLE"] = f"BenchLastReports{suffix}"
+    os.environ["REPORT_COUNTS_TABLE"] = f"BenchReportCounts{suffix}"
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-2")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+    if args.endpoint_url:
+        dynamodb.LOCAL_ENDPOINT_URL = args.endpoint_url
+    else:
+        from moto import mock_dynamodb
+        mock_dynamodb().start()
+
+    if args.rtt_ms:
+        # Registered before the clients are created, which copy the handlers.
+        # moto answers in before-send, so the delay is added before signing
+        def delay(**kwargs) -> None:
+            time.sleep(args.rtt_ms / 1000)
+        dynamodb.get_session().events.register("before-sign.dynamodb", delay)
+
+    for var in ("REPORTS_TABLE", "LAST_REPORTS_TABLE", "REPORT_COUNTS_TABLE"):
+        table_name = os.environ[var]
+        create_table_if_not_exist(dynamodb.get_dynamodb_resource(table_name), table_name, "localhost")
+
+    from src.new_report import new_report
+    context = get_context()
+    print(f"{args.reports} reports per mode, {args.late_fraction:.0%} late, rtt {args.rtt_ms} ms")
+    for mode in args.modes:
+        new_report.ingest_write_mode = mode
+        # A station per mode and run, so every mode writes new reports
+        station = f"Bench {mode} {time.time_ns()}"
+        bodies = generate_bodies(station, args.reports, args.late_fraction)
+        latencies = []
+        # The logs of the handler are discarded
+        with contextlib.redirect_stdout(io.StringIO()):
+            # Warm up the clients and the connections
+            new_report.lambda_handler(generate_event(body=bodies[0]), context)
+            for body in bodies[1:]:
+                event = generate_event(body=body)
+                start = time.perf_counter()
+                lambda_output = new_report.lambda_handler(event, context)
+                latencies.append((time.perf_counter() - start) * 1000)
+                assert lambda_output["statusCode"] == 201, lambda_output
+
+        print(
+            f"{mode:<12} p50 {percentile(latencies, 50):7.2f} ms  "
+            f"p99 {percentile(latencies, 99):7.2f} ms  "
+            f"mean {statistics.fmean(latencies):7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
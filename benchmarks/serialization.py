@@ -0,0 +1,77 @@
+""" Micro-benchmark of the serialization of list_reports response bodies.
+
+    Run from the root of the repository:
+
+        python -m benchmarks.serialization --reports 10000
+"""
+import argparse
+import datetime
+from decimal import Decimal
+import json
+import random
+import timeit
+
+from src.layers.voltage_common.voltage_common import serialization
+
+
+def generate_items(n_reports: int) -> list[dict]:
+    """ Reports as returned by the boto3 resource Table API.
+    """
+    start = datetime.datetime(2023, 1, 1)
+    return [
+        {
+            "station": "Caracol",
+            "date": (start + datetime.timedelta(hours=12 * ii)).isoformat(),
+            "battery": Decimal(str(round(100 + random.random() * 100, 2))),
+            "panel": Decimal(str(round(100 + random.random() * 100, 2))),
+        }
+        for ii in range(n_reports)
+    ]
+
+
+def float_conversion_path(items: list[dict]) -> str:
+    """ The previous path: convert the Decimals in a loop and then use json.dumps
+    """
+    reports = [dict(it) for it in items]
+    for rep in reports:
+        rep["battery"] = float(rep["battery"])
+        rep["panel"] = float(rep["panel"])
+    return json.dumps({"reports": reports, "nextKey": None})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", "-r", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    items = generate_items(args.reports)
+    float_reports = [
+        {**it, "battery": float(it["battery"]), "panel": float(it["panel"])} for it in items
+    ]
+
+    cases = {
+        "float loop + json.dumps": lambda: float_conversion_path(items),
+        "json backend, Decimal items": lambda: serialization.json_dumps(
+            {"reports": items, "nextKey": None}),
+        "json backend, float items": lambda: serialization.json_dumps(
+            {"reports": float_reports, "nextKey": None}),
+    }
+    if serialization.orjson is not None:
+        cases["orjson backend, Decimal items"] = lambda: serialization.orjson_dumps(
+            {"reports": items, "nextKey": None})
+        cases["orjson backend, float items"] = lambda: serialization.orjson_dumps(
+            {"reports": float_reports, "nextKey": None})
+    else:
+        print("orjson is not installed, skipping its cases")
+
+    print(f"Serializing {args.reports} reports (best of {args.repeat})")
+    baseline = None
+    for name, func in cases.items():
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        print(f"{name:<32} {best * 1000:8.2f} ms  {baseline / best:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
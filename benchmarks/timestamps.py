@@ -0,0 +1,54 @@
+""" Benchmark of the parsing of the dates of the reports by new_report.
+
+    Run from the root of the repository:
+
+        python -m benchmarks.timestamps --dates 100000
+"""
+import argparse
+import datetime
+import random
+import timeit
+
+from src.layers.voltage_common.voltage_common import timestamps
+
+
+def generate_dates(n_dates: int) -> list[str]:
+    """ Dates in the slash format of the dataloggers.
+    """
+    start = datetime.datetime(2020, 1, 1)
+    return [
+        (start + datetime.timedelta(seconds=random.randrange(10 ** 8))).strftime(timestamps.SLASH_FORMAT)
+        for _ in range(n_dates)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dates", "-d", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    dates = generate_dates(args.dates)
+    iso_dates = [timestamps.parse_slash(date) for date in dates]
+    epochs = [
+        datetime.datetime.fromisoformat(date).replace(tzinfo=datetime.timezone.utc).timestamp()
+        for date in iso_dates
+    ]
+    cases = {
+        "strptime": lambda: [
+            datetime.datetime.strptime(date, timestamps.SLASH_FORMAT).isoformat() for date in dates
+        ],
+        "parse_timestamp": lambda: [timestamps.parse_timestamp(date) for date in dates],
+        "parse_timestamp iso": lambda: [timestamps.parse_timestamp(date) for date in iso_dates],
+        "parse_timestamp epoch": lambda: [timestamps.parse_timestamp(date) for date in epochs],
+    }
+
+    assert [timestamps.parse_timestamp(date) for date in dates] == iso_dates
+    print(f"{args.dates} dates (best of {args.repeat})")
+    for name, parse in cases.items():
+        best = min(timeit.repeat(parse, number=1, repeat=args.repeat))
+        print(f"{name:<22} {best * 1000:8.1f} ms  {best / args.dates * 1e9:6.0f} ns/date")
+
+
+if __name__ == "__main__":
+    main()
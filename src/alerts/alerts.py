@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+
+try:
+    from schema import OUTPUT_SCHEMA
+    from voltage_common.dynamodb import get_dynamodb_client
+    from voltage_common.reports import ALERTS_INDEX, LOW_BATTERY_ALERT
+    from voltage_common.responses import get_cors_origin, respond
+    from voltage_common.validation import outbound_validator
+except ModuleNotFoundError:
+    from src.alerts.schema import OUTPUT_SCHEMA
+    from src.layers.voltage_common.voltage_common.dynamodb import get_dynamodb_client
+    from src.layers.voltage_common.voltage_common.reports import ALERTS_INDEX, LOW_BATTERY_ALERT
+    from src.layers.voltage_common.voltage_common.responses import get_cors_origin, respond
+    from src.layers.voltage_common.voltage_common.validation import outbound_validator
+
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+    from aws_lambda_powertools.utilities.typing import LambdaContext
+
+
+table_name = os.environ["LAST_REPORTS_TABLE"]
+ALERT_ATTRIBUTE_NAMES = {
+    "#station": "station",
+    "#date": "date",
+    "#battery": "battery",
+    "#panel": "panel",
+    "#alert": "alert",
+    "#alertSince": "alert_since",
+}
+
+
+def query_alerts(client, alert: str) -> list[dict]:
+    """ Query the stations with an active alert, sorted by station.
+    """
+    kwargs = {
+        "TableName": table_name,
+        "IndexName": ALERTS_INDEX,
+        "KeyConditionExpression": "#alert = :alert",
+        "ExpressionAttributeNames": ALERT_ATTRIBUTE_NAMES,
+        "ExpressionAttributeValues": {":alert": {"S": alert}},
+        "ProjectionExpression": ", ".join(ALERT_ATTRIBUTE_NAMES),
+    }
+    alerts = []
+    while True:
+        ddb_res = client.query(**kwargs)
+        alerts.extend(
+            {
+                "station": it["station"]["S"],
+                "alert": it["alert"]["S"],
+                "since": it["alert_since"]["S"],
+                "date": it["date"]["S"],
+                "battery": float(it["battery"]["N"]),
+                "panel": float(it["panel"]["N"]),
+            }
+            for it in ddb_res["Items"]
+        )
+        if "LastEvaluatedKey" not in ddb_res:
+            return alerts
+        kwargs["ExclusiveStartKey"] = ddb_res["LastEvaluatedKey"]
+
+
+@outbound_validator(OUTPUT_SCHEMA)
+def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
+    """ Get the stations with an active low battery alert
+
+    The alerts are raised and cleared when new reports arrive, so they are
+    read from the alerts index instead of scanning the last reports.
+
+    Parameters
+    ----------
+    event: dict, required
+        API Gateway Lambda Proxy Input Format
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+    Returns
+    ------
+    API Gateway Lambda Proxy Output Format: dict
+    """
+    cors_origin = get_cors_origin(context.function_name)
+    client = get_dynamodb_client(table_name)
+    alerts = query_alerts(client, LOW_BATTERY_ALERT)
+    print("Alerts", alerts)
+    return respond(200, {"alerts": alerts}, cors_origin)
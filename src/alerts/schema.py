@@ -0,0 +1,22 @@
+OUTPUT_SCHEMA = {
+    "$schema": "http://json-schema.org/draft-07/schema",
+    "type": "object",
+    "title": "Alerts Lambda Output Schema",
+    "description": "The stations with an active low battery alert",
+    "properties": {
+        "statusCode": {
+            "type": "integer",
+            "description": "HTTP Status Code",
+            "examples": [200, 401, 500]
+        },
+        "body": {
+            "type": "string",
+            "description": "The alerts of the stations encoded as a json string",
+            "examples": [
+                '{"alerts": [{"station": "Tonalapa", "alert": "low_battery", "since": "2023-02-22T16:20:00", '
+                '"date": "2023-02-23T16:20:00", "battery": 5.0, "panel": 150.0}]}'
+            ]
+        }
+    },
+    "required": ["statusCode", "body"],
+}
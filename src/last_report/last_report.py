@@ -1,59 +1,63 @@
+from __future__ import annotations
+
 import os
-import json
+from typing import TYPE_CHECKING
 from urllib.parse import unquote
 
-from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
-from aws_lambda_powertools.utilities.typing import LambdaContext
-from aws_lambda_powertools.utilities.validation import validator
-import boto3
-from boto3.dynamodb.conditions import Key
-
 try:
     from schema import OUTPUT_SCHEMA
+    from voltage_common.cache import TTLCache, log_cache_access
+    from voltage_common.conditional import cache_headers, is_not_modified, make_etag
+    from voltage_common.dynamodb import get_dynamodb_client
+    from voltage_common.reports import get_report
+    from voltage_common.responses import (
+        get_cors_origin,
+        respond,
+        respond_not_modified,
+        respond_serialized,
+    )
+    from voltage_common.serialization import dumps
+    from voltage_common.validation import outbound_validator
 except ModuleNotFoundError:
     from src.last_report.schema import OUTPUT_SCHEMA
-
-
-def get_dynamodb_resource(t_name: str):
-    t_name = t_name.lower()
-    if "local" in t_name:
-        return boto3.resource('dynamodb', endpoint_url="http://dynamo-local:8000")
-    else:
-        return boto3.resource('dynamodb')
+    from src.layers.voltage_common.voltage_common.cache import TTLCache, log_cache_access
+    from src.layers.voltage_common.voltage_common.conditional import (
+        cache_headers,
+        is_not_modified,
+        make_etag,
+    )
+    from src.layers.voltage_common.voltage_common.dynamodb import get_dynamodb_client
+    from src.layers.voltage_common.voltage_common.reports import get_report
+    from src.layers.voltage_common.voltage_common.responses import (
+        get_cors_origin,
+        respond,
+        respond_not_modified,
+        respond_serialized,
+    )
+    from src.layers.voltage_common.voltage_common.serialization import dumps
+    from src.layers.voltage_common.voltage_common.validation import outbound_validator
+
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+    from aws_lambda_powertools.utilities.typing import LambdaContext
 
 
 table_name = os.environ["LAST_REPORTS_TABLE"]
-dynamodb_resource = get_dynamodb_resource(table_name)
-
+# Stations report about every 12 hours, so responses can be reused by warm
+# containers for a while instead of reading DynamoDB on every request
+cache = TTLCache(
+    ttl=float(os.environ.get("CACHE_TTL", "60")),
+    max_size=int(os.environ.get("CACHE_MAX_SIZE", "128"))
+)
 
-def get_cors_origin(lambda_fn_name: str) -> str:
-    if "prod" in lambda_fn_name:
-        return "https://api.voltage.cires-ac.mx"
-    else:
-        return "*"
 
-
-def respond(
-        status_code: int, body: list | dict | str,
-        cors_origin: str = "*"
-) -> dict:
-    """ A response in the format that API Gateway expects.
-    """
-    return {
-        "statusCode": status_code,
-        'headers': {
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Allow-Origin': cors_origin,
-            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-        },
-        "body": json.dumps(body)
-    }
-
-
-@validator(outbound_schema=OUTPUT_SCHEMA)
+@outbound_validator(OUTPUT_SCHEMA)
 def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
     """ Returns the last report of a station
 
+    Responds 304 when the If-None-Match or If-Modified-Since headers show
+    the client already has the report.
+
     Parameters
     ----------
     event: dict, required
@@ -67,8 +71,6 @@ def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
     dict
     """
     cors_origin = get_cors_origin(context.function_name)
-
-    table = dynamodb_resource.Table(table_name)
     path_params = event.get("pathParameters")
     station = ""
     if path_params is not None:
@@ -80,20 +82,29 @@ def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
         return respond(400, {"message": "Need to pass a station"})
 
     print(f"Requested last report for station {station}")
-
-    ddb_res = table.query(KeyConditionExpression=Key("station").eq(station))
-    reports = ddb_res["Items"]
-    if not reports:
-        print(f"Did not find last report for station {station}")
-        return respond(
-            404,
-            {"message": f"Station '{station}' not found"},
-            cors_origin
-        )
-
-    print("Reports", reports)
-    last_report = reports[0]
-    last_report["battery"] = float(last_report["battery"])
-    last_report["panel"] = float(last_report["panel"])
-
-    return respond(200, last_report, cors_origin)
+    cached = cache.get(station)
+    log_cache_access(cache, station, cached is not None)
+    if cached is None:
+        client = get_dynamodb_client(table_name)
+        last_report = get_report(client, table_name, station)
+        if last_report is None:
+            print(f"Did not find last report for station {station}")
+            return respond(
+                404,
+                {"message": f"Station '{station}' not found"},
+                cors_origin
+            )
+
+        print("Last report", last_report)
+        # The ETag covers the battery and panel values, not only the date
+        body = dumps(last_report)
+        cached = {"report": last_report, "etag": make_etag(body), "body": body}
+        cache.put(station, cached)
+
+    last_modified = cached["report"]["date"]
+    headers = cache_headers(cached["etag"], last_modified)
+    if is_not_modified(event, cached["etag"], last_modified):
+        print(f"Last report of station {station} not modified")
+        return respond_not_modified(headers, cors_origin)
+
+    return respond_serialized(200, cached["body"], cors_origin, headers)
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+import time
+from typing import Any, Optional
+
+
+class TTLCache:
+    """ Least recently used cache whose entries expire after ttl seconds.
+
+        Lives at module level so that it is kept between invocations of a
+        warm lambda container.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        """ Returns the cached value or None if it is missing or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, value: Any) -> None:
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def log_cache_access(cache: TTLCache, key: str, hit: bool) -> None:
+    result = "hit" if hit else "miss"
+    print(f"Cache {result} for '{key}'. Hits: {cache.hits}, misses: {cache.misses}")
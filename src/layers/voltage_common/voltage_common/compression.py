@@ -0,0 +1,84 @@
+import base64
+import gzip
+import os
+from typing import Optional
+
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+# Bodies smaller than this many bytes are sent uncompressed
+COMPRESSION_THRESHOLD = int(os.environ.get("COMPRESSION_THRESHOLD", "8192"))
+# Moderate levels, the higher ones cost several times the CPU for a few
+# percent less bytes on the JSON of the reports
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+
+
+def supported_encodings() -> list[str]:
+    """ Content encodings that can be used, in order of preference.
+    """
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """ Choose the content encoding of a response from the Accept-Encoding
+        header of the request.
+
+        Returns None if the client does not accept any supported encoding.
+    """
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    for encoding in supported_encodings():
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    elif encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported content encoding '{encoding}'")
+
+
+def compress_body(body: str, accept_encoding: Optional[str]) -> tuple[str, Optional[str]]:
+    """ Compress a response body with the encoding preferred by the client,
+        if it is larger than the compression threshold.
+
+        Returns the base64 encoded compressed body and its encoding, or the
+        original body and None.
+    """
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return body, None
+
+    data = body.encode()
+    if len(data) < COMPRESSION_THRESHOLD:
+        return body, None
+    return base64.b64encode(compress(data, encoding)).decode(), encoding
+
+
+def get_body(event: dict) -> str:
+    """ The body of a request, which API Gateway sends base64 encoded when
+        its content type is one of the binary media types of the API.
+    """
+    body = event.get("body") or ""
+    if body and event.get("isBase64Encoded"):
+        return base64.b64decode(body).decode()
+    return body
@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import hashlib
+import os
+from typing import Optional
+
+# Seconds that clients may reuse a response before revalidating it
+CACHE_MAX_AGE = int(os.environ.get("CACHE_MAX_AGE", "60"))
+
+
+def make_etag(*parts) -> str:
+    """ A weak ETag from the parts that identify the content of a response.
+
+        Endpoints that respond with reports pass the serialized body, so any
+        change in a report, not only in the newest or oldest one, changes the
+        ETag. The body is serialized anyway for the 200 responses. The ETag
+        is weak because the same body is sent with any of the content
+        encodings, and strong ETags must differ between encodings.
+    """
+    content = "\n".join(str(part) for part in parts).encode()
+    return f'W/"{hashlib.blake2b(content, digest_size=8).hexdigest()}"'
+
+
+def parse_date(date: str) -> datetime:
+    """ Parse the date of a report, which is stored without timezone, as UTC.
+    """
+    return datetime.fromisoformat(date).replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def cache_headers(etag: str, last_modified: str = "") -> dict[str, str]:
+    """ Headers for the validation of a response by the clients.
+
+        The Last-Modified header is set only if the date of the newest report
+        is given.
+    """
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"max-age={CACHE_MAX_AGE}",
+    }
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(parse_date(last_modified), usegmt=True)
+    return headers
+
+
+def get_header(event: dict, name: str) -> Optional[str]:
+    """ Get a request header ignoring the case of its name.
+    """
+    headers = event.get("headers") or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def is_not_modified(event: dict, etag: str, last_modified: str = "") -> bool:
+    """ Whether the client already has the response according to the
+        If-None-Match or If-Modified-Since headers of the request.
+
+        If-None-Match uses the weak comparison, and If-Modified-Since is
+        ignored when the request has If-None-Match.
+    """
+    if_none_match = get_header(event, "If-None-Match")
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = get_header(event, "If-Modified-Since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return parse_date(last_modified) <= since
+
+    return False
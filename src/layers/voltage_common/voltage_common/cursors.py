@@ -0,0 +1,29 @@
+import base64
+import binascii
+
+# Station names and dates never contain new lines
+SEPARATOR = "\n"
+
+
+def encode_cursor(key: dict[str, str]) -> str:
+    """ Encode the key of a report as an opaque url safe cursor.
+    """
+    raw = f"{key['station']}{SEPARATOR}{key['date']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict[str, str]:
+    """ Decode a cursor created with encode_cursor.
+
+        Raises a ValueError if the cursor is not valid.
+    """
+    padding = "=" * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(cursor + padding).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor {cursor}")
+
+    station, sep, date = raw.partition(SEPARATOR)
+    if not sep or not station or not date:
+        raise ValueError(f"Invalid cursor {cursor}")
+    return {"station": station, "date": date}
@@ -0,0 +1,64 @@
+import functools
+from typing import Optional
+
+import boto3
+from botocore.config import Config
+
+LOCAL_ENDPOINT_URL = "http://dynamo-local:8000"
+
+# Every function talks to a handful of tables in the same region, so a small
+# pool of kept alive connections is reused by all the clients
+CLIENT_CONFIG = Config(
+    connect_timeout=1,
+    max_pool_connections=16,
+    retries={"max_attempts": 3, "mode": "standard"},
+    tcp_keepalive=True,
+)
+
+
+@functools.cache
+def get_session() -> boto3.session.Session:
+    """ The boto3 session shared by all the clients of the container.
+    """
+    return boto3.session.Session()
+
+
+@functools.cache
+def _create_resource(endpoint_url: Optional[str]):
+    return get_session().resource(
+        "dynamodb", endpoint_url=endpoint_url, config=CLIENT_CONFIG
+    )
+
+
+@functools.cache
+def _create_client(endpoint_url: Optional[str]):
+    return get_session().client(
+        "dynamodb", endpoint_url=endpoint_url, config=CLIENT_CONFIG
+    )
+
+
+def get_endpoint_url(t_name: str) -> Optional[str]:
+    if "local" in t_name.lower():
+        return LOCAL_ENDPOINT_URL
+    return None
+
+
+def get_dynamodb_resource(t_name: str):
+    """ Returns the DynamoDB resource for the given table.
+
+        The resource is created on first use and then reused by the
+        following invocations.
+    """
+    return _create_resource(get_endpoint_url(t_name))
+
+
+def get_table(t_name: str):
+    return get_dynamodb_resource(t_name).Table(t_name)
+
+
+def get_dynamodb_client(t_name: str):
+    """ Returns the low level DynamoDB client for the given table.
+
+        Unlike resources, clients can be shared between threads.
+    """
+    return _create_client(get_endpoint_url(t_name))
@@ -0,0 +1,26 @@
+import json
+import time
+
+NAMESPACE = "VoltageAPI"
+
+
+def emit_metric(name: str, value: float, unit: str = "Count", **dimensions: str) -> None:
+    """ Print a metric in the CloudWatch embedded metric format.
+
+        CloudWatch extracts the metric from the log line, so no API call is
+        made from the function.
+    """
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [{"Name": name, "Unit": unit}],
+                }
+            ],
+        },
+        name: value,
+        **dimensions,
+    }))
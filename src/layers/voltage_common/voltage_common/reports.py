@@ -0,0 +1,227 @@
+import time
+from typing import Optional
+
+REPORT_ATTRIBUTE_NAMES = {
+    "#station": "station",
+    "#date": "date",
+    "#battery": "battery",
+    "#panel": "panel",
+}
+REPORT_PROJECTION = ", ".join(REPORT_ATTRIBUTE_NAMES)
+# Partition key of every last report in the index ordered by date, which
+# holds the whole fleet in a single partition
+FLEET_PARTITION = "all"
+# Indexes of the last reports table, named as in template.yaml. The alerts
+# index is sparse, with only the stations that have an active alert
+LAST_REPORT_DATE_INDEX = "LastReportDateIndex"
+ALERTS_INDEX = "AlertsIndex"
+# Alert of the stations whose battery is below their threshold
+LOW_BATTERY_ALERT = "low_battery"
+# The reports of a station in columns do not repeat its name
+REPORT_COLUMNS_PROJECTION = "#date, #battery, #panel"
+BATCH_GET_SIZE = 100
+MAX_BATCH_RETRIES = 5
+RETRY_BACKOFF = 0.05  # seconds
+
+
+def deserialize_report(item: dict) -> dict:
+    """ Decode a report in DynamoDB JSON using the fixed schema of the reports
+        (S station, S date, N battery, N panel).
+
+        This is several times faster than the TypeDeserializer of the boto3
+        resources, which decodes every number into a Decimal.
+    """
+    return {
+        "station": item["station"]["S"],
+        "date": item["date"]["S"],
+        "battery": float(item["battery"]["N"]),
+        "panel": float(item["panel"]["N"]),
+    }
+
+
+def deserialize_reports(items: list[dict]) -> list[dict]:
+    # Same as deserialize_report, inlined to save a function call per item
+    return [
+        {
+            "station": it["station"]["S"],
+            "date": it["date"]["S"],
+            "battery": float(it["battery"]["N"]),
+            "panel": float(it["panel"]["N"]),
+        }
+        for it in items
+    ]
+
+
+def deserialize_columns(items: list[dict]) -> dict[str, list]:
+    """ Decode reports in DynamoDB JSON into a list of values per attribute.
+    """
+    return {
+        "date": [it["date"]["S"] for it in items],
+        "battery": [float(it["battery"]["N"]) for it in items],
+        "panel": [float(it["panel"]["N"]) for it in items],
+    }
+
+
+def serialize_key(key: dict[str, str]) -> dict:
+    """ Convert a key with string attributes to DynamoDB JSON.
+    """
+    return {name: {"S": value} for name, value in key.items()}
+
+
+def deserialize_key(key: dict) -> dict[str, str]:
+    """ Convert a key in DynamoDB JSON, such as a LastEvaluatedKey, to a dict
+        of strings.
+    """
+    return {name: value["S"] for name, value in key.items()}
+
+
+def parse_stations(stations: str) -> list[str]:
+    """ Split a comma separated list of stations, dropping empty and
+        repeated names.
+    """
+    names = (name.strip() for name in stations.split(","))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def get_report(client, table_name: str, station: str) -> Optional[dict]:
+    """ Get the report of a station from a table keyed only by station.
+    """
+    ddb_res = client.get_item(
+        TableName=table_name,
+        Key=serialize_key({"station": station}),
+        ProjectionExpression=REPORT_PROJECTION,
+        ExpressionAttributeNames=REPORT_ATTRIBUTE_NAMES,
+    )
+    if "Item" not in ddb_res:
+        return None
+    return deserialize_report(ddb_res["Item"])
+
+
+def batch_get_reports(
+        client,
+        table_name: str,
+        stations: list[str]
+) -> tuple[dict[str, dict], list[str]]:
+    """ Get the reports of several stations from a table keyed only by
+        station, in chunks of 100 keys per BatchGetItem.
+
+        Unprocessed keys are retried with exponential backoff. Returns the
+        reports by station, without the stations that have none, and the
+        stations that could not be read.
+    """
+    reports = {}
+    failed = []
+    for ii in range(0, len(stations), BATCH_GET_SIZE):
+        request_items = {
+            table_name: {
+                "Keys": [
+                    serialize_key({"station": station})
+                    for station in stations[ii:ii + BATCH_GET_SIZE]
+                ],
+                "ProjectionExpression": REPORT_PROJECTION,
+                "ExpressionAttributeNames": REPORT_ATTRIBUTE_NAMES,
+            }
+        }
+        for attempt in range(MAX_BATCH_RETRIES + 1):
+            if attempt > 0:
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            ddb_res = client.batch_get_item(RequestItems=request_items)
+            for rep in deserialize_reports(ddb_res["Responses"].get(table_name, [])):
+                reports[rep["station"]] = rep
+            request_items = ddb_res.get("UnprocessedKeys", {})
+            if not request_items:
+                break
+        if request_items:
+            failed.extend(
+                deserialize_key(key)["station"] for key in request_items[table_name]["Keys"]
+            )
+    return reports, failed
+
+
+def report_query_kwargs(
+        table_name: str,
+        station: str,
+        start_date: str = "",
+        end_date: str = "",
+) -> dict:
+    """ Arguments of a query for the reports of a station with the dates
+        between the given inclusive bounds. Empty bounds are ignored.
+    """
+    kwargs = {
+        "TableName": table_name,
+        "KeyConditionExpression": "#station = :station",
+        "ExpressionAttributeNames": REPORT_ATTRIBUTE_NAMES,
+        "ExpressionAttributeValues": {":station": {"S": station}},
+        "ProjectionExpression": REPORT_PROJECTION,
+    }
+    values = kwargs["ExpressionAttributeValues"]
+    if start_date and end_date:
+        kwargs["KeyConditionExpression"] += " AND #date BETWEEN :start AND :end"
+        values[":start"] = {"S": start_date}
+        values[":end"] = {"S": end_date}
+    elif start_date:
+        kwargs["KeyConditionExpression"] += " AND #date >= :start"
+        values[":start"] = {"S": start_date}
+    elif end_date:
+        kwargs["KeyConditionExpression"] += " AND #date <= :end"
+        values[":end"] = {"S": end_date}
+    return kwargs
+
+
+def query_reports(
+        client,
+        table_name: str,
+        station: str,
+        start_date: str = "",
+        end_date: str = "",
+        exclusive_start_key: Optional[dict[str, str]] = None,
+        limit: Optional[int] = None,
+        columnar: bool = False,
+) -> tuple[list[dict] | dict[str, list], Optional[dict[str, str]]]:
+    """ Query a page of the reports of a station, newest first.
+
+        The dates bounds are inclusive and ignored when empty. Returns the
+        reports and the key to continue the query, which is None when there
+        are no more reports. With columnar the reports are returned as the
+        lists of dates, battery and panel values.
+    """
+    kwargs = report_query_kwargs(table_name, station, start_date, end_date)
+    kwargs["ScanIndexForward"] = False
+    if columnar:
+        kwargs["ProjectionExpression"] = REPORT_COLUMNS_PROJECTION
+    if exclusive_start_key:
+        kwargs["ExclusiveStartKey"] = serialize_key(exclusive_start_key)
+    if limit:
+        kwargs["Limit"] = limit
+
+    ddb_res = client.query(**kwargs)
+    next_key = None
+    if "LastEvaluatedKey" in ddb_res:
+        next_key = deserialize_key(ddb_res["LastEvaluatedKey"])
+    if columnar:
+        return deserialize_columns(ddb_res["Items"]), next_key
+    return deserialize_reports(ddb_res["Items"]), next_key
+
+
+def scan_reports(
+        client,
+        table_name: str,
+        segment: int = 0,
+        total_segments: int = 1
+) -> list[dict]:
+    """ Scan a segment of a reports table following LastEvaluatedKey.
+    """
+    kwargs = {
+        "TableName": table_name,
+        "ProjectionExpression": REPORT_PROJECTION,
+        "ExpressionAttributeNames": REPORT_ATTRIBUTE_NAMES,
+        "Segment": segment,
+        "TotalSegments": total_segments,
+    }
+    reports = []
+    while True:
+        ddb_res = client.scan(**kwargs)
+        reports.extend(deserialize_reports(ddb_res["Items"]))
+        if "LastEvaluatedKey" not in ddb_res:
+            return reports
+        kwargs["ExclusiveStartKey"] = ddb_res["LastEvaluatedKey"]
@@ -0,0 +1,70 @@
+from typing import Optional
+
+from .compression import compress_body
+from .serialization import dumps
+
+
+def get_cors_origin(lambda_fn_name: str) -> str:
+    if "prod" in lambda_fn_name:
+        return "https://api.voltage.cires-ac.mx"
+    else:
+        return "*"
+
+
+def respond(
+        status_code: int, body: list | dict | str,
+        cors_origin: str = "*",
+        headers: Optional[dict[str, str]] = None,
+        accept_encoding: Optional[str] = None
+) -> dict:
+    """ A response in the format that API Gateway expects.
+    """
+    return respond_serialized(status_code, dumps(body), cors_origin, headers, accept_encoding)
+
+
+def respond_serialized(
+        status_code: int, body: str,
+        cors_origin: str = "*",
+        headers: Optional[dict[str, str]] = None,
+        accept_encoding: Optional[str] = None
+) -> dict:
+    """ A response in the format that API Gateway expects with a body
+        that is already serialized.
+
+        Endpoints that compress their responses pass the Accept-Encoding
+        header of the request, or an empty string if it is missing. Large
+        bodies are then compressed and base64 encoded.
+    """
+    response_headers = {
+        'Access-Control-Allow-Headers': 'Content-Type',
+        'Access-Control-Allow-Origin': cors_origin,
+        'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
+    }
+    if headers:
+        response_headers.update(headers)
+    encoding = None
+    if accept_encoding is not None:
+        response_headers["Vary"] = "Accept-Encoding"
+        body, encoding = compress_body(body, accept_encoding)
+    if encoding is not None:
+        response_headers["Content-Type"] = "application/json"
+        response_headers["Content-Encoding"] = encoding
+    return {
+        "statusCode": status_code,
+        'headers': response_headers,
+        "body": body,
+        "isBase64Encoded": encoding is not None
+    }
+
+
+def respond_not_modified(
+        headers: dict[str, str],
+        cors_origin: str = "*",
+        accept_encoding: Optional[str] = None
+) -> dict:
+    """ A 304 response, which has no body.
+
+        Endpoints that compress their responses pass the Accept-Encoding
+        header too, so that the 304 has the same Vary header as the 200.
+    """
+    return respond_serialized(304, "", cors_origin, headers, accept_encoding)
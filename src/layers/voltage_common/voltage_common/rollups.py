@@ -0,0 +1,75 @@
+# Resolutions of the rollups, with the length of the prefix of the dates that
+# is kept and the suffix that completes the start of their buckets
+RESOLUTIONS = {
+    "1h": (len("2023-02-22T16"), ":00:00"),
+    "1d": (len("2023-02-22"), "T00:00:00"),
+}
+ROLLUP_ATTRIBUTE_NAMES = {
+    "#station": "station",
+    "#bucket": "bucket",
+    "#count": "count",
+    "#battery_min": "battery_min",
+    "#battery_max": "battery_max",
+    "#battery_sum": "battery_sum",
+    "#battery_last": "battery_last",
+    "#panel_min": "panel_min",
+    "#panel_max": "panel_max",
+    "#panel_sum": "panel_sum",
+    "#panel_last": "panel_last",
+    "#last_date": "last_date",
+}
+ROLLUP_PROJECTION = ", ".join(
+    name for name in ROLLUP_ATTRIBUTE_NAMES if name not in ("#station", "#last_date")
+)
+
+
+def bucket_start(resolution: str, date: str) -> str:
+    """ Start of the bucket of the given resolution that contains a date.
+    """
+    length, suffix = RESOLUTIONS[resolution]
+    return date[:length] + suffix
+
+
+def bucket_key(resolution: str, date: str) -> str:
+    """ Sort key of the rollup of the given resolution that contains a date.
+    """
+    return f"{resolution}#{bucket_start(resolution, date)}"
+
+
+def query_rollups(
+        client,
+        table_name: str,
+        station: str,
+        resolution: str,
+        start_date: str = "",
+        end_date: str = ""
+) -> list[dict]:
+    """ Query the rollups of a station in a date range, oldest first.
+
+        The range includes the bucket that contains the start date. Returns
+        the items in DynamoDB JSON.
+    """
+    start = bucket_key(resolution, start_date) if start_date else f"{resolution}#"
+    # '$' sorts after '#' so the range covers every bucket of the resolution
+    end = f"{resolution}#{end_date}" if end_date else f"{resolution}$"
+    kwargs = {
+        "TableName": table_name,
+        "KeyConditionExpression": "#station = :station AND #bucket BETWEEN :start AND :end",
+        "ExpressionAttributeNames": {
+            name: attr for name, attr in ROLLUP_ATTRIBUTE_NAMES.items() if name != "#last_date"
+        },
+        "ExpressionAttributeValues": {
+            ":station": {"S": station},
+            ":start": {"S": start},
+            ":end": {"S": end},
+        },
+        "ProjectionExpression": ROLLUP_PROJECTION,
+        "ScanIndexForward": True,
+    }
+    items = []
+    while True:
+        ddb_res = client.query(**kwargs)
+        items.extend(ddb_res["Items"])
+        if "LastEvaluatedKey" not in ddb_res:
+            return items
+        kwargs["ExclusiveStartKey"] = ddb_res["LastEvaluatedKey"]
@@ -0,0 +1,47 @@
+from decimal import Decimal
+import json
+import os
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def decimal_to_number(obj: Any) -> int | float:
+    """ Encode the Decimals of the items read with boto3 resources.
+    """
+    if isinstance(obj, Decimal):
+        if obj == obj.to_integral_value():
+            return int(obj)
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def json_dumps(obj: Any) -> str:
+    return json.dumps(obj, default=decimal_to_number)
+
+
+def orjson_dumps(obj: Any) -> str:
+    return orjson.dumps(obj, default=decimal_to_number).decode()
+
+
+def get_serializer(backend: str = "auto") -> Callable[[Any], str]:
+    """ Returns the function used to serialize response bodies.
+
+        backend can be 'json', 'orjson' or 'auto', which uses orjson when it
+        is installed and the standard library otherwise.
+    """
+    if backend == "json":
+        return json_dumps
+    if backend == "orjson":
+        if orjson is None:
+            raise ValueError("orjson is not installed")
+        return orjson_dumps
+    if backend == "auto":
+        return json_dumps if orjson is None else orjson_dumps
+    raise ValueError(f"Invalid JSON backend {backend}")
+
+
+dumps = get_serializer(os.environ.get("JSON_BACKEND", "auto"))
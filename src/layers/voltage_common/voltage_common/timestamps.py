@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+import time
+
+# Format of the dates sent by the dataloggers, e.g. 2023/02/22,16:20:00
+SLASH_FORMAT = "%Y/%m/%d,%H:%M:%S"
+SLASH_LENGTH = len("2023/02/22,16:20:00")
+# Last day of each month, February of leap years is checked apart
+MONTH_DAYS = {
+    "01": "31", "02": "29", "03": "31", "04": "30", "05": "31", "06": "30",
+    "07": "31", "08": "31", "09": "30", "10": "31", "11": "30", "12": "31",
+}
+
+
+def is_leap_year(year: int) -> bool:
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def parse_slash(value: str) -> str:
+    """ Convert a date in the slash format of the dataloggers to the ISO
+        format of the stored reports, without going through strptime.
+
+        The fields have a fixed width, so once they are known to be ASCII
+        digits their ranges are checked comparing the strings.
+
+        Raises a ValueError if the date does not have the slash format or is
+        not a valid date.
+    """
+    if len(value) != SLASH_LENGTH or value[4] + value[7] + value[10] + value[13] + value[16] != "//,::":
+        raise ValueError(f"Date {value!r} does not match format {SLASH_FORMAT!r}")
+    year, month, day = value[0:4], value[5:7], value[8:10]
+    hour, minute, second = value[11:13], value[14:16], value[17:19]
+    # str.isdigit() would also accept non ASCII digits
+    digits = year + month + day + hour + minute + second
+    if not (digits.isascii() and digits.isdigit()):
+        raise ValueError(f"Date {value!r} does not match format {SLASH_FORMAT!r}")
+    if not (
+        year != "0000" and "01" <= month <= "12" and "01" <= day <= MONTH_DAYS[month]
+        and hour <= "23" and minute <= "59" and second <= "59"
+    ) or (month == "02" and day == "29" and not is_leap_year(int(year))):
+        raise ValueError(f"Date {value!r} is out of range")
+    return f"{year}-{month}-{day}T{value[11:19]}"
+
+
+def to_report_date(date: datetime) -> str:
+    """ ISO format of the stored reports: UTC without timezone, in seconds.
+    """
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date.replace(microsecond=0).isoformat()
+
+
+def parse_timestamp(value: str | int | float) -> str:
+    """ Convert the date of a report to the ISO format of the stored reports.
+
+        Accepts the slash format of the dataloggers, ISO 8601 dates, which are
+        converted to UTC if they have a timezone, and numbers of seconds since
+        the epoch. Fractions of seconds are dropped.
+
+        Raises a ValueError if the date is not in any of the formats.
+    """
+    if isinstance(value, str):
+        if len(value) == SLASH_LENGTH and value[4] == "/":
+            return parse_slash(value)
+        return to_report_date(datetime.fromisoformat(value))
+    # bool is a subclass of int
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            date = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(value))
+        except (OverflowError, OSError) as err:
+            raise ValueError(f"Invalid epoch timestamp {value}") from err
+        # Years past 9999 do not fit in the ISO format
+        if len(date) != SLASH_LENGTH:
+            raise ValueError(f"Invalid epoch timestamp {value}")
+        return date
+    raise ValueError(f"Invalid date {value!r}")
+
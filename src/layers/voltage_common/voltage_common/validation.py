@@ -0,0 +1,62 @@
+import functools
+import os
+import random
+import time
+from typing import Callable, Optional
+
+import fastjsonschema
+
+VALIDATION_MODES = ("full", "sampled", "off")
+
+
+def get_validation_mode() -> str:
+    """ The outbound validation mode from the OUTBOUND_VALIDATION env variable.
+
+        Defaults to sampled validation for production functions and to full
+        validation everywhere else, including the unit tests.
+    """
+    mode = os.environ.get("OUTBOUND_VALIDATION", "")
+    if not mode:
+        function_name = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "")
+        mode = "sampled" if "prod" in function_name else "full"
+    if mode not in VALIDATION_MODES:
+        raise ValueError(f"Invalid validation mode {mode}. Choose one of {VALIDATION_MODES}")
+    return mode
+
+
+def outbound_validator(
+        schema: dict,
+        mode: Optional[str] = None,
+        sample_rate: Optional[float] = None
+) -> Callable:
+    """ Decorator that validates the responses of a lambda handler.
+
+        The schema is compiled once, when the handler module is imported. In
+        sampled mode only a fraction sample_rate of the responses is
+        validated (OUTBOUND_VALIDATION_RATE env variable, 0.05 by default).
+
+        Raises fastjsonschema.JsonSchemaException if a response is not valid.
+    """
+    validate = fastjsonschema.compile(schema)
+    if mode is None:
+        mode = get_validation_mode()
+    if sample_rate is None:
+        sample_rate = float(os.environ.get("OUTBOUND_VALIDATION_RATE", "0.05"))
+
+    def decorator(handler: Callable) -> Callable:
+        if mode == "off":
+            return handler
+
+        @functools.wraps(handler)
+        def wrapper(event, context) -> dict:
+            response = handler(event, context)
+            if mode == "full" or random.random() < sample_rate:
+                start = time.perf_counter()
+                validate(response)
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f"Validated response in {elapsed:.3f} ms")
+            return response
+
+        return wrapper
+
+    return decorator
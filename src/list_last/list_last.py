@@ -1,57 +1,109 @@
-import os
-import json
+from __future__ import annotations
 
-from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
-from aws_lambda_powertools.utilities.typing import LambdaContext
-from aws_lambda_powertools.utilities.validation import validator
-import boto3
+from concurrent.futures import ThreadPoolExecutor
+import os
+from typing import TYPE_CHECKING
 
 try:
     from schema import OUTPUT_SCHEMA
+    from voltage_common.cache import TTLCache, log_cache_access
+    from voltage_common.conditional import (
+        cache_headers,
+        get_header,
+        is_not_modified,
+        make_etag,
+    )
+    from voltage_common.dynamodb import get_dynamodb_client
+    from voltage_common.reports import batch_get_reports, parse_stations, scan_reports
+    from voltage_common.responses import (
+        get_cors_origin,
+        respond,
+        respond_not_modified,
+        respond_serialized,
+    )
+    from voltage_common.serialization import dumps
+    from voltage_common.validation import outbound_validator
 except ModuleNotFoundError:
     from src.list_last.schema import OUTPUT_SCHEMA
+    from src.layers.voltage_common.voltage_common.cache import TTLCache, log_cache_access
+    from src.layers.voltage_common.voltage_common.conditional import (
+        cache_headers,
+        get_header,
+        is_not_modified,
+        make_etag,
+    )
+    from src.layers.voltage_common.voltage_common.dynamodb import get_dynamodb_client
+    from src.layers.voltage_common.voltage_common.reports import (
+        batch_get_reports,
+        parse_stations,
+        scan_reports,
+    )
+    from src.layers.voltage_common.voltage_common.responses import (
+        get_cors_origin,
+        respond,
+        respond_not_modified,
+        respond_serialized,
+    )
+    from src.layers.voltage_common.voltage_common.serialization import dumps
+    from src.layers.voltage_common.voltage_common.validation import outbound_validator
 
-
-def get_dynamodb_resource(t_name: str):
-    t_name = t_name.lower()
-    if "local" in t_name:
-        return boto3.resource('dynamodb', endpoint_url="http://dynamo-local:8000")
-    else:
-        return boto3.resource('dynamodb')
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+    from aws_lambda_powertools.utilities.typing import LambdaContext
 
 
 table_name = os.environ["LAST_REPORTS_TABLE"]
-dynamodb_resource = get_dynamodb_resource(table_name)
+# Stations report about every 12 hours, so responses can be reused by warm
+# containers for a while instead of reading DynamoDB on every request
+cache = TTLCache(
+    ttl=float(os.environ.get("CACHE_TTL", "60")),
+    max_size=int(os.environ.get("CACHE_MAX_SIZE", "128"))
+)
+# Number of segments of the table that are scanned in parallel
+scan_segments = int(os.environ.get("SCAN_SEGMENTS", "4"))
 
 
-def get_cors_origin(lambda_fn_name: str) -> str:
-    if "prod" in lambda_fn_name:
-        return "https://api.voltage.cires-ac.mx"
-    else:
-        return "*"
+def scan_last_reports(total_segments: int) -> list[dict]:
+    """ Scan the whole last reports table with a parallel scan.
 
+        Returns the reports sorted by station.
+    """
+    client = get_dynamodb_client(table_name)
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        segments = executor.map(
+            lambda segment: scan_reports(client, table_name, segment, total_segments),
+            range(total_segments)
+        )
+        reports = {rep["station"]: rep for seg in segments for rep in seg}
+    return [reports[station] for station in sorted(reports)]
 
-def respond(
-        status_code: int, body: list | dict | str,
-        cors_origin: str = "*"
-) -> dict:
-    """ A response in the format that API Gateway expects.
+
+def get_last_reports(stations: list[str]) -> tuple[dict[str, dict], list[str]]:
+    """ Get the last reports of the given stations.
+
+        Uses the cached reports of all stations when available, otherwise
+        looks the stations up with BatchGetItem.
     """
-    return {
-        "statusCode": status_code,
-        'headers': {
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Allow-Origin': cors_origin,
-            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-        },
-        "body": json.dumps(body)
-    }
-
-
-@validator(outbound_schema=OUTPUT_SCHEMA)
+    cached = cache.get("reports")
+    log_cache_access(cache, "reports", cached is not None)
+    if cached is not None:
+        reports = {rep["station"]: rep for rep in cached["reports"]}
+        return {st: reports[st] for st in stations if st in reports}, []
+
+    client = get_dynamodb_client(table_name)
+    return batch_get_reports(client, table_name, stations)
+
+
+@outbound_validator(OUTPUT_SCHEMA)
 def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
     """ Get the last reports of all stations
 
+    When the query string has a comma separated list of stations, only the
+    last reports of those stations are returned, as a map by station.
+
+    Responds 304 when the If-None-Match header shows the client already has
+    the reports.
+
     Parameters
     ----------
     event: dict, required
@@ -65,11 +117,41 @@ def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
     dict
     """
     cors_origin = get_cors_origin(context.function_name)
-    table = dynamodb_resource.Table(table_name)
-    response = table.scan()
-    reports = response["Items"]
-    for rep in reports:
-        rep["battery"] = float(rep["battery"])
-        rep["panel"] = float(rep["panel"])
-    print("Reports", reports)
-    return respond(200, {"reports": reports}, cors_origin)
+    accept_encoding = get_header(event, "Accept-Encoding") or ""
+    query_params = event.get("queryStringParameters") or {}
+    if query_params.get("stations"):
+        stations = parse_stations(query_params["stations"])
+        print(f"Requested last reports of stations {stations}")
+        reports, failed = get_last_reports(stations)
+        if failed:
+            print(f"Failed to get the last reports of {failed}")
+            return respond(
+                503,
+                {"message": f"Failed to get the last reports of {len(failed)} stations. Try again later"},
+                cors_origin
+            )
+        print("Reports", reports)
+        body = dumps({"reports": reports})
+        etag = make_etag(body)
+        headers = cache_headers(etag)
+        if is_not_modified(event, etag):
+            print("Last reports not modified")
+            return respond_not_modified(headers, cors_origin, accept_encoding)
+        return respond_serialized(200, body, cors_origin, headers, accept_encoding)
+
+    cached = cache.get("reports")
+    log_cache_access(cache, "reports", cached is not None)
+    if cached is None:
+        reports = scan_last_reports(scan_segments)
+        print("Reports", reports)
+        # The reports are sorted by station, so the same reports always have
+        # the same body and ETag
+        body = dumps({"reports": reports})
+        cached = {"reports": reports, "etag": make_etag(body), "body": body}
+        cache.put("reports", cached)
+
+    headers = cache_headers(cached["etag"])
+    if is_not_modified(event, cached["etag"]):
+        print("Last reports not modified")
+        return respond_not_modified(headers, cors_origin, accept_encoding)
+    return respond_serialized(200, cached["body"], cors_origin, headers, accept_encoding)
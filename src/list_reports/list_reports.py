@@ -1,59 +1,188 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
 import os
-import json
+from typing import TYPE_CHECKING, Optional
 from urllib.parse import unquote
 
-from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
-from aws_lambda_powertools.utilities.typing import LambdaContext
-from aws_lambda_powertools.utilities.validation import validator
-import boto3
-from boto3.dynamodb.conditions import Key
-
 try:
     from schema import OUTPUT_SCHEMA
+    from voltage_common.conditional import (
+        cache_headers,
+        get_header,
+        is_not_modified,
+        make_etag,
+    )
+    from voltage_common.cursors import decode_cursor, encode_cursor
+    from voltage_common.dynamodb import get_dynamodb_client
+    from voltage_common.reports import parse_stations, query_reports
+    from voltage_common.responses import (
+        get_cors_origin,
+        respond,
+        respond_not_modified,
+        respond_serialized,
+    )
+    from voltage_common.serialization import dumps
+    from voltage_common.validation import outbound_validator
 except ModuleNotFoundError:
     from src.list_reports.schema import OUTPUT_SCHEMA
+    from src.layers.voltage_common.voltage_common.conditional import (
+        cache_headers,
+        get_header,
+        is_not_modified,
+        make_etag,
+    )
+    from src.layers.voltage_common.voltage_common.cursors import decode_cursor, encode_cursor
+    from src.layers.voltage_common.voltage_common.dynamodb import get_dynamodb_client
+    from src.layers.voltage_common.voltage_common.reports import parse_stations, query_reports
+    from src.layers.voltage_common.voltage_common.responses import (
+        get_cors_origin,
+        respond,
+        respond_not_modified,
+        respond_serialized,
+    )
+    from src.layers.voltage_common.voltage_common.serialization import dumps
+    from src.layers.voltage_common.voltage_common.validation import outbound_validator
 
-
-def get_dynamodb_resource(t_name: str):
-    t_name = t_name.lower()
-    if "local" in t_name:
-        return boto3.resource('dynamodb', endpoint_url="http://dynamo-local:8000")
-    else:
-        return boto3.resource('dynamodb')
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+    from aws_lambda_powertools.utilities.typing import LambdaContext
 
 
 table_name = os.environ["REPORTS_TABLE"]
-dynamodb_resource = get_dynamodb_resource(table_name)
-table = dynamodb_resource.Table(table_name)
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 1000
+MAX_STATIONS = 50
+FORMATS = ("rows", "columnar")
+# Number of stations queried in parallel, bounded by the connection pool of the client
+query_workers = int(os.environ.get("QUERY_WORKERS", "8"))
+
+
+def query_stations(
+        stations: list[str],
+        start_date: str,
+        end_date: str,
+        start_keys: dict[str, dict[str, str]],
+        limit: int,
+        columnar: bool
+) -> dict[str, tuple[list[dict] | dict[str, list], Optional[dict[str, str]]]]:
+    """ Query a page of the reports of each station concurrently.
 
+        Returns the reports and the key to continue the query by station.
+    """
+    client = get_dynamodb_client(table_name)
+    with ThreadPoolExecutor(max_workers=min(query_workers, len(stations))) as executor:
+        pages = executor.map(
+            lambda station: query_reports(
+                client,
+                table_name,
+                station,
+                start_date,
+                end_date,
+                start_keys.get(station),
+                limit,
+                columnar
+            ),
+            stations
+        )
+        return dict(zip(stations, pages))
+
+
+def report_dates(reports: list[dict] | dict[str, list]) -> list[str]:
+    """ The dates of a page of reports in rows or in columns.
+    """
+    if isinstance(reports, dict):
+        return reports["date"]
+    return [rep["date"] for rep in reports]
 
-def get_cors_origin(lambda_fn_name: str) -> str:
-    if "prod" in lambda_fn_name:
-        return "https://api.voltage.cires-ac.mx"
-    else:
-        return "*"
 
+def respond_reports(event: dict, response: dict, cors_origin: str) -> dict:
+    """ Respond with a page of reports, or 304 if the client already has it.
 
-def respond(
-        status_code: int, body: list | dict | str,
-        cors_origin: str = "*"
+        The ETag is the hash of the body. There is no Last-Modified header, a
+        late or corrected report changes a page without changing the date of
+        its newest report. Large pages are compressed if the client accepts it.
+    """
+    body = dumps(response)
+    etag = make_etag(body)
+    headers = cache_headers(etag)
+    accept_encoding = get_header(event, "Accept-Encoding") or ""
+    if is_not_modified(event, etag):
+        print("Reports not modified")
+        return respond_not_modified(headers, cors_origin, accept_encoding)
+    return respond_serialized(200, body, cors_origin, headers, accept_encoding)
+
+
+def list_stations_reports(
+        event: dict,
+        stations: list[str],
+        start_date: str,
+        end_date: str,
+        next_keys: str,
+        limit: int,
+        response_format: str,
+        cors_origin: str
 ) -> dict:
-    """ A response in the format that API Gateway expects.
+    """ Respond with a page of the reports of several stations.
+
+        next_keys is a comma separated list of the cursors returned for the
+        stations whose reports did not fit in the previous page. With
+        next_keys only those stations are queried, the others were exhausted
+        and are left out of the page.
     """
-    return {
-        "statusCode": status_code,
-        'headers': {
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Allow-Origin': cors_origin,
-            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-        },
-        "body": json.dumps(body)
+    if len(stations) > MAX_STATIONS:
+        print(f"Requested {len(stations)} stations")
+        return respond(
+            400,
+            {"message": f"Can request up to {MAX_STATIONS} stations"},
+            cors_origin
+        )
+
+    start_keys = {}
+    for cursor in parse_stations(next_keys):
+        try:
+            key = decode_cursor(cursor)
+        except ValueError:
+            key = {}
+        if key.get("station") not in stations:
+            print(f"Invalid next key {cursor}")
+            return respond(400, {"message": "Invalid next_keys"}, cors_origin)
+        start_keys[key["station"]] = key
+
+    if start_keys:
+        stations = [station for station in stations if station in start_keys]
+    print(f"Requested reports for stations {stations}")
+    columnar = response_format == "columnar"
+    pages = query_stations(stations, start_date, end_date, start_keys, limit, columnar)
+    reports = {station: page[0] for station, page in pages.items()}
+    cursors = {
+        station: encode_cursor(page[1]) if page[1] is not None else None
+        for station, page in pages.items()
     }
+    n_reports = sum(len(report_dates(page)) for page in reports.values())
+    print(f"Returning {n_reports} reports of {len(reports)} stations")
+    return respond_reports(event, {"reports": reports, "nextKeys": cursors}, cors_origin)
 
 
-@validator(outbound_schema=OUTPUT_SCHEMA)
+@outbound_validator(OUTPUT_SCHEMA)
 def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext):
-    """ Get the reports of a station
+    """ Get the reports of a station, newest first
+
+    The reports are paginated. The query string accepts start_date and
+    end_date bounds, the limit of reports per page and the next_key cursor
+    returned by the previous page.
+
+    Without a station path parameter, the query string takes a comma separated
+    list of stations whose reports are queried concurrently. The response has
+    the reports and a cursor by station, and the cursors of the stations with
+    more reports are passed back in next_keys. The following pages only have
+    the stations of those cursors.
+
+    With format=columnar the reports of a station are returned as the lists
+    of their dates, battery and panel values instead of a list of reports.
+
+    Responds 304 when the If-None-Match header shows the client already has
+    the reports.
 
     Parameters
     ----------
@@ -69,63 +198,83 @@ def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext):
     """
     cors_origin = get_cors_origin(context.function_name)
     path_params = event.get("pathParameters")
+    query_params = event.get("queryStringParameters") or {}
     station = ""
     if path_params is not None:
         station: str = path_params.get("station", "")
         station = unquote(station)
 
-    if not path_params or not station:
+    stations = parse_stations(query_params.get("stations", ""))
+    if not station and not stations:
         print("Failed to get station path parameter")
         return respond(400, {"message": "Need to pass a station"})
 
-    print(f"Requested reports for station {station}")
+    start_date = query_params.get("start_date", "")
+    end_date = query_params.get("end_date", "")
+    next_key = query_params.get("next_key", "")
+    limit = query_params.get("limit", str(DEFAULT_PAGE_SIZE))
+    response_format = query_params.get("format", "rows")
 
-    start_date = ""
-    next_key = {}
-    if "queryStringParameters" in event and event["queryStringParameters"]:
-        start_date = event["queryStringParameters"].get("start_date", "")
-        next_key = event["queryStringParameters"].get("next_key", "")
-
-    if not start_date and not next_key:
-        ddb_res = table.query(
-            KeyConditionExpression=Key("station").eq(station),
-            ScanIndexForward=False
-        )
-    elif start_date and not next_key:
-        ddb_res = table.query(
-            KeyConditionExpression=Key("station").eq(station) & Key("date").gte(start_date),
-            ScanIndexForward=False
+    if not limit.isdigit() or not 0 < int(limit) <= MAX_PAGE_SIZE:
+        print(f"Invalid limit {limit}")
+        return respond(
+            400,
+            {"message": f"The limit must be an integer between 1 and {MAX_PAGE_SIZE}"},
+            cors_origin
         )
-    elif not start_date and not next_key:
-        ddb_res = table.query(
-            KeyConditionExpression=Key("station").eq(station),
-            ScanIndexForward=False,
-            ExclusiveStartKey=next_key
+
+    if response_format not in FORMATS:
+        print(f"Invalid format {response_format}")
+        return respond(
+            400,
+            {"message": f"The format must be one of {', '.join(FORMATS)}"},
+            cors_origin
         )
-    else:
-        ddb_res = table.query(
-            KeyConditionExpression=Key("station").eq(station) & Key("date").gte(start_date),
-            ScanIndexForward=False,
-            ExclusiveStartKey=next_key
+
+    if not station:
+        return list_stations_reports(
+            event,
+            stations,
+            start_date,
+            end_date,
+            query_params.get("next_keys", ""),
+            int(limit),
+            response_format,
+            cors_origin
         )
 
-    reports = ddb_res["Items"]
-    if not reports:
+    print(f"Requested reports for station {station}")
+    exclusive_start_key = None
+    if next_key:
+        try:
+            exclusive_start_key = decode_cursor(next_key)
+        except ValueError:
+            exclusive_start_key = {}
+        if exclusive_start_key.get("station") != station:
+            print(f"Invalid next key {next_key}")
+            return respond(400, {"message": "Invalid next_key"}, cors_origin)
+
+    client = get_dynamodb_client(table_name)
+    reports, last_key = query_reports(
+        client,
+        table_name,
+        station,
+        start_date,
+        end_date,
+        exclusive_start_key,
+        int(limit),
+        response_format == "columnar"
+    )
+    # The last page can be empty when the previous one ended with the last report
+    if not report_dates(reports) and exclusive_start_key is None:
         print(f"Did not find reports for station {station}")
         return respond(
             404,
             {"message": f"Station '{station}' not found"},
             cors_origin
         )
-    print("Reports", reports)
-
-    for rep in reports:
-        rep["battery"] = float(rep["battery"])
-        rep["panel"] = float(rep["panel"])
-
-    next_key = None
-    if "LastEvaluatedKey" in ddb_res:
-        next_key = ddb_res["LastEvaluatedKey"]
+    print(f"Returning {len(report_dates(reports))} reports of station {station}")
 
+    next_key = encode_cursor(last_key) if last_key is not None else None
     response = {"reports": reports, "nextKey": next_key}
-    return respond(200, response, cors_origin)
+    return respond_reports(event, response, cors_origin)
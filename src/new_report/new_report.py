@@ -1,58 +1,371 @@
-from datetime import datetime
-from decimal import Decimal
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
 import os
 import json
+import time
+from typing import TYPE_CHECKING, Optional
 from urllib.parse import unquote
 
-from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
-from aws_lambda_powertools.utilities.typing import LambdaContext
-from aws_lambda_powertools.utilities.validation import validator
-import boto3
+from botocore.exceptions import ClientError
 
 try:
     from schema import OUTPUT_SCHEMA
+    from voltage_common.compression import get_body
+    from voltage_common.dynamodb import get_dynamodb_resource, get_table
+    from voltage_common.metrics import emit_metric
+    from voltage_common.reports import FLEET_PARTITION, LOW_BATTERY_ALERT
+    from voltage_common.responses import get_cors_origin, respond
+    from voltage_common.timestamps import parse_timestamp
+    from voltage_common.validation import outbound_validator
 except ModuleNotFoundError:
     from src.new_report.schema import OUTPUT_SCHEMA
+    from src.layers.voltage_common.voltage_common.compression import get_body
+    from src.layers.voltage_common.voltage_common.dynamodb import get_dynamodb_resource, get_table
+    from src.layers.voltage_common.voltage_common.metrics import emit_metric
+    from src.layers.voltage_common.voltage_common.reports import FLEET_PARTITION, LOW_BATTERY_ALERT
+    from src.layers.voltage_common.voltage_common.responses import get_cors_origin, respond
+    from src.layers.voltage_common.voltage_common.timestamps import parse_timestamp
+    from src.layers.voltage_common.voltage_common.validation import outbound_validator
 
-
-def get_dynamodb_resource(t_name: str):
-    t_name = t_name.lower()
-    if "local" in t_name:
-        return boto3.resource('dynamodb', endpoint_url="http://dynamo-local:8000")
-    else:
-        return boto3.resource('dynamodb')
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+    from aws_lambda_powertools.utilities.typing import LambdaContext
 
 
 reports_tb_name = os.environ["REPORTS_TABLE"]
 last_reports_tb_name = os.environ["LAST_REPORTS_TABLE"]
-dynamodb_resource = get_dynamodb_resource(reports_tb_name)
+report_counts_tb_name = os.environ["REPORT_COUNTS_TABLE"]
+
+# A gateway may upload a backlog of a few days of readings after a comms outage
+MAX_BATCH_REPORTS = 5000
+# Maximum number of items DynamoDB accepts in a single BatchWriteItem and
+# BatchGetItem call
+BATCH_WRITE_SIZE = 25
+BATCH_GET_SIZE = 100
+MAX_BATCH_RETRIES = 5
+RETRY_BACKOFF = 0.05  # seconds
+
+# A station raises a low battery alert when its battery drops below the
+# threshold, which is cleared once the battery recovers to the threshold plus
+# the hysteresis, so a battery around the threshold does not flap the alert
+low_battery_threshold = Decimal(os.environ.get("LOW_BATTERY_THRESHOLD", "10"))
+alert_hysteresis = Decimal(os.environ.get("ALERT_HYSTERESIS", "0.5"))
+# Thresholds of specific stations as a JSON object, e.g.
+# {"Caracol": {"threshold": 11.5, "hysteresis": 1}}
+station_alert_thresholds: dict = json.loads(os.environ.get("STATION_ALERT_THRESHOLDS", "{}"))
+# Reports older than the last report of their station skipped by this container
+skipped_late_reports = 0
+
+# How lambda_handler writes a report and the last report of its station:
+# sequential issues one request after the other, transaction writes them
+# atomically in a single TransactWriteItems round trip and concurrent sends
+# both requests at the same time
+INGEST_WRITE_MODES = ("sequential", "transaction", "concurrent")
+ingest_write_mode = os.environ.get("INGEST_WRITE_MODE", "sequential")
+if ingest_write_mode not in INGEST_WRITE_MODES:
+    raise ValueError(f"INGEST_WRITE_MODE must be one of {', '.join(INGEST_WRITE_MODES)}")
+# Kept between invocations, so the threads are only started once per container
+ingest_executor = ThreadPoolExecutor(max_workers=2)
+
+
+def is_complete_report(report: dict) -> bool:
+    return "station" in report and "date" in report \
+        and "panel" in report and "battery" in report
 
 
-def get_cors_origin(lambda_fn_name: str) -> str:
-    if "prod" in lambda_fn_name:
-        return "https://api.voltage.cires-ac.mx"
+def parse_report(report: dict) -> dict:
+    """ Convert a report from the request body into a DynamoDB item.
+
+        Raises a ValueError if the date is not in any of the accepted formats,
+        an InvalidOperation if the battery or panel are not numbers and a
+        TypeError if the station is not a string.
+    """
+    if not isinstance(report["station"], str):
+        raise TypeError(f"Invalid station {report['station']!r}")
+    return {
+        "station": unquote(report["station"]),
+        "date": parse_timestamp(report["date"]),
+        "battery": Decimal(str(report["battery"])),
+        "panel": Decimal(str(report["panel"])),
+    }
+
+
+def get_alert_thresholds(station: str) -> tuple[Decimal, Decimal]:
+    """ The low battery threshold and the hysteresis of a station.
+    """
+    config = station_alert_thresholds.get(station, {})
+    threshold = Decimal(str(config.get("threshold", low_battery_threshold)))
+    hysteresis = Decimal(str(config.get("hysteresis", alert_hysteresis)))
+    return threshold, hysteresis
+
+
+def last_report_update(item: dict) -> dict:
+    """ Arguments of the update that sets the last report of a station and
+        evaluates its low battery alert.
+
+        The update is conditional on the report being newer than the stored
+        one, so late arrivals do not overwrite it. When the condition fails
+        the stored last report is returned, which tells a late report from
+        one sent again.
+
+        The alert attributes are only set on stations with an active alert,
+        so the alerts index holds just those. The fleet attribute puts every
+        station in the index of the last reports ordered by date.
+    """
+    update_expression = "SET #date=:newDate, #battery =:newBattery, #panel =:newPanel, #fleet =:fleet"
+    attribute_values = {
+        ":newDate": item["date"],
+        ":newBattery": item["battery"],
+        ":newPanel": item["panel"],
+        ":fleet": FLEET_PARTITION
+    }
+    attribute_names = {
+        "#date": "date",
+        "#battery": "battery",
+        "#panel": "panel",
+        "#fleet": "fleet"
+    }
+    threshold, hysteresis = get_alert_thresholds(item["station"])
+    if item["battery"] < threshold:
+        # Keep the date of the report that raised the alert
+        update_expression += ", #alert = :alert, #alertSince = if_not_exists(#alertSince, :newDate)"
+        attribute_values[":alert"] = LOW_BATTERY_ALERT
+        attribute_names.update({"#alert": "alert", "#alertSince": "alert_since"})
+    elif item["battery"] >= threshold + hysteresis:
+        update_expression += " REMOVE #alert, #alertSince"
+        attribute_names.update({"#alert": "alert", "#alertSince": "alert_since"})
+
+    return {
+        "Key": {"station": item["station"]},
+        "UpdateExpression": update_expression,
+        "ConditionExpression": "attribute_not_exists(#date) OR #date < :newDate",
+        "ExpressionAttributeValues": attribute_values,
+        "ExpressionAttributeNames": attribute_names,
+        "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+    }
+
+
+def is_late_report(last_reports_tb, item: dict, stored: Optional[dict]) -> bool:
+    """ Whether a report that did not update the last report of its station
+        is older than it. A report sent again has the same date and is not
+        late.
+
+        stored is the last report returned by the failed condition, in
+        DynamoDB JSON. Emulators such as moto do not return it, then its date
+        is read.
+    """
+    if stored is None:
+        ddb_res = last_reports_tb.get_item(
+            Key={"station": item["station"]},
+            ProjectionExpression="#date",
+            ExpressionAttributeNames={"#date": "date"},
+            ConsistentRead=True,
+        )
+        stored_date = ddb_res.get("Item", {}).get("date")
     else:
-        return "*"
+        stored_date = stored["date"]["S"]
+    return stored_date != item["date"]
+
+
+def update_last_report(last_reports_tb, item: dict) -> bool:
+    """ Set the last report of a station if the report is newer than the
+        stored one. Returns whether the report is late, older than the
+        stored one.
+    """
+    try:
+        last_reports_tb.update_item(**last_report_update(item))
+    except ClientError as err:
+        if err.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return is_late_report(last_reports_tb, item, err.response.get("Item"))
+        raise
+    return False
+
+
+def count_late_reports(skipped: int, context: LambdaContext) -> None:
+    """ Log the late reports that did not update the last reports. The
+        reports sent again are not counted.
+    """
+    global skipped_late_reports
+    if not skipped:
+        return
+    skipped_late_reports += skipped
+    print(f"Skipped {skipped} late reports. Total in this container: {skipped_late_reports}")
+    emit_metric("SkippedLateReports", skipped, function=context.function_name)
 
 
-def respond(
-        status_code: int, body: list | dict | str,
-        cors_origin: str = "*"
-) -> dict:
-    """ A response in the format that API Gateway expects.
+def report_count_update(station: str, date: str, count: int = 1) -> dict:
+    """ Arguments of the update that adds to the number of reports of the
+        station in the day of the given date.
     """
     return {
-        "statusCode": status_code,
-        'headers': {
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Allow-Origin': cors_origin,
-            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-        },
-        "body": json.dumps(body)
+        "Key": {"station": station, "day": date[:10]},
+        "UpdateExpression": "ADD #count :count",
+        "ExpressionAttributeValues": {":count": count},
+        "ExpressionAttributeNames": {"#count": "count"},
+    }
+
+
+def increment_report_count(
+        report_counts_tb, station: str, date: str, count: int = 1
+) -> None:
+    """ Atomically add to the number of reports of the station in the day
+        of the given date.
+    """
+    report_counts_tb.update_item(**report_count_update(station, date, count))
+
+
+def write_report_sequential(item: dict) -> bool:
+    """ Write a report, then the last report of its station and the report
+        count, one request after the other.
+
+        Returns whether the report is late.
+    """
+    ddb_res = get_table(reports_tb_name).put_item(Item=item, ReturnValues="ALL_OLD")
+    late = update_last_report(get_table(last_reports_tb_name), item)
+    # A report sent again must not be counted twice
+    if not ddb_res.get("Attributes"):
+        increment_report_count(get_table(report_counts_tb_name), item["station"], item["date"])
+    return late
+
+
+def write_report_concurrent(item: dict) -> bool:
+    """ Write a report and the last report of its station at the same time,
+        then the report count once the put tells whether the report is new.
+
+        Each table object is used by a single thread, the client under them
+        is thread safe. Returns whether the report is late.
+    """
+    put = ingest_executor.submit(
+        get_table(reports_tb_name).put_item, Item=item, ReturnValues="ALL_OLD")
+    update = ingest_executor.submit(update_last_report, get_table(last_reports_tb_name), item)
+    if not put.result().get("Attributes"):
+        increment_report_count(get_table(report_counts_tb_name), item["station"], item["date"])
+    return update.result()
+
+
+def write_report_transaction(item: dict) -> bool:
+    """ Write a report, the last report of its station and the report count
+        atomically with TransactWriteItems.
+
+        A failed condition cancels the whole transaction, so the conditions
+        can not just skip their write as in the other modes. The put of the
+        report is conditional on the report being new, and when DynamoDB
+        cancels the transaction because of a report sent again or a late
+        report, it is retried without the count or the last report update.
+        Returns whether the report is late.
+    """
+    # The client of the resource takes the items as Python values
+    client = get_dynamodb_resource(reports_tb_name).meta.client
+    last_report = {"TableName": last_reports_tb_name, **last_report_update(item)}
+    report_count = {
+        "TableName": report_counts_tb_name,
+        **report_count_update(item["station"], item["date"]),
     }
+    is_new = True
+    updated = True
+    late = False
+    # Each retry drops a write whose condition failed, so there are at most two
+    for _ in range(3):
+        put = {"TableName": reports_tb_name, "Item": item}
+        if is_new:
+            put["ConditionExpression"] = "attribute_not_exists(#date)"
+            put["ExpressionAttributeNames"] = {"#date": "date"}
+        transact_items = [{"Put": put}]
+        if updated:
+            transact_items.append({"Update": last_report})
+        if is_new:
+            transact_items.append({"Update": report_count})
+        try:
+            client.transact_write_items(TransactItems=transact_items)
+            return late
+        except ClientError as err:
+            if err.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            # The reasons are in the same order as the items of the transaction
+            cancellation_reasons = err.response.get("CancellationReasons", [])
+            reasons = [reason.get("Code") for reason in cancellation_reasons]
+            if "ConditionalCheckFailed" not in reasons:
+                raise
+            if reasons[0] == "ConditionalCheckFailed":
+                is_new = False
+            if updated and reasons[1] == "ConditionalCheckFailed":
+                updated = False
+                late = is_late_report(
+                    get_table(last_reports_tb_name), item, cancellation_reasons[1].get("Item"))
+    raise RuntimeError(f"Failed to write report of {item['date']} of {item['station']}")
+
+
+def get_stored_reports(items: list[dict]) -> Optional[set[tuple[str, str]]]:
+    """ Keys of the reports already in the reports table, read in chunks of
+        100 keys.
+
+        Unprocessed keys are retried with exponential backoff. Returns None if
+        some keys could not be read, as then it is not known which reports
+        are new.
+    """
+    dynamodb_resource = get_dynamodb_resource(reports_tb_name)
+    stored = set()
+    for ii in range(0, len(items), BATCH_GET_SIZE):
+        request_items = {
+            reports_tb_name: {
+                "Keys": [
+                    {"station": item["station"], "date": item["date"]}
+                    for item in items[ii:ii + BATCH_GET_SIZE]
+                ],
+                "ProjectionExpression": "#station, #date",
+                "ExpressionAttributeNames": {"#station": "station", "#date": "date"},
+            }
+        }
+        for attempt in range(MAX_BATCH_RETRIES + 1):
+            if attempt > 0:
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            ddb_res = dynamodb_resource.batch_get_item(RequestItems=request_items)
+            stored.update(
+                (it["station"], it["date"]) for it in ddb_res["Responses"].get(reports_tb_name, [])
+            )
+            request_items = ddb_res.get("UnprocessedKeys", {})
+            if not request_items:
+                break
+        if request_items:
+            return None
+    return stored
 
 
-@validator(outbound_schema=OUTPUT_SCHEMA)
+def batch_write_reports(items: list[dict]) -> list[dict]:
+    """ Write the reports to the reports table in chunks of 25 items.
+
+        Unprocessed items are retried with exponential backoff. Returns the
+        items that could not be written.
+    """
+    dynamodb_resource = get_dynamodb_resource(reports_tb_name)
+    failed = []
+    for ii in range(0, len(items), BATCH_WRITE_SIZE):
+        request_items = {
+            reports_tb_name: [
+                {"PutRequest": {"Item": item}} for item in items[ii:ii + BATCH_WRITE_SIZE]
+            ]
+        }
+        for attempt in range(MAX_BATCH_RETRIES + 1):
+            if attempt > 0:
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            ddb_res = dynamodb_resource.batch_write_item(RequestItems=request_items)
+            request_items = ddb_res.get("UnprocessedItems", {})
+            if not request_items:
+                break
+        failed.extend(req["PutRequest"]["Item"] for req in request_items.get(reports_tb_name, []))
+    return failed
+
+
+INGEST_WRITERS = {
+    "sequential": write_report_sequential,
+    "transaction": write_report_transaction,
+    "concurrent": write_report_concurrent,
+}
+
+
+@outbound_validator(OUTPUT_SCHEMA)
 def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
     """ Add a new report
 
@@ -69,18 +382,15 @@ def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
         dict
     """
     cors_origin = get_cors_origin(context.function_name)
-    reports_tb = dynamodb_resource.Table(reports_tb_name)
-    last_reports_tb = dynamodb_resource.Table(last_reports_tb_name)
 
-    body_str = event.get("body", "")
+    body_str = get_body(event)
     if not body_str:
         print("Failed to add new report. Event did not contain body")
         return respond(
             400, {"message": "Need to pass the body with the new report parameters"})
 
     body: dict = json.loads(body_str)
-    if "station" not in body or "date" not in body \
-            or "panel" not in body or "battery" not in body:
+    if not is_complete_report(body):
         print(f"Failed to add new report. Incomplete event body {body}")
         return respond(
             400,
@@ -88,38 +398,133 @@ def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
             cors_origin
         )
 
-    date = datetime.strptime(body["date"], "%Y/%m/%d,%H:%M:%S").isoformat()
-    station = body["station"]
-    station = unquote(station)
-    battery = Decimal(body["battery"])
-    panel = Decimal(body["panel"])
-
-    reports_tb.put_item(
-        Item={
-            "station": station,
-            "date": date,
-            "battery": battery,
-            "panel": panel
-        }
-    )
-    last_reports_tb.update_item(
-        Key={"station": station},
-        UpdateExpression="SET #date=:newDate, #battery =:newBattery, #panel =:newPanel",
-        ExpressionAttributeValues={
-            ":newDate": date,
-            ":newBattery": battery,
-            ":newPanel": panel
-        },
-        ExpressionAttributeNames={
-            "#date": "date",
-            "#battery": "battery",
-            "#panel": "panel"
-        }
-    )
+    try:
+        item = parse_report(body)
+    except ValueError as err:
+        print(f"Failed to add new report. {err}")
+        return respond(400, {"message": "Invalid report date"}, cors_origin)
+    except (InvalidOperation, TypeError) as err:
+        print(f"Failed to add new report. Invalid values {err!r}")
+        return respond(400, {"message": "Invalid report values"}, cors_origin)
+
+    if INGEST_WRITERS[ingest_write_mode](item):
+        print(f"Report of {item['date']} is older than the last report of {item['station']}")
+        count_late_reports(1, context)
     res_body = {
-        "station": station,
-        "date": date,
+        "station": item["station"],
+        "date": item["date"],
         "battery": body["battery"],
         "panel": body["panel"]
     }
     return respond(201, res_body, cors_origin)
+
+
+@outbound_validator(OUTPUT_SCHEMA)
+def batch_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
+    """ Add a batch of reports
+
+        The reports are written to the reports table with BatchWriteItem. The
+        last reports table is updated once per station with the newest report
+        of the batch and the report counts once per station and day.
+
+        Only the reports that were not stored yet are counted, so that a batch
+        sent again, as the gateways do after a 503, is not counted twice.
+
+        Parameters
+        ----------
+        event: dict, required
+            API Gateway Lambda Proxy Input Format
+
+        context: object, required
+            Lambda Context runtime methods and attributes
+
+        Returns
+        ------
+        dict
+    """
+    cors_origin = get_cors_origin(context.function_name)
+    last_reports_tb = get_table(last_reports_tb_name)
+    report_counts_tb = get_table(report_counts_tb_name)
+
+    body_str = get_body(event)
+    if not body_str:
+        print("Failed to add reports batch. Event did not contain body")
+        return respond(
+            400, {"message": "Need to pass the body with the new reports"}, cors_origin)
+
+    body = json.loads(body_str)
+    reports = body.get("reports") if isinstance(body, dict) else None
+    if not reports or not isinstance(reports, list):
+        print(f"Failed to add reports batch. Invalid event body {body}")
+        return respond(
+            400, {"message": "The body must include a non empty list of reports"}, cors_origin)
+
+    if len(reports) > MAX_BATCH_REPORTS:
+        print(f"Failed to add reports batch. Received {len(reports)} reports")
+        return respond(
+            400,
+            {"message": f"A batch can contain at most {MAX_BATCH_REPORTS} reports"},
+            cors_origin
+        )
+
+    if not all(isinstance(rep, dict) and is_complete_report(rep) for rep in reports):
+        print("Failed to add reports batch. Incomplete reports")
+        return respond(
+            400,
+            {"message": "Every report must include station, date, report and panel attributes"},
+            cors_origin
+        )
+
+    try:
+        items = [parse_report(rep) for rep in reports]
+    except ValueError as err:
+        print(f"Failed to add reports batch. {err}")
+        return respond(400, {"message": "Invalid report date"}, cors_origin)
+    except (InvalidOperation, TypeError) as err:
+        print(f"Failed to add reports batch. Invalid values {err!r}")
+        return respond(400, {"message": "Invalid report values"}, cors_origin)
+
+    # BatchWriteItem rejects requests with duplicate keys, keep the last one
+    unique_items = list({(it["station"], it["date"]): it for it in items}.values())
+    stored = get_stored_reports(unique_items)
+    if stored is None:
+        print(f"Failed to read the stored reports after {MAX_BATCH_RETRIES} retries")
+        return respond(503, {"message": "Failed to add the reports. Try again later"}, cors_origin)
+
+    print(f"Adding {len(unique_items)} reports, {len(stored)} already stored")
+    failed = batch_write_reports(unique_items)
+    failed_keys = {(it["station"], it["date"]) for it in failed}
+
+    # The new reports written before a failure are counted too, the retry of
+    # the batch will find them stored
+    day_counts: dict[tuple[str, str], int] = {}
+    for item in unique_items:
+        key = (item["station"], item["date"])
+        if key not in stored and key not in failed_keys:
+            day = (item["station"], item["date"][:10])
+            day_counts[day] = day_counts.get(day, 0) + 1
+    for (station, day), count in day_counts.items():
+        increment_report_count(report_counts_tb, station, day, count)
+
+    if failed:
+        print(f"Failed to write {len(failed)} reports after {MAX_BATCH_RETRIES} retries")
+        return respond(
+            503,
+            {"message": f"Failed to add {len(failed)} of {len(unique_items)} reports. Try again later"},
+            cors_origin
+        )
+
+    newest: dict[str, dict] = {}
+    for item in unique_items:
+        station = item["station"]
+        if station not in newest or item["date"] > newest[station]["date"]:
+            newest[station] = item
+
+    late = sum(update_last_report(last_reports_tb, item) for item in newest.values())
+    count_late_reports(late, context)
+
+    res_body = {
+        "reports": len(unique_items),
+        "stations": sorted(newest),
+    }
+    return respond(201, res_body, cors_origin)
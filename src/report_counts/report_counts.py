@@ -1,60 +1,96 @@
-import datetime
+from __future__ import annotations
+
 import os
-import json
+from typing import TYPE_CHECKING, Iterator
 from urllib.parse import unquote
 
-from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
-from aws_lambda_powertools.utilities.typing import LambdaContext
-from aws_lambda_powertools.utilities.validation import validator
-import boto3
 from boto3.dynamodb.conditions import Key
 
 try:
     from schema import OUTPUT_SCHEMA
+    from voltage_common.conditional import (
+        cache_headers,
+        get_header,
+        is_not_modified,
+        make_etag,
+    )
+    from voltage_common.dynamodb import get_table
+    from voltage_common.responses import get_cors_origin, respond, respond_not_modified
+    from voltage_common.validation import outbound_validator
 except ModuleNotFoundError:
     from src.report_counts.schema import OUTPUT_SCHEMA
+    from src.layers.voltage_common.voltage_common.conditional import (
+        cache_headers,
+        get_header,
+        is_not_modified,
+        make_etag,
+    )
+    from src.layers.voltage_common.voltage_common.dynamodb import get_table
+    from src.layers.voltage_common.voltage_common.responses import (
+        get_cors_origin,
+        respond,
+        respond_not_modified,
+    )
+    from src.layers.voltage_common.voltage_common.validation import outbound_validator
 
-
-def get_dynamodb_resource(t_name: str):
-    t_name = t_name.lower()
-    if "local" in t_name:
-        return boto3.resource('dynamodb', endpoint_url="http://dynamo-local:8000")
-    else:
-        return boto3.resource('dynamodb')
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+    from aws_lambda_powertools.utilities.typing import LambdaContext
 
 
-table_name = os.environ["REPORTS_TABLE"]
-dynamodb_resource = get_dynamodb_resource(table_name)
+table_name = os.environ["REPORT_COUNTS_TABLE"]
 
 
-def get_cors_origin(lambda_fn_name: str) -> str:
-    if "prod" in lambda_fn_name:
-        return "https://api.voltage.cires-ac.mx"
-    else:
-        return "*"
+def key_condition(station: str, sort_key: str, start: str, end: str):
+    """ Key condition for the items of a station with the sort key
+        between the given bounds. Empty bounds are ignored.
+    """
+    condition = Key("station").eq(station)
+    if start and end:
+        condition &= Key(sort_key).between(start, end)
+    elif start:
+        condition &= Key(sort_key).gte(start)
+    elif end:
+        condition &= Key(sort_key).lte(end)
+    return condition
+
+
+def query_items(table, **kwargs) -> Iterator[dict]:
+    """ Yields the items of every page of a query following LastEvaluatedKey.
+    """
+    while True:
+        ddb_res = table.query(**kwargs)
+        yield from ddb_res["Items"]
+        if "LastEvaluatedKey" not in ddb_res:
+            return
+        kwargs["ExclusiveStartKey"] = ddb_res["LastEvaluatedKey"]
 
 
-def respond(
-        status_code: int, body: list | dict | str,
-        cors_origin: str = "*"
-) -> dict:
-    """ A response in the format that API Gateway expects.
+def daily_counts(table, station: str, start_day: str, end_day: str) -> list[dict]:
+    """ Get the number of reports per day from the report counts table.
     """
-    return {
-        "statusCode": status_code,
-        'headers': {
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Allow-Origin': cors_origin,
-            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-        },
-        "body": json.dumps(body)
-    }
-
-
-@validator(outbound_schema=OUTPUT_SCHEMA)
+    items = query_items(
+        table,
+        KeyConditionExpression=key_condition(station, "day", start_day, end_day),
+        ProjectionExpression="#day, #count",
+        ExpressionAttributeNames={"#day": "day", "#count": "count"},
+        ScanIndexForward=False
+    )
+    return [{"count": it["count"], "date": it["day"]} for it in items]
+
+
+@outbound_validator(OUTPUT_SCHEMA)
 def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
     """ Get the number of reports per date of a given station
 
+    The counts are read from the report counts table alone, which the
+    backfill-counts command of populate_dynamo fills for the reports written
+    before it.
+
+    Responds 304 when the If-None-Match header shows the client already has
+    the counts. The counts of a day change during the day, so they have no
+    Last-Modified date.
+
     Parameters
     ----------
     event: dict, required
@@ -68,7 +104,7 @@ def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
     API Gateway Lambda Proxy Output Format: dict
     """
     cors_origin = get_cors_origin(context.function_name)
-    table = dynamodb_resource.Table(table_name)
+    table = get_table(table_name)
     path_params = event.get("pathParameters")
     station = ""
     if path_params is not None:
@@ -79,13 +115,18 @@ def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
         print("Failed to get station path parameter")
         return respond(400, {"message": "Need to pass a station"})
 
+    start_date = ""
+    end_date = ""
+    if "queryStringParameters" in event and event["queryStringParameters"]:
+        start_date = event["queryStringParameters"].get("start_date", "")
+        end_date = event["queryStringParameters"].get("end_date", "")
+
     print(f"Requested report counts for station {station}")
-    ddb_response = table.query(
-        KeyConditionExpression=Key("station").eq(station),
-        ScanIndexForward=False
-    )
-    reports = ddb_response["Items"]
-    if not reports:
+    # Counts are stored per day, so only the date part of the bounds is used
+    start_day = start_date[:10]
+    end_day = end_date[:10]
+    counts = daily_counts(table, station, start_day, end_day)
+    if not counts:
         print(f"Did not find reports for station {station}")
         return respond(
             404,
@@ -93,19 +134,11 @@ def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
             cors_origin
         )
 
-    print("Reports", reports)
-    counts = {}
-    for rep in reports:
-        date = datetime.datetime.fromisoformat(rep["date"]).date()
-        date_str = date.isoformat()
-        counts[date_str] = counts.get(date_str, 0) + 1
-
-    response = []
-    for date, cnt in counts.items():
-        response.append({"count": cnt, "date": date})
-
-    return respond(
-        200,
-        {"reports": response},
-        cors_origin
-    )
+    print("Report counts", counts)
+    etag = make_etag(*(f"{it['date']}:{it['count']}" for it in counts))
+    headers = cache_headers(etag)
+    accept_encoding = get_header(event, "Accept-Encoding") or ""
+    if is_not_modified(event, etag):
+        print(f"Report counts of station {station} not modified")
+        return respond_not_modified(headers, cors_origin, accept_encoding)
+    return respond(200, {"reports": counts}, cors_origin, headers, accept_encoding)
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import os
+from typing import TYPE_CHECKING
+
+from botocore.exceptions import ClientError
+
+try:
+    from voltage_common.dynamodb import get_dynamodb_client
+    from voltage_common.reports import serialize_key
+    from voltage_common.rollups import RESOLUTIONS, bucket_key
+except ModuleNotFoundError:
+    from src.layers.voltage_common.voltage_common.dynamodb import get_dynamodb_client
+    from src.layers.voltage_common.voltage_common.reports import serialize_key
+    from src.layers.voltage_common.voltage_common.rollups import RESOLUTIONS, bucket_key
+
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.data_classes import DynamoDBStreamEvent
+    from aws_lambda_powertools.utilities.typing import LambdaContext
+
+
+rollups_table_name = os.environ["ROLLUPS_TABLE"]
+# Number of rollups updated in parallel
+rollup_workers = int(os.environ.get("ROLLUP_WORKERS", "8"))
+VALUES = ("battery", "panel")
+# Stream sequence numbers have up to 40 digits, they are padded so that they
+# compare as strings, which hold more digits than DynamoDB numbers
+SEQUENCE_DIGITS = 40
+# A rollup updated by another invocation between the read and the write of
+# apply_rollup is read again
+MAX_UPDATE_ATTEMPTS = 5
+
+
+def aggregate_records(records: list[dict]) -> dict[tuple[str, str], dict]:
+    """ Combine the new reports of a batch of stream records into the partial
+        rollups of every resolution, keyed by station and bucket.
+
+        Only inserted reports are aggregated. Rollups can not subtract a
+        replaced or deleted report from their min and max. Each rollup keeps
+        the sequence number of its newest record, which tells whether it was
+        already applied when the stream retries the batch.
+    """
+    rollups = {}
+    for record in records:
+        if record["eventName"] != "INSERT":
+            print(f"Skipping {record['eventName']} record {record['eventID']}")
+            continue
+
+        image = record["dynamodb"]["NewImage"]
+        station = image["station"]["S"]
+        date = image["date"]["S"]
+        sequence = record["dynamodb"]["SequenceNumber"].zfill(SEQUENCE_DIGITS)
+        values = {name: Decimal(image[name]["N"]) for name in VALUES}
+        for resolution in RESOLUTIONS:
+            key = (station, bucket_key(resolution, date))
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = {"count": 0, "last_date": date, "sequence": sequence}
+                for name, value in values.items():
+                    rollup.update({
+                        f"{name}_min": value,
+                        f"{name}_max": value,
+                        f"{name}_sum": Decimal(0),
+                        f"{name}_last": value,
+                    })
+                rollups[key] = rollup
+
+            rollup["count"] += 1
+            rollup["sequence"] = max(rollup["sequence"], sequence)
+            is_last = date >= rollup["last_date"]
+            if is_last:
+                rollup["last_date"] = date
+            for name, value in values.items():
+                rollup[f"{name}_min"] = min(rollup[f"{name}_min"], value)
+                rollup[f"{name}_max"] = max(rollup[f"{name}_max"], value)
+                rollup[f"{name}_sum"] += value
+                if is_last:
+                    rollup[f"{name}_last"] = value
+    return rollups
+
+
+def merge_rollup(stored: dict, rollup: dict) -> dict[str, dict]:
+    """ Min, max and last values of a partial rollup merged with the stored
+        rollup in DynamoDB JSON, as update values.
+    """
+    values = {}
+    for name in VALUES:
+        for stat, pick in (("min", min), ("max", max)):
+            attr = f"{name}_{stat}"
+            value = rollup[attr]
+            if attr in stored:
+                value = pick(value, Decimal(stored[attr]["N"]))
+            values[f":{attr}"] = {"N": str(value)}
+
+    if "last_date" in stored and stored["last_date"]["S"] > rollup["last_date"]:
+        for attr in ("last_date", "battery_last", "panel_last"):
+            values[f":{attr}"] = stored[attr]
+    else:
+        values[":last_date"] = {"S": rollup["last_date"]}
+        for name in VALUES:
+            values[f":{name}_last"] = {"N": str(rollup[f"{name}_last"])}
+    return values
+
+
+def apply_rollup(client, station: str, bucket: str, rollup: dict) -> bool:
+    """ Merge a partial rollup into the stored one.
+
+        The stored rollup is read first. If it already has the sequence number
+        of the partial rollup, the stream is retrying a batch that was applied
+        and it is skipped. Otherwise every attribute is written in a single
+        update, conditional on the sequence number that was read, so that a
+        retry can not count the reports twice and a failed write does not
+        leave a partial rollup. If another invocation updated the rollup in
+        the meantime, it is read again.
+
+        Returns whether the rollup was updated.
+    """
+    key = serialize_key({"station": station, "bucket": bucket})
+    names = {
+        "#count": "count",
+        "#battery_sum": "battery_sum",
+        "#panel_sum": "panel_sum",
+        "#battery_min": "battery_min",
+        "#battery_max": "battery_max",
+        "#panel_min": "panel_min",
+        "#panel_max": "panel_max",
+        "#last_date": "last_date",
+        "#battery_last": "battery_last",
+        "#panel_last": "panel_last",
+        "#sequence": "sequence",
+    }
+    update = (
+        "ADD #count :count, #battery_sum :battery_sum, #panel_sum :panel_sum "
+        "SET " + ", ".join(f"#{attr} = :{attr}" for attr in (
+            "battery_min", "battery_max", "panel_min", "panel_max",
+            "last_date", "battery_last", "panel_last", "sequence",
+        ))
+    )
+    for _ in range(MAX_UPDATE_ATTEMPTS):
+        stored = client.get_item(TableName=rollups_table_name, Key=key, ConsistentRead=True).get("Item", {})
+        stored_sequence = stored.get("sequence", {}).get("S")
+        if stored_sequence is not None and stored_sequence >= rollup["sequence"]:
+            print(f"Rollup {bucket} of station {station} already applied")
+            return False
+
+        values = {
+            ":count": {"N": str(rollup["count"])},
+            ":battery_sum": {"N": str(rollup["battery_sum"])},
+            ":panel_sum": {"N": str(rollup["panel_sum"])},
+            ":sequence": {"S": rollup["sequence"]},
+            **merge_rollup(stored, rollup),
+        }
+        if stored_sequence is None:
+            condition = "attribute_not_exists(#sequence)"
+        else:
+            condition = "#sequence = :stored_sequence"
+            values[":stored_sequence"] = {"S": stored_sequence}
+        try:
+            client.update_item(
+                TableName=rollups_table_name,
+                Key=key,
+                UpdateExpression=update,
+                ConditionExpression=condition,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+            )
+            return True
+        except ClientError as err:
+            if err.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            print(f"Rollup {bucket} of station {station} updated concurrently. Reading it again")
+    raise RuntimeError(f"Failed to update rollup {bucket} of station {station}")
+
+
+def lambda_handler(event: DynamoDBStreamEvent, context: LambdaContext) -> dict:
+    """ Maintain the hourly and daily rollups of the reports from the
+        DynamoDB stream of the reports table.
+
+        The reports of the batch are aggregated in memory first, so each
+        rollup is written once per batch. A failed write fails the whole
+        batch, which the stream retries. The rollups that were already
+        written are skipped on the retry.
+
+    Parameters
+    ----------
+    event: dict, required
+        DynamoDB Streams Lambda Input Format
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+    Returns
+    ------
+    dict
+    """
+    records = event.get("Records", [])
+    rollups = aggregate_records(records)
+    print(f"Aggregated {len(records)} records into {len(rollups)} rollups")
+    if not rollups:
+        return {"records": len(records), "rollups": 0}
+
+    client = get_dynamodb_client(rollups_table_name)
+    with ThreadPoolExecutor(max_workers=min(rollup_workers, len(rollups))) as executor:
+        futures = [
+            executor.submit(apply_rollup, client, station, bucket, rollup)
+            for (station, bucket), rollup in rollups.items()
+        ]
+        for future in futures:
+            future.result()
+
+    return {"records": len(records), "rollups": len(rollups)}
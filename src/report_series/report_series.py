@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+from urllib.parse import unquote
+
+import numpy as np
+
+try:
+    from schema import OUTPUT_SCHEMA
+    from voltage_common.conditional import get_header
+    from voltage_common.dynamodb import get_dynamodb_client
+    from voltage_common.reports import report_query_kwargs
+    from voltage_common.responses import get_cors_origin, respond
+    from voltage_common.rollups import query_rollups
+    from voltage_common.validation import outbound_validator
+except ModuleNotFoundError:
+    from src.report_series.schema import OUTPUT_SCHEMA
+    from src.layers.voltage_common.voltage_common.conditional import get_header
+    from src.layers.voltage_common.voltage_common.dynamodb import get_dynamodb_client
+    from src.layers.voltage_common.voltage_common.reports import report_query_kwargs
+    from src.layers.voltage_common.voltage_common.responses import get_cors_origin, respond
+    from src.layers.voltage_common.voltage_common.rollups import query_rollups
+    from src.layers.voltage_common.voltage_common.validation import outbound_validator
+
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+    from aws_lambda_powertools.utilities.typing import LambdaContext
+
+
+table_name = os.environ["REPORTS_TABLE"]
+rollups_table_name = os.environ["ROLLUPS_TABLE"]
+# Resolutions of the series and the datetime64 unit of their buckets
+RESOLUTIONS = {
+    "1h": "h",
+    "1d": "D",
+}
+DEFAULT_RESOLUTION = "1h"
+
+
+def query_columns(
+        client,
+        station: str,
+        start_date: str,
+        end_date: str
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Query every report of a station in the date range, oldest first.
+
+        The pages are kept as columns of raw values and converted to arrays
+        once, instead of building a dict per report.
+    """
+    kwargs = report_query_kwargs(table_name, station, start_date, end_date)
+    kwargs["ProjectionExpression"] = "#date, #battery, #panel"
+    kwargs["ScanIndexForward"] = True
+    dates = []
+    battery = []
+    panel = []
+    while True:
+        ddb_res = client.query(**kwargs)
+        items = ddb_res["Items"]
+        dates.extend([it["date"]["S"] for it in items])
+        battery.extend([it["battery"]["N"] for it in items])
+        panel.extend([it["panel"]["N"] for it in items])
+        if "LastEvaluatedKey" not in ddb_res:
+            break
+        kwargs["ExclusiveStartKey"] = ddb_res["LastEvaluatedKey"]
+
+    return (
+        np.array(dates, dtype="datetime64[s]"),
+        np.array(battery, dtype=np.float64),
+        np.array(panel, dtype=np.float64),
+    )
+
+
+def aggregate(values: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> dict:
+    """ Min, max, mean and last value of each bucket of a sorted series.
+    """
+    ends = starts + counts
+    return {
+        "min": np.minimum.reduceat(values, starts).tolist(),
+        "max": np.maximum.reduceat(values, starts).tolist(),
+        "mean": np.round(np.add.reduceat(values, starts) / counts, 3).tolist(),
+        "last": values[ends - 1].tolist(),
+    }
+
+
+def resample(
+        dates: np.ndarray,
+        battery: np.ndarray,
+        panel: np.ndarray,
+        unit: str
+) -> dict:
+    """ Resample the reports of a station, sorted by date, into buckets of
+        the given datetime64 unit.
+
+        Returns the series in columns, one entry per bucket with reports.
+    """
+    buckets = dates.astype(f"datetime64[{unit}]")
+    # Index of the first report of each bucket
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, len(dates)])
+    return {
+        "date": np.datetime_as_string(buckets[starts].astype("datetime64[s]")).tolist(),
+        "count": counts.tolist(),
+        "battery": aggregate(battery, starts, counts),
+        "panel": aggregate(panel, starts, counts),
+    }
+
+
+def rollup_series(items: list[dict]) -> dict:
+    """ The series of a station from its rollups in DynamoDB JSON, oldest
+        first.
+    """
+    counts = np.array([it["count"]["N"] for it in items], dtype=np.int64)
+    series = {
+        "date": [it["bucket"]["S"].partition("#")[2] for it in items],
+        "count": counts.tolist(),
+    }
+    for name in ("battery", "panel"):
+        sums = np.array([it[f"{name}_sum"]["N"] for it in items], dtype=np.float64)
+        series[name] = {
+            "min": [float(it[f"{name}_min"]["N"]) for it in items],
+            "max": [float(it[f"{name}_max"]["N"]) for it in items],
+            "mean": np.round(sums / counts, 3).tolist(),
+            "last": [float(it[f"{name}_last"]["N"]) for it in items],
+        }
+    return series
+
+
+@outbound_validator(OUTPUT_SCHEMA)
+def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
+    """ Get the battery and panel series of a station resampled by hour or day
+
+    The query string accepts the resolution (1h or 1d) and the start_date and
+    end_date bounds. Each bucket has the number of reports and the min, max,
+    mean and last value of the battery and panel.
+
+    The series is read from the rollups kept by the report_rollups function,
+    and by the backfill-rollups command of populate_dynamo for the reports
+    written before it. Stations without rollups, as in local tables, which
+    have no streams, are resampled from their reports. The bucket that
+    contains the start date is included whole.
+
+    Parameters
+    ----------
+    event: dict, required
+        API Gateway Lambda Proxy Input Format
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+    Returns
+    ------
+    API Gateway Lambda Proxy Output Format: dict
+    """
+    cors_origin = get_cors_origin(context.function_name)
+    path_params = event.get("pathParameters")
+    station = ""
+    if path_params is not None:
+        station: str = path_params.get("station", "")
+        station = unquote(station)
+
+    if not path_params or not station:
+        print("Failed to get station path parameter")
+        return respond(400, {"message": "Need to pass a station"})
+
+    start_date = ""
+    end_date = ""
+    resolution = DEFAULT_RESOLUTION
+    if "queryStringParameters" in event and event["queryStringParameters"]:
+        start_date = event["queryStringParameters"].get("start_date", "")
+        end_date = event["queryStringParameters"].get("end_date", "")
+        resolution = event["queryStringParameters"].get("resolution", resolution)
+
+    if resolution not in RESOLUTIONS:
+        print(f"Invalid resolution {resolution}")
+        return respond(
+            400,
+            {"message": f"The resolution must be one of {', '.join(RESOLUTIONS)}"},
+            cors_origin
+        )
+
+    print(f"Requested {resolution} series for station {station}")
+    client = get_dynamodb_client(table_name)
+    rollups = query_rollups(
+        client, rollups_table_name, station, resolution, start_date, end_date
+    )
+    if rollups:
+        series = rollup_series(rollups)
+        print(f"Read {len(rollups)} rollups")
+    else:
+        print(f"No rollups for station {station}. Resampling reports")
+        dates, battery, panel = query_columns(client, station, start_date, end_date)
+        if len(dates) == 0:
+            print(f"Did not find reports for station {station}")
+            return respond(
+                404,
+                {"message": f"Station '{station}' not found"},
+                cors_origin
+            )
+
+        series = resample(dates, battery, panel, RESOLUTIONS[resolution])
+        print(f"Resampled {len(dates)} reports into {len(series['date'])} buckets")
+    return respond(
+        200,
+        {"station": station, "resolution": resolution, "series": series},
+        cors_origin,
+        accept_encoding=get_header(event, "Accept-Encoding") or ""
+    )
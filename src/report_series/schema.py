@@ -0,0 +1,24 @@
+OUTPUT_SCHEMA = {
+    "$schema": "http://json-schema.org/draft-07/schema",
+    "type": "object",
+    "title": "Report Series Lambda Output Schema",
+    "description": "The battery and panel series of a station resampled by hour or day",
+    "properties": {
+        "statusCode": {
+            "type": "integer",
+            "description": "HTTP Status Code",
+            "examples": [200, 400, 404]
+        },
+        "body": {
+            "type": "string",
+            "description": "Resampled series in columns encoded as a json string",
+            "examples": [
+                '{"station": "Caracol", "resolution": "1d", "series": {'
+                '"date": ["2023-02-22T00:00:00"], "count": [1], '
+                '"battery": {"min": [45.0], "max": [45.0], "mean": [45.0], "last": [45.0]}, '
+                '"panel": {"min": [68.0], "max": [68.0], "mean": [68.0], "last": [68.0]}}}'
+            ],
+        }
+    },
+    "required": ["statusCode", "body"],
+}
@@ -0,0 +1,22 @@
+OUTPUT_SCHEMA = {
+    "$schema": "http://json-schema.org/draft-07/schema",
+    "type": "object",
+    "title": "Stale Stations Lambda Output Schema",
+    "description": "The stations whose last report is older than a given duration",
+    "properties": {
+        "statusCode": {
+            "type": "integer",
+            "description": "HTTP Status Code",
+            "examples": [200, 400, 500]
+        },
+        "body": {
+            "type": "string",
+            "description": "The last reports of the stale stations encoded as a json string",
+            "examples": [
+                '{"cutoff": "2023-02-23T16:20:00", "stations": [{"station": "Caracol", '
+                '"date": "2023-02-22T16:20:00", "battery": 150.0, "panel": 150.0}]}'
+            ]
+        }
+    },
+    "required": ["statusCode", "body"],
+}
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+import os
+import re
+from typing import TYPE_CHECKING
+
+try:
+    from schema import OUTPUT_SCHEMA
+    from voltage_common.dynamodb import get_dynamodb_client
+    from voltage_common.reports import (
+        FLEET_PARTITION,
+        LAST_REPORT_DATE_INDEX,
+        REPORT_ATTRIBUTE_NAMES,
+        REPORT_PROJECTION,
+        deserialize_reports,
+    )
+    from voltage_common.responses import get_cors_origin, respond
+    from voltage_common.validation import outbound_validator
+except ModuleNotFoundError:
+    from src.stale_stations.schema import OUTPUT_SCHEMA
+    from src.layers.voltage_common.voltage_common.dynamodb import get_dynamodb_client
+    from src.layers.voltage_common.voltage_common.reports import (
+        FLEET_PARTITION,
+        LAST_REPORT_DATE_INDEX,
+        REPORT_ATTRIBUTE_NAMES,
+        REPORT_PROJECTION,
+        deserialize_reports,
+    )
+    from src.layers.voltage_common.voltage_common.responses import get_cors_origin, respond
+    from src.layers.voltage_common.voltage_common.validation import outbound_validator
+
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+    from aws_lambda_powertools.utilities.typing import LambdaContext
+
+
+table_name = os.environ["LAST_REPORTS_TABLE"]
+DEFAULT_OLDER_THAN = "PT24H"
+# ISO 8601 durations in weeks, days, hours, minutes and seconds. Months and
+# years do not have a fixed length, so they are not accepted
+DURATION_PATTERN = re.compile(
+    r"P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+(?:\.\d+)?)S)?)?"
+)
+
+
+def parse_duration(duration: str) -> timedelta:
+    """ Parse an ISO 8601 duration such as PT24H or P1DT12H.
+
+        Raises a ValueError if the duration is invalid or empty.
+    """
+    match = DURATION_PATTERN.fullmatch(duration.upper())
+    if match is None or duration.upper() in ("P", "PT") or duration.upper().endswith("T"):
+        raise ValueError(f"Invalid duration '{duration}'")
+    parts = {name: float(value) for name, value in match.groupdict().items() if value}
+    return timedelta(**parts)
+
+
+def query_stale_stations(client, cutoff: str) -> list[dict]:
+    """ Query the last reports older than the cutoff date, oldest first.
+    """
+    kwargs = {
+        "TableName": table_name,
+        "IndexName": LAST_REPORT_DATE_INDEX,
+        "KeyConditionExpression": "#fleet = :fleet AND #date < :cutoff",
+        "ExpressionAttributeNames": {**REPORT_ATTRIBUTE_NAMES, "#fleet": "fleet"},
+        "ExpressionAttributeValues": {
+            ":fleet": {"S": FLEET_PARTITION},
+            ":cutoff": {"S": cutoff},
+        },
+        "ProjectionExpression": REPORT_PROJECTION,
+    }
+    reports = []
+    while True:
+        ddb_res = client.query(**kwargs)
+        reports.extend(deserialize_reports(ddb_res["Items"]))
+        if "LastEvaluatedKey" not in ddb_res:
+            return reports
+        kwargs["ExclusiveStartKey"] = ddb_res["LastEvaluatedKey"]
+
+
+@outbound_validator(OUTPUT_SCHEMA)
+def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext) -> dict:
+    """ Get the stations whose last report is older than a given duration
+
+    The query string accepts older_than, an ISO 8601 duration such as PT24H
+    (the default) or P2D. The dates of the reports are compared as UTC.
+
+    Parameters
+    ----------
+    event: dict, required
+        API Gateway Lambda Proxy Input Format
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+
+    Returns
+    ------
+    API Gateway Lambda Proxy Output Format: dict
+    """
+    cors_origin = get_cors_origin(context.function_name)
+    older_than = DEFAULT_OLDER_THAN
+    if "queryStringParameters" in event and event["queryStringParameters"]:
+        older_than = event["queryStringParameters"].get("older_than", older_than)
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    try:
+        cutoff = (now - parse_duration(older_than)).isoformat(timespec="seconds")
+    # Durations too long for a timedelta, or that end before year 1
+    except (ValueError, OverflowError):
+        print(f"Invalid duration {older_than}")
+        return respond(
+            400,
+            {"message": "older_than must be an ISO 8601 duration in weeks, days, hours, minutes or seconds"},
+            cors_origin
+        )
+
+    print(f"Requested stations without reports since {cutoff}")
+    client = get_dynamodb_client(table_name)
+    stations = query_stale_stations(client, cutoff)
+    print("Stale stations", stations)
+    return respond(200, {"cutoff": cutoff, "stations": stations}, cors_origin)
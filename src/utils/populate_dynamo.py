@@ -1,14 +1,38 @@
 import argparse
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 import datetime
 from decimal import Decimal
-import random
+from pathlib import Path
+import sys
+import threading
+import time
 from typing import Optional, TypedDict
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
+import numpy as np
 
 from stations import STATIONS
 
+# The names shared with the functions are in the layer, which is not installed
+# when the script runs from src/utils
+sys.path.append(str(Path(__file__).resolve().parents[1] / "layers" / "voltage_common"))
+from voltage_common.reports import (  # noqa: E402
+    ALERTS_INDEX,
+    FLEET_PARTITION,
+    LAST_REPORT_DATE_INDEX,
+    LOW_BATTERY_ALERT,
+)
+from voltage_common.rollups import RESOLUTIONS, bucket_key  # noqa: E402
+
+# Default low battery threshold of the new_report function
+LOW_BATTERY_THRESHOLD = 10.
+# Maximum number of items DynamoDB accepts in a single BatchWriteItem call
+BATCH_WRITE_SIZE = 25
+MAX_BATCH_RETRIES = 10
+RETRY_BACKOFF = 0.05  # seconds
+
 
 class Report(TypedDict):
     station: str
@@ -17,87 +41,133 @@ class Report(TypedDict):
     panel: float
 
 
-def create_report(
+class StationReports(TypedDict):
+    """ The reports of a station as columns.
+    """
+    station: str
+    dates: np.ndarray
+    battery: np.ndarray
+    panel: np.ndarray
+
+
+def create_station_reports(
         station: str,
-        date: datetime.datetime,
-        battery: Optional[float] = None,
-        panel: Optional[float] = None
-) -> Report:
-    if battery is None:
-        battery = 100 + random.random() * 100
-    if panel is None:
-        panel = 100 + random.random() * 100
+        dates: np.ndarray,
+        rng: np.random.Generator
+) -> StationReports:
     return {
         "station": station,
-        "date": date.isoformat(),
-        "battery": battery,
-        "panel": panel
+        "dates": dates,
+        "battery": rng.uniform(100, 200, len(dates)),
+        "panel": rng.uniform(100, 200, len(dates)),
     }
 
 
-def generate_random_data(num_days: int) -> tuple[list[Report], list[Report]]:
-    """ Generate random data for each station
+def last_report(reports: StationReports) -> Report:
+    """ The last report of a station, rounded as in the reports table.
     """
-    reports = []
-    last_reports = []
+    return {
+        "station": reports["station"],
+        "date": str(np.datetime_as_string(reports["dates"][-1], unit="s")),
+        "battery": round(float(reports["battery"][-1]), 2),
+        "panel": round(float(reports["panel"][-1]), 2),
+    }
+
 
-    end_date = datetime.date.today()
-    end_date = datetime.datetime(year=end_date.year, month=end_date.month, day=end_date.day)
-    time_delta = datetime.timedelta(days=num_days)
-    start_date = end_date - time_delta
+def generate_random_data(
+        num_days: int,
+        samples_per_day: int = 2,
+        seed: Optional[int] = None
+) -> tuple[list[StationReports], list[Report]]:
+    """ Generate random data for each station
 
-    n_samples = 2
-    time_delta = datetime.timedelta(hours=24 / n_samples)
+        The other stations miss a fifth of their reports, but all of them
+        report in the last date. Tonalapa reports at every date and has a
+        battery of 5 V in its last report, and Caracol stopped reporting
+        before the last date.
+    """
+    rng = np.random.default_rng(seed)
+    end_date = np.datetime64(datetime.date.today(), "s")
+    step = np.timedelta64(24 * 3600 // samples_per_day, "s")
+    dates = np.arange(end_date - np.timedelta64(num_days, "D"), end_date + step, step)
 
     stations = set(STATIONS)
     stations.remove("Tonalapa")
     stations.remove("Caracol")
-    sorted_stations = sorted(list(stations))
-
-    dates = []
-    current_date = start_date
-    while current_date <= end_date:
-        dates.append(current_date)
-        current_date += time_delta
+    sorted_stations = sorted(stations)
 
-    options = [True, False]
-    weights = [0.8, 0.2]
-
-    for station in sorted_stations:
-        choices = random.choices(options, weights, k=len(dates))
-        # All stations will report in the last date
-        choices[-1] = True
-        for ii in range(len(dates) - 1):
-            if choices[ii]:
-                reports.append(create_report(station, dates[ii]))
-
-        report = create_report(station, dates[-1])
-        reports.append(report)
-        last_reports.append(report)
+    reported = rng.random((len(sorted_stations), len(dates))) < 0.8
+    # All stations will report in the last date
+    reported[:, -1] = True
+    station_reports = [
+        create_station_reports(station, dates[reported[ii]], rng)
+        for ii, station in enumerate(sorted_stations)
+    ]
 
     # Tonalapa will have a voltage below 10
-    for ii in range(len(dates) - 1):
-        reports.append(create_report("Tonalapa", dates[ii]))
-
-    battery = 5.
-    panel = 100 + random.random() * 100
-    report = create_report("Tonalapa", dates[-1], battery, panel)
-
-    reports.append(report)
-    last_reports.append(report)
+    tonalapa = create_station_reports("Tonalapa", dates, rng)
+    tonalapa["battery"][-1] = 5.
+    station_reports.append(tonalapa)
 
-    for ii in range(len(dates) - 3):
-        reports.append(create_report("Caracol", dates[ii]))
+    caracol_dates = np.concatenate([dates[:-3], dates[-2:-1]])
+    station_reports.append(create_station_reports("Caracol", caracol_dates, rng))
 
-    report = create_report("Caracol", dates[-2])
-    reports.append(report)
-    last_reports.append(report)
-
-    return reports, last_reports
+    last_reports = [last_report(reports) for reports in station_reports]
+    return station_reports, last_reports
 
 
 def create_reports_table(ddb_resource, table_name: str):
-    if "last" not in table_name.lower():
+    if "rollup" in table_name.lower():
+        return ddb_resource.create_table(
+            TableName=table_name,
+            KeySchema=[
+                {
+                    "AttributeName": "station",
+                    "KeyType": "HASH"
+                },
+                {
+                    "AttributeName": "bucket",
+                    "KeyType": "RANGE"
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    "AttributeName": "station",
+                    "AttributeType": "S"
+                },
+                {
+                    "AttributeName": "bucket",
+                    "AttributeType": "S"
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST',
+        )
+    elif "count" in table_name.lower():
+        return ddb_resource.create_table(
+            TableName=table_name,
+            KeySchema=[
+                {
+                    "AttributeName": "station",
+                    "KeyType": "HASH"
+                },
+                {
+                    "AttributeName": "day",
+                    "KeyType": "RANGE"
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    "AttributeName": "station",
+                    "AttributeType": "S"
+                },
+                {
+                    "AttributeName": "day",
+                    "AttributeType": "S"
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST',
+        )
+    elif "last" not in table_name.lower():
         return ddb_resource.create_table(
             TableName=table_name,
             KeySchema=[
@@ -136,6 +206,51 @@ def create_reports_table(ddb_resource, table_name: str):
                     "AttributeName": "station",
                     "AttributeType": "S"
                 },
+                {
+                    "AttributeName": "alert",
+                    "AttributeType": "S"
+                },
+                {
+                    "AttributeName": "fleet",
+                    "AttributeType": "S"
+                },
+                {
+                    "AttributeName": "date",
+                    "AttributeType": "S"
+                },
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": ALERTS_INDEX,
+                    "KeySchema": [
+                        {
+                            "AttributeName": "alert",
+                            "KeyType": "HASH"
+                        },
+                        {
+                            "AttributeName": "station",
+                            "KeyType": "RANGE"
+                        },
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                },
+                {
+                    "IndexName": LAST_REPORT_DATE_INDEX,
+                    "KeySchema": [
+                        {
+                            "AttributeName": "fleet",
+                            "KeyType": "HASH"
+                        },
+                        {
+                            "AttributeName": "date",
+                            "KeyType": "RANGE"
+                        },
+                    ],
+                    "Projection": {
+                        "ProjectionType": "INCLUDE",
+                        "NonKeyAttributes": ["battery", "panel"],
+                    },
+                },
             ],
             BillingMode='PAY_PER_REQUEST',
         )
@@ -166,6 +281,8 @@ def get_tables(endpoint_url: Optional[str]):
         ddb_resource = boto3.resource("dynamodb")
         reports_table = ddb_resource.Table("voltage-dev-ReportsTable-YFR5XT9RWVJQ")
         last_reports_table = ddb_resource.Table("voltage-dev-LastReportsTable-H1EEWTXUI42")
+        report_counts_table = ddb_resource.Table("voltage-dev-ReportCountsTable")
+        rollups_table = ddb_resource.Table("voltage-dev-RollupsTable")
     else:
         ddb_resource = boto3.resource("dynamodb", endpoint_url=endpoint_url)
         reports_table = create_table_if_not_exist(
@@ -174,41 +291,389 @@ def get_tables(endpoint_url: Optional[str]):
         last_reports_table = create_table_if_not_exist(
             ddb_resource, "VoltageLastReportsLocal", endpoint_url
         )
-    return reports_table, last_reports_table
-
-
-def add_data_to_dynamo(table, reports: list[Report]) -> None:
-    batch_chunks = [reports[i:i + 25] for i in range(0, len(reports), 25)]
-    for chunk in batch_chunks:
-        with table.batch_writer() as batch:
-            for item in chunk:
-                battery = Decimal(str(item["battery"]))
-                panel = Decimal(str(item["panel"]))
-                batch.put_item(Item={
-                    "station": item["station"],
-                    "date": item["date"],
-                    "battery": battery,
-                    "panel": panel,
-                })
-
-
-def clear_reports_table(table) -> None:
-    response = table.scan()
+        report_counts_table = create_table_if_not_exist(
+            ddb_resource, "VoltageReportCountsLocal", endpoint_url
+        )
+        # There are no streams locally, so the rollups table stays empty and
+        # the series are resampled from the reports
+        rollups_table = create_table_if_not_exist(
+            ddb_resource, "VoltageRollupsLocal", endpoint_url
+        )
+    return reports_table, last_reports_table, report_counts_table, rollups_table
+
+
+def get_client(endpoint_url: Optional[str], workers: int):
+    """ Low level client for the writers, with a connection per worker.
+
+        The adaptive retry mode slows down the requests when DynamoDB
+        throttles them.
+    """
+    config = Config(
+        max_pool_connections=workers,
+        retries={"max_attempts": 10, "mode": "adaptive"},
+    )
+    return boto3.client("dynamodb", endpoint_url=endpoint_url, config=config)
+
+
+def add_data_to_dynamo(table, reports: list[Report], attributes: Optional[dict] = None) -> None:
+    """ Write the reports to a table, adding the given attributes to each of
+        them.
+    """
+    attributes = attributes or {}
+    # The batch writer sends the items in chunks of 25
     with table.batch_writer() as batch:
-        for item in response["Items"]:
-            batch.delete_item(Key={
+        for item in reports:
+            battery = Decimal(str(item["battery"]))
+            panel = Decimal(str(item["panel"]))
+            batch.put_item(Item={
                 "station": item["station"],
-                "date": item["date"]
+                "date": item["date"],
+                "battery": battery,
+                "panel": panel,
+                **attributes,
             })
 
 
-def clear_last_reports_table(table) -> None:
-    response = table.scan()
+class Progress:
+    """ Number of items processed by all the workers and their throughput.
+    """
+    def __init__(self, total: Optional[int] = None, label: str = "reports written"):
+        self.total = total
+        self.label = label
+        self.count = 0
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, count: int) -> None:
+        with self._lock:
+            self.count += count
+
+    def print(self, end: str = "\r") -> None:
+        elapsed = time.perf_counter() - self.start
+        rate = self.count / elapsed if elapsed else 0.
+        done = f"{self.count} {self.label}"
+        if self.total:
+            done = f"{self.count}/{self.total} {self.label} ({self.count / self.total:.0%})"
+        print(f"{done}, {rate:,.0f} items/s", end=end, flush=True)
+
+
+def serialize_reports(reports: StationReports) -> list[dict]:
+    """ The reports of a station as items in DynamoDB JSON, with the readings
+        rounded to two decimals.
+    """
+    station = {"S": reports["station"]}
+    dates = np.datetime_as_string(reports["dates"], unit="s").tolist()
+    battery = np.char.mod("%.2f", reports["battery"]).tolist()
+    panel = np.char.mod("%.2f", reports["panel"]).tolist()
+    return [
+        {"station": station, "date": {"S": date}, "battery": {"N": bat}, "panel": {"N": pan}}
+        for date, bat, pan in zip(dates, battery, panel)
+    ]
+
+
+def write_station_reports(client, table_name: str, reports: StationReports, progress: Progress) -> None:
+    """ Write the reports of a station with BatchWriteItem, retrying the
+        unprocessed items with exponential backoff.
+    """
+    items = serialize_reports(reports)
+    for ii in range(0, len(items), BATCH_WRITE_SIZE):
+        chunk = items[ii:ii + BATCH_WRITE_SIZE]
+        request_items = {table_name: [{"PutRequest": {"Item": item}} for item in chunk]}
+        for attempt in range(MAX_BATCH_RETRIES + 1):
+            if attempt > 0:
+                time.sleep(min(RETRY_BACKOFF * 2 ** (attempt - 1), 1.))
+            ddb_res = client.batch_write_item(RequestItems=request_items)
+            request_items = ddb_res.get("UnprocessedItems", {})
+            if not request_items:
+                break
+        else:
+            raise RuntimeError(f"Failed to write the reports of {reports['station']}")
+        progress.add(len(chunk))
+
+
+def write_reports_parallel(
+        client,
+        table_name: str,
+        station_reports: list[StationReports],
+        workers: int
+) -> None:
+    """ Write the reports with a pool of threads, each one writing all the
+        reports of a station at a time, and print the progress every second.
+    """
+    progress = Progress(sum(len(reports["dates"]) for reports in station_reports))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {
+            executor.submit(write_station_reports, client, table_name, reports, progress)
+            for reports in station_reports
+        }
+        while pending:
+            done, pending = wait(pending, timeout=1, return_when=FIRST_EXCEPTION)
+            progress.print(end="\r" if pending else "\n")
+            for future in done:
+                if future.exception() is not None:
+                    print()
+                    executor.shutdown(cancel_futures=True)
+                    raise future.exception()
+
+
+def add_alerts_to_dynamo(table, last_reports: list[Report]) -> None:
+    """ Raise the low battery alert of the stations whose last report is
+        below the threshold, as new_report does.
+    """
+    for report in last_reports:
+        if report["battery"] < LOW_BATTERY_THRESHOLD:
+            table.update_item(
+                Key={"station": report["station"]},
+                UpdateExpression="SET #alert = :alert, #alertSince = :date",
+                ExpressionAttributeValues={":alert": LOW_BATTERY_ALERT, ":date": report["date"]},
+                ExpressionAttributeNames={"#alert": "alert", "#alertSince": "alert_since"}
+            )
+
+
+def count_reports(station_reports: list[StationReports]) -> list[dict]:
+    """ Get the number of reports per station and day.
+    """
+    counts = []
+    for reports in station_reports:
+        days, day_counts = np.unique(reports["dates"].astype("datetime64[D]"), return_counts=True)
+        counts.extend(
+            {"station": reports["station"], "day": str(day), "count": int(cnt)}
+            for day, cnt in zip(days, day_counts)
+        )
+    return counts
+
+
+def add_counts_to_dynamo(table, station_reports: list[StationReports]) -> None:
     with table.batch_writer() as batch:
-        for item in response["Items"]:
-            batch.delete_item(
-                Key={"station": item["station"]}
+        for item in count_reports(station_reports):
+            batch.put_item(Item=item)
+
+
+def get_key_names(client, table_name: str) -> list[str]:
+    ddb_res = client.describe_table(TableName=table_name)
+    return [key["AttributeName"] for key in ddb_res["Table"]["KeySchema"]]
+
+
+def delete_items(client, table_name: str, keys: list[dict], progress: Progress) -> None:
+    """ Delete items by key with BatchWriteItem, retrying the unprocessed
+        items with exponential backoff.
+    """
+    for ii in range(0, len(keys), BATCH_WRITE_SIZE):
+        chunk = keys[ii:ii + BATCH_WRITE_SIZE]
+        request_items = {table_name: [{"DeleteRequest": {"Key": key}} for key in chunk]}
+        for attempt in range(MAX_BATCH_RETRIES + 1):
+            if attempt > 0:
+                time.sleep(min(RETRY_BACKOFF * 2 ** (attempt - 1), 1.))
+            ddb_res = client.batch_write_item(RequestItems=request_items)
+            request_items = ddb_res.get("UnprocessedItems", {})
+            if not request_items:
+                break
+        else:
+            raise RuntimeError(f"Failed to delete items of {table_name}")
+        progress.add(len(chunk))
+
+
+def clear_segment(
+        client,
+        table_name: str,
+        key_names: list[str],
+        segment: int,
+        total_segments: int,
+        delete_executor: ThreadPoolExecutor,
+        progress: Progress
+) -> None:
+    """ Scan every page of a segment of the table projecting only the keys,
+        and hand the keys of each page to the delete workers.
+    """
+    names = {f"#k{ii}": name for ii, name in enumerate(key_names)}
+    kwargs = {
+        "TableName": table_name,
+        "ProjectionExpression": ", ".join(names),
+        "ExpressionAttributeNames": names,
+        "Segment": segment,
+        "TotalSegments": total_segments,
+    }
+    deletes = []
+    while True:
+        ddb_res = client.scan(**kwargs)
+        if ddb_res["Items"]:
+            deletes.append(delete_executor.submit(
+                delete_items, client, table_name, ddb_res["Items"], progress))
+        if "LastEvaluatedKey" not in ddb_res:
+            break
+        kwargs["ExclusiveStartKey"] = ddb_res["LastEvaluatedKey"]
+    for future in deletes:
+        future.result()
+
+
+def clear_table(client, table_name: str, workers: int) -> None:
+    """ Delete all the items of a table.
+
+        A parallel scan with a segment per worker reads only the keys, and
+        each page is deleted by a separate pool of workers while the scan
+        goes on.
+    """
+    key_names = get_key_names(client, table_name)
+    progress = Progress(label="items deleted")
+    with ThreadPoolExecutor(max_workers=workers) as delete_executor, \
+            ThreadPoolExecutor(max_workers=workers) as scan_executor:
+        pending = {
+            scan_executor.submit(
+                clear_segment, client, table_name, key_names, segment, workers,
+                delete_executor, progress
             )
+            for segment in range(workers)
+        }
+        while pending:
+            done, pending = wait(pending, timeout=1, return_when=FIRST_EXCEPTION)
+            progress.print(end="\r" if pending else "\n")
+            for future in done:
+                if future.exception() is not None:
+                    print()
+                    delete_executor.shutdown(cancel_futures=True)
+                    raise future.exception()
+
+
+def scan_segments(function, workers: int, progress: Progress, *args) -> list:
+    """ Call the function with each segment of a parallel scan of a worker
+        per segment, printing the progress. Returns the result of every
+        segment.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(function, *args, segment, workers, progress)
+            for segment in range(workers)
+        ]
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=1, return_when=FIRST_EXCEPTION)
+            progress.print(end="\r" if pending else "\n")
+            for future in done:
+                if future.exception() is not None:
+                    print()
+                    executor.shutdown(cancel_futures=True)
+                    raise future.exception()
+    return [future.result() for future in futures]
+
+
+def backfill_fleet_segment(
+        client,
+        table_name: str,
+        segment: int,
+        total_segments: int,
+        progress: Progress
+) -> None:
+    """ Set the fleet partition of the last reports of a segment of the
+        table that are not in the index of the last reports by date.
+    """
+    kwargs = {
+        "TableName": table_name,
+        "ProjectionExpression": "#station",
+        "FilterExpression": "attribute_not_exists(#fleet)",
+        "ExpressionAttributeNames": {"#station": "station", "#fleet": "fleet"},
+        "Segment": segment,
+        "TotalSegments": total_segments,
+    }
+    while True:
+        ddb_res = client.scan(**kwargs)
+        for key in ddb_res["Items"]:
+            try:
+                client.update_item(
+                    TableName=table_name,
+                    Key=key,
+                    UpdateExpression="SET #fleet = :fleet",
+                    # Do not create the last report of a station deleted meanwhile
+                    ConditionExpression="attribute_exists(#station)",
+                    ExpressionAttributeNames={"#station": "station", "#fleet": "fleet"},
+                    ExpressionAttributeValues={":fleet": {"S": FLEET_PARTITION}},
+                )
+            except ClientError as err:
+                if err.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+            progress.add(1)
+        if "LastEvaluatedKey" not in ddb_res:
+            break
+        kwargs["ExclusiveStartKey"] = ddb_res["LastEvaluatedKey"]
+
+
+def backfill_fleet(client, table_name: str, workers: int) -> None:
+    """ Put the last reports written before the index of the last reports by
+        date existed into the index, with a parallel scan of the table.
+
+        new_report only sets the fleet partition when a station reports, so
+        stations that stopped reporting before the deploy are missing from
+        the index, and from the stale stations, until this runs.
+    """
+    progress = Progress(label="last reports indexed")
+    scan_segments(backfill_fleet_segment, workers, progress, client, table_name)
+
+
+def count_segment(
+        client,
+        table_name: str,
+        before: str,
+        segment: int,
+        total_segments: int,
+        progress: Progress
+) -> dict[tuple[str, str], int]:
+    """ Number of reports per station and day of a segment of the reports
+        table, with the days before the given one.
+    """
+    kwargs = {
+        "TableName": table_name,
+        "ProjectionExpression": "#station, #date",
+        "FilterExpression": "#date < :before",
+        "ExpressionAttributeNames": {"#station": "station", "#date": "date"},
+        "ExpressionAttributeValues": {":before": {"S": before}},
+        "Segment": segment,
+        "TotalSegments": total_segments,
+    }
+    counts = {}
+    while True:
+        ddb_res = client.scan(**kwargs)
+        for it in ddb_res["Items"]:
+            key = (it["station"]["S"], it["date"]["S"][:10])
+            counts[key] = counts.get(key, 0) + 1
+        progress.add(len(ddb_res["Items"]))
+        if "LastEvaluatedKey" not in ddb_res:
+            return counts
+        kwargs["ExclusiveStartKey"] = ddb_res["LastEvaluatedKey"]
+
+
+def backfill_counts(client, reports_table_name: str, report_counts_table, workers: int, before: str) -> None:
+    """ Count the reports per station and day of the days before the given
+        one, with a parallel scan of the reports table, and replace their
+        report counts.
+
+        new_report only counts the reports it writes, so the days before the
+        report counts table existed have no counts, and the day of the deploy
+        has part of them. The current day is left out by default, as the
+        reports written during the scan would be counted by new_report and
+        then overwritten.
+    """
+    progress = Progress(label="reports counted")
+    segment_counts = scan_segments(count_segment, workers, progress, client, reports_table_name, before)
+
+    counts = {}
+    for segment in segment_counts:
+        for key, count in segment.items():
+            counts[key] = counts.get(key, 0) + count
+    print(f"Writing {len(counts)} report counts...")
+    with report_counts_table.batch_writer() as batch:
+        for (station, day), count in counts.items():
+            batch.put_item(Item={"station": station, "day": day, "count": count})
+
+
+def recreate_table(table):
+    """ Drop the table and create it again, which is much faster than
+        deleting its items. Only for local tables.
+    """
+    ddb_resource = boto3.resource("dynamodb", endpoint_url=table.meta.client.meta.endpoint_url)
+    table.delete()
+    table.wait_until_not_exists()
+    new_table = create_reports_table(ddb_resource, table.name)
+    new_table.wait_until_exists()
+    return new_table
 
 
 def add_dynamo_endpoint_argument(parser: argparse.ArgumentParser) -> None:
@@ -237,6 +702,21 @@ def create_add_parser(
                  "The first report will have date from today minus the days"
                  "specified here. (default 15)"
         )
+        new_parser.add_argument(
+            "--samples-per-day",
+            "-s",
+            type=int,
+            default=2,
+            help="Number of reports per station and day. (default 2)"
+        )
+        new_parser.add_argument(
+            "--workers",
+            "-w",
+            type=int,
+            default=16,
+            help="Number of threads writing the reports. (default 16)"
+        )
+    new_parser.add_argument("--seed", type=int, help="Seed of the random data")
     add_dynamo_endpoint_argument(new_parser)
     return new_parser
 
@@ -247,6 +727,167 @@ def create_remove_parser(
         description: str
 ) -> argparse.ArgumentParser:
     new_parser = subparsers.add_parser(name, help=description)
+    new_parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=16,
+        help="Number of scan segments and of threads deleting the items. (default 16)"
+    )
+    new_parser.add_argument(
+        "--recreate",
+        action="store_true",
+        help="Drop and create the tables again instead of deleting their items. "
+             "Only for local endpoints"
+    )
+    add_dynamo_endpoint_argument(new_parser)
+    return new_parser
+
+
+def report_rollup(date: str, battery: Decimal, panel: Decimal) -> dict:
+    """ Rollup of a single report, with the attributes of the rollups of the
+        report_rollups function.
+    """
+    rollup = {"count": 1, "last_date": date}
+    for name, value in (("battery", battery), ("panel", panel)):
+        rollup.update({
+            f"{name}_min": value,
+            f"{name}_max": value,
+            f"{name}_sum": value,
+            f"{name}_last": value,
+        })
+    return rollup
+
+
+def merge_rollups(rollup: dict, other: dict) -> None:
+    """ Add the reports of another rollup of the same bucket to a rollup.
+    """
+    rollup["count"] += other["count"]
+    is_last = other["last_date"] >= rollup["last_date"]
+    if is_last:
+        rollup["last_date"] = other["last_date"]
+    for name in ("battery", "panel"):
+        rollup[f"{name}_min"] = min(rollup[f"{name}_min"], other[f"{name}_min"])
+        rollup[f"{name}_max"] = max(rollup[f"{name}_max"], other[f"{name}_max"])
+        rollup[f"{name}_sum"] += other[f"{name}_sum"]
+        if is_last:
+            rollup[f"{name}_last"] = other[f"{name}_last"]
+
+
+def rollup_segment(
+        client,
+        table_name: str,
+        before: str,
+        segment: int,
+        total_segments: int,
+        progress: Progress
+) -> dict[tuple[str, str], dict]:
+    """ Rollups of every resolution of the reports of a segment of the
+        reports table dated before the given day, keyed by station and bucket.
+    """
+    kwargs = {
+        "TableName": table_name,
+        "ProjectionExpression": "#station, #date, #battery, #panel",
+        "FilterExpression": "#date < :before",
+        "ExpressionAttributeNames": {
+            "#station": "station", "#date": "date", "#battery": "battery", "#panel": "panel",
+        },
+        "ExpressionAttributeValues": {":before": {"S": before}},
+        "Segment": segment,
+        "TotalSegments": total_segments,
+    }
+    rollups = {}
+    while True:
+        ddb_res = client.scan(**kwargs)
+        for it in ddb_res["Items"]:
+            date = it["date"]["S"]
+            rollup = report_rollup(date, Decimal(it["battery"]["N"]), Decimal(it["panel"]["N"]))
+            for resolution in RESOLUTIONS:
+                key = (it["station"]["S"], bucket_key(resolution, date))
+                if key in rollups:
+                    merge_rollups(rollups[key], rollup)
+                else:
+                    rollups[key] = dict(rollup)
+        progress.add(len(ddb_res["Items"]))
+        if "LastEvaluatedKey" not in ddb_res:
+            return rollups
+        kwargs["ExclusiveStartKey"] = ddb_res["LastEvaluatedKey"]
+
+
+def write_rollup(client, table_name: str, station: str, bucket: str, rollup: dict) -> None:
+    """ Replace the attributes of a rollup. The sequence number of the stream
+        record last applied by report_rollups is kept, so that the stream
+        retries are still skipped.
+    """
+    names = {f"#{attr}": attr for attr in rollup}
+    values = {
+        f":{attr}": {"S": value} if attr == "last_date" else {"N": str(value)}
+        for attr, value in rollup.items()
+    }
+    client.update_item(
+        TableName=table_name,
+        Key={"station": {"S": station}, "bucket": {"S": bucket}},
+        UpdateExpression="SET " + ", ".join(f"#{attr} = :{attr}" for attr in rollup),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+    )
+
+
+def backfill_rollups(client, reports_table_name: str, rollups_table_name: str, workers: int, before: str) -> None:
+    """ Roll up the reports of the days before the given one, with a parallel
+        scan of the reports table, and replace their rollups.
+
+        report_rollups only rolls up the reports written after it was
+        deployed, so the buckets before the deploy have no rollups, and the
+        bucket of the deploy, or of any late report dated before it, has
+        part of its reports. The current day is left out by default, as the
+        reports written during the scan would be rolled up by report_rollups
+        and then overwritten.
+    """
+    progress = Progress(label="reports rolled up")
+    segment_rollups = scan_segments(rollup_segment, workers, progress, client, reports_table_name, before)
+
+    rollups = segment_rollups[0] if segment_rollups else {}
+    for segment in segment_rollups[1:]:
+        for key, rollup in segment.items():
+            if key in rollups:
+                merge_rollups(rollups[key], rollup)
+            else:
+                rollups[key] = rollup
+
+    progress = Progress(total=len(rollups), label="rollups written")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(write_rollup, client, rollups_table_name, station, bucket, rollup)
+            for (station, bucket), rollup in rollups.items()
+        ]
+        for ii, future in enumerate(futures, 1):
+            future.result()
+            progress.add(1)
+            if ii % 1000 == 0 or ii == len(futures):
+                progress.print(end="\r" if ii < len(futures) else "\n")
+
+
+def create_backfill_parser(
+        subparsers,
+        name: str,
+        description: str
+) -> argparse.ArgumentParser:
+    new_parser = subparsers.add_parser(name, help=description)
+    new_parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=16,
+        help="Number of scan segments and of threads updating the items. (default 16)"
+    )
+    if name in ("backfill-counts", "backfill-rollups"):
+        new_parser.add_argument(
+            "--before",
+            type=str,
+            default=datetime.datetime.now(datetime.timezone.utc).date().isoformat(),
+            help="Backfill the days before this one, as YYYY-MM-DD. (default today in UTC)"
+        )
     add_dynamo_endpoint_argument(new_parser)
     return new_parser
 
@@ -290,45 +931,99 @@ def main() -> None:
         "Remove all data from the DynamoDB reports tables."
     )
 
+    create_backfill_parser(
+        subparsers,
+        "backfill-fleet",
+        "Add the last reports written before the stale stations index to the index."
+    )
+    create_backfill_parser(
+        subparsers,
+        "backfill-counts",
+        "Count the reports per day written before the report counts table."
+    )
+    create_backfill_parser(
+        subparsers,
+        "backfill-rollups",
+        "Roll up the reports written before the report rollups function."
+    )
+
     args = parser.parse_args()
     add_commands = ["add", "add-last", "add-reports"]
     remove_commands = ["remove", "remove-last", "remove-reports"]
+    backfill_commands = ["backfill-fleet", "backfill-counts", "backfill-rollups"]
 
-    all_commands = add_commands + remove_commands
+    all_commands = add_commands + remove_commands + backfill_commands
     if args.command not in all_commands:
         raise ValueError(f"Invalid command. Please choose between {all_commands}")
 
     endpoint_url: Optional[str] = args.endpoint_url
-    reports_table, last_reports_table = get_tables(endpoint_url)
+    reports_table, last_reports_table, report_counts_table, rollups_table = get_tables(endpoint_url)
 
     if args.command in ["add", "add-last", "add-reports"]:
         days = 5
+        samples_per_day = 2
+        workers = 16
         try:
             days = args.days
+            samples_per_day = args.samples_per_day
+            workers = args.workers
         except AttributeError:
             pass
 
-        reports, last_reports = generate_random_data(days)
+        start = time.perf_counter()
+        station_reports, last_reports = generate_random_data(days, samples_per_day, args.seed)
+        n_reports = sum(len(reports["dates"]) for reports in station_reports)
+        print(f"Generated {n_reports} reports in {time.perf_counter() - start:.2f} s")
 
         if args.command == "add-reports" or args.command == "add":
-            print(f"Generated {len(reports)} reports")
-            print("Adding data to reports table...")
-            add_data_to_dynamo(reports_table, reports)
+            print(f"Adding data to reports table with {workers} workers...")
+            client = get_client(endpoint_url, workers)
+            write_reports_parallel(client, reports_table.name, station_reports, workers)
+            print("Adding data to report counts table...")
+            add_counts_to_dynamo(report_counts_table, station_reports)
 
         if args.command == "add-last" or args.command == "add":
             print(f"Generated {len(last_reports)} last reports")
             print("Adding data to last reports table...")
-            add_data_to_dynamo(last_reports_table, last_reports)
+            # Puts the last reports in the index of the last reports by date
+            add_data_to_dynamo(last_reports_table, last_reports, {"fleet": FLEET_PARTITION})
+            add_alerts_to_dynamo(last_reports_table, last_reports)
+
+    elif args.command in backfill_commands:
+        client = get_client(endpoint_url, args.workers)
+        start = time.perf_counter()
+        if args.command == "backfill-fleet":
+            print(f"Indexing the last reports of {last_reports_table.name}...")
+            backfill_fleet(client, last_reports_table.name, args.workers)
+        elif args.command == "backfill-counts":
+            print(f"Counting the reports of {reports_table.name} before {args.before}...")
+            backfill_counts(client, reports_table.name, report_counts_table, args.workers, args.before)
+        else:
+            print(f"Rolling up the reports of {reports_table.name} before {args.before}...")
+            backfill_rollups(client, reports_table.name, rollups_table.name, args.workers, args.before)
+        print(f"Backfilled in {time.perf_counter() - start:.2f} s")
 
     else:
 
-        if args.command == "remove-reports" or args.command == "remove":
-            print("Clearing reports table...")
-            clear_reports_table(reports_table)
+        if args.recreate and endpoint_url is None:
+            raise ValueError("Tables can only be recreated on local endpoints")
 
+        tables = []
+        if args.command == "remove-reports" or args.command == "remove":
+            tables += [reports_table, report_counts_table, rollups_table]
         if args.command == "remove-last" or args.command == "remove":
-            print("Clearing last reports table...")
-            clear_last_reports_table(last_reports_table)
+            tables.append(last_reports_table)
+
+        client = get_client(endpoint_url, args.workers)
+        for table in tables:
+            start = time.perf_counter()
+            if args.recreate:
+                print(f"Recreating {table.name}...")
+                recreate_table(table)
+            else:
+                print(f"Clearing {table.name}...")
+                clear_table(client, table.name, args.workers)
+            print(f"Cleared {table.name} in {time.perf_counter() - start:.2f} s")
 
     print("DONE")
 
@@ -4,7 +4,12 @@ import pytest
 import os
 
 from tests.ddb_table import fill_tables, create_reports_table
-from tests.unit.table import REPORTS_TABLE_NAME, LAST_REPORTS_TABLE_NAME
+from tests.unit.table import (
+    REPORTS_TABLE_NAME,
+    LAST_REPORTS_TABLE_NAME,
+    REPORT_COUNTS_TABLE_NAME,
+    ROLLUPS_TABLE_NAME,
+)
 
 
 @pytest.fixture
@@ -20,17 +25,26 @@ def mock_dynamo_db(station_fixture: str) -> None:
     """
     os.environ["REPORTS_TABLE"] = REPORTS_TABLE_NAME
     os.environ["LAST_REPORTS_TABLE"] = LAST_REPORTS_TABLE_NAME
+    os.environ["REPORT_COUNTS_TABLE"] = REPORT_COUNTS_TABLE_NAME
+    os.environ["ROLLUPS_TABLE"] = ROLLUPS_TABLE_NAME
 
     with mock_dynamodb():
         mock_dynamo = boto3.resource("dynamodb")
         reports_table = create_reports_table(mock_dynamo, REPORTS_TABLE_NAME)
         last_reports_table = create_reports_table(mock_dynamo, LAST_REPORTS_TABLE_NAME)
+        report_counts_table = create_reports_table(mock_dynamo, REPORT_COUNTS_TABLE_NAME)
+        # Left empty, the rollups are written by the stream consumer
+        rollups_table = create_reports_table(mock_dynamo, ROLLUPS_TABLE_NAME)
 
-        fill_tables(reports_table, last_reports_table, station_fixture)
+        fill_tables(reports_table, last_reports_table, station_fixture, report_counts_table)
 
         yield
 
         reports_table.delete()
         last_reports_table.delete()
+        report_counts_table.delete()
+        rollups_table.delete()
         del os.environ["REPORTS_TABLE"]
         del os.environ["LAST_REPORTS_TABLE"]
+        del os.environ["REPORT_COUNTS_TABLE"]
+        del os.environ["ROLLUPS_TABLE"]
@@ -3,6 +3,12 @@ from typing import Literal
 
 from botocore.exceptions import ClientError
 
+from src.layers.voltage_common.voltage_common.reports import (
+    ALERTS_INDEX,
+    FLEET_PARTITION,
+    LAST_REPORT_DATE_INDEX,
+)
+
 
 def create_table_if_not_exist(
         ddb_resource,
@@ -25,7 +31,57 @@ def create_table_if_not_exist(
 
 
 def create_reports_table(ddb_resource, table_name: str):
-    if "last" not in table_name.lower():
+    if "rollup" in table_name.lower():
+        return ddb_resource.create_table(
+            TableName=table_name,
+            KeySchema=[
+                {
+                    "AttributeName": "station",
+                    "KeyType": "HASH"
+                },
+                {
+                    "AttributeName": "bucket",
+                    "KeyType": "RANGE"
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    "AttributeName": "station",
+                    "AttributeType": "S"
+                },
+                {
+                    "AttributeName": "bucket",
+                    "AttributeType": "S"
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST',
+        )
+    elif "count" in table_name.lower():
+        return ddb_resource.create_table(
+            TableName=table_name,
+            KeySchema=[
+                {
+                    "AttributeName": "station",
+                    "KeyType": "HASH"
+                },
+                {
+                    "AttributeName": "day",
+                    "KeyType": "RANGE"
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    "AttributeName": "station",
+                    "AttributeType": "S"
+                },
+                {
+                    "AttributeName": "day",
+                    "AttributeType": "S"
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST',
+        )
+    elif "last" not in table_name.lower():
         return ddb_resource.create_table(
             TableName=table_name,
             KeySchema=[
@@ -64,12 +120,62 @@ def create_reports_table(ddb_resource, table_name: str):
                     "AttributeName": "station",
                     "AttributeType": "S"
                 },
+                {
+                    "AttributeName": "alert",
+                    "AttributeType": "S"
+                },
+                {
+                    "AttributeName": "fleet",
+                    "AttributeType": "S"
+                },
+                {
+                    "AttributeName": "date",
+                    "AttributeType": "S"
+                },
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": ALERTS_INDEX,
+                    "KeySchema": [
+                        {
+                            "AttributeName": "alert",
+                            "KeyType": "HASH"
+                        },
+                        {
+                            "AttributeName": "station",
+                            "KeyType": "RANGE"
+                        },
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                },
+                {
+                    "IndexName": LAST_REPORT_DATE_INDEX,
+                    "KeySchema": [
+                        {
+                            "AttributeName": "fleet",
+                            "KeyType": "HASH"
+                        },
+                        {
+                            "AttributeName": "date",
+                            "KeyType": "RANGE"
+                        },
+                    ],
+                    "Projection": {
+                        "ProjectionType": "INCLUDE",
+                        "NonKeyAttributes": ["battery", "panel"],
+                    },
+                },
             ],
             BillingMode='PAY_PER_REQUEST',
         )
 
 
-def fill_tables(reports_table, last_reports_table, station: str) -> list[dict]:
+def fill_tables(
+        reports_table,
+        last_reports_table,
+        station: str,
+        report_counts_table=None
+) -> list[dict]:
     """ Fill the DynamoDB tables for testing."""
     reports = [
         {"station": station, "date": "2023-02-22T16:20:00", "battery": 45.0, "panel": 68.0},
@@ -89,6 +195,13 @@ def fill_tables(reports_table, last_reports_table, station: str) -> list[dict]:
                 "date": rep["date"],
                 "battery": Decimal(rep["battery"]),
                 "panel": Decimal(rep["panel"]),
+                "fleet": FLEET_PARTITION,
+            })
+        if report_counts_table is not None:
+            report_counts_table.put_item(Item={
+                "station": rep["station"],
+                "day": rep["date"][:10],
+                "count": 1,
             })
 
     return reports
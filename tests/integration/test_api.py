@@ -48,6 +48,7 @@ def dynamo_db_tables(api_host) -> tuple:
         ddb_resource = boto3.resource("dynamodb")
         reports_table = ddb_resource.Table(reports_tn)
         last_table = ddb_resource.Table(last_reports_tn)
+        counts_table = ddb_resource.Table("voltage-dev-ReportCountsTable")
     else:
         wait_for("http://localhost:8000", "Local DynamoDB")
         reports_tn = "VoltageReportsTableLocal"
@@ -55,8 +56,10 @@ def dynamo_db_tables(api_host) -> tuple:
         ddb_resource = boto3.resource("dynamodb", endpoint_url="http://localhost:8000")
         reports_table = create_table_if_not_exist(ddb_resource, reports_tn, api_host)
         last_table = create_table_if_not_exist(ddb_resource, last_reports_tn, api_host)
+        counts_table = create_table_if_not_exist(
+            ddb_resource, "VoltageReportCountsLocal", api_host)
 
-    return reports_table, last_table
+    return reports_table, last_table, counts_table
 
 
 class TestApiGateway:
@@ -78,11 +81,11 @@ class TestApiGateway:
     def dynamo_db(self, dynamo_db_tables) -> None:
         """ Put sample test data in dynamo db and erase it after the tests end.
         """
-        reports_table, last_table = dynamo_db_tables
+        reports_table, last_table, counts_table = dynamo_db_tables
         report_count = reports_table.item_count
         last_count = last_table.item_count
 
-        reports = fill_tables(reports_table, last_table, self.station)
+        reports = fill_tables(reports_table, last_table, self.station, counts_table)
         print(f"Items in reports table {reports_table.item_count}")
         print(f"Items in last reports table {last_table.item_count}")
 
@@ -93,6 +96,10 @@ class TestApiGateway:
                 "station": rep["station"],
                 "date": rep["date"]
             })
+            counts_table.delete_item(Key={
+                "station": rep["station"],
+                "day": rep["date"][:10]
+            })
             if ii > 0:
                 last_table.delete_item(Key={"station": rep["station"]})
 
@@ -127,12 +134,13 @@ class TestAddNewReport(TestApiGateway):
 
     @pytest.fixture
     def clean_up_db(self, dynamo_db_tables):
-        reports_t, last_reports_t = dynamo_db_tables
+        reports_t, last_reports_t, counts_t = dynamo_db_tables
         yield
 
         date = datetime(2023, 2, 22, 16, 20, 0).isoformat()
         reports_t.delete_item(Key={"station": self.new_station, "date": date})
         last_reports_t.delete_item(Key={"station": self.new_station})
+        counts_t.delete_item(Key={"station": self.new_station, "day": date[:10]})
 
     @pytest.mark.usefixtures("clean_up_db")
     def test_add_new_report_happy_path(self) -> None:
@@ -150,7 +158,7 @@ class TestAddNewReport(TestApiGateway):
 
     @pytest.fixture
     def clear_reports(self, dynamo_db_tables):
-        reports_t, last_reports_t = dynamo_db_tables
+        reports_t, last_reports_t, counts_t = dynamo_db_tables
         yield reports_t, last_reports_t
 
         date1 = datetime(2023, 2, 22, 16, 20, 0)
@@ -158,6 +166,8 @@ class TestAddNewReport(TestApiGateway):
         reports_t.delete_item(Key={"station": self.new_station, "date": date1.isoformat()})
         reports_t.delete_item(Key={"station": self.new_station, "date": date2.isoformat()})
         last_reports_t.delete_item(Key={"station": self.new_station})
+        counts_t.delete_item(Key={"station": self.new_station, "day": date1.date().isoformat()})
+        counts_t.delete_item(Key={"station": self.new_station, "day": date2.date().isoformat()})
 
     def test_last_reports_are_updated(self, clear_reports):
         date1 = datetime(2023, 2, 22, 16, 20, 0)
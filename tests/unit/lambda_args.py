@@ -1,11 +1,16 @@
+import itertools
 import json
 from typing import Optional
 
+# Sequence numbers of the stream records, 21 digits as the shortest of DynamoDB
+stream_sequence = itertools.count(100000000000000000000)
+
 
 def generate_event(
         path_params: Optional[dict[str, str]] = None,
         query_string_params: Optional[dict[str, str]] = None,
-        body: Optional[str | dict] = None
+        body: Optional[str | dict] = None,
+        headers: Optional[dict[str, str]] = None
 ) -> dict:
     """ Generate an event for testing lambda functions.
     """
@@ -23,7 +28,8 @@ def generate_event(
         ],
         "headers": {
             "Header1": "value1",
-            "Header2": "value1,value2"
+            "Header2": "value1,value2",
+            **(headers or {})
         },
         "queryStringParameters": query_string_params,
         "requestContext": {
@@ -70,7 +76,7 @@ def generate_event(
         },
         "body": body,
         "pathParameters": path_params,
-        "isBase64Encoded": True,
+        "isBase64Encoded": False,
         "stageVariables": {
             "stageVariable1": "value1",
             "stageVariable2": "value2"
@@ -126,3 +132,39 @@ def get_context() -> FakeLambdaContext:
         custom={"key1": "value1", "key2": "value2"},
         env={"AWS_EXECUTION_ENV": "AWS_Lambda_python3.8"},
     )
+
+
+def generate_stream_event(reports: list[dict], event_name: str = "INSERT") -> dict:
+    """ Generate a DynamoDB stream event with the new images of the given
+        reports for testing stream consumers.
+
+        The sequence numbers keep growing across events, as in a stream.
+    """
+    records = []
+    for ii, rep in enumerate(reports):
+        sequence = next(stream_sequence)
+        records.append({
+            "eventID": f"{ii:032x}",
+            "eventName": event_name,
+            "eventVersion": "1.1",
+            "eventSource": "aws:dynamodb",
+            "awsRegion": "us-east-2",
+            "dynamodb": {
+                "ApproximateCreationDateTime": 1677169200,
+                "Keys": {
+                    "station": {"S": rep["station"]},
+                    "date": {"S": rep["date"]},
+                },
+                "NewImage": {
+                    "station": {"S": rep["station"]},
+                    "date": {"S": rep["date"]},
+                    "battery": {"N": str(rep["battery"])},
+                    "panel": {"N": str(rep["panel"])},
+                },
+                "SequenceNumber": str(sequence),
+                "SizeBytes": 80,
+                "StreamViewType": "NEW_IMAGE",
+            },
+            "eventSourceARN": "arn:aws:dynamodb:us-east-2:123456789012:table/ReportsTable/stream/2023-02-23T00:00:00.000",
+        })
+    return {"Records": records}
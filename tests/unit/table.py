@@ -1,2 +1,4 @@
 REPORTS_TABLE_NAME = "test_reports_table"
 LAST_REPORTS_TABLE_NAME = "test_last_reports_table"
+REPORT_COUNTS_TABLE_NAME = "test_report_counts_table"
+ROLLUPS_TABLE_NAME = "test_rollups_table"
@@ -0,0 +1,65 @@
+from decimal import Decimal
+import json
+import os
+from typing import Callable
+
+import boto3
+import pytest
+
+from .lambda_args import generate_event, get_context
+from tests.unit.table import LAST_REPORTS_TABLE_NAME
+
+# Set the table name variable before importing lambda function to avoid raising an error
+os.environ["LAST_REPORTS_TABLE"] = LAST_REPORTS_TABLE_NAME
+
+
+class TestAlerts:
+    """ Class for unit testing the lambda function that returns the
+        stations with an active alert.
+    """
+
+    @staticmethod
+    def get_handler() -> Callable:
+        """ Returns the lambda handler.
+
+            Handler is imported here to make sure boto3 gets mocked
+        """
+        from src.alerts.alerts import lambda_handler
+        return lambda_handler
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_no_alerts(self):
+        handler = self.get_handler()
+        lambda_output = handler(generate_event(), get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert data["alerts"] == []
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_active_alerts(self):
+        last_reports_tb = boto3.resource("dynamodb").Table(LAST_REPORTS_TABLE_NAME)
+        last_reports_tb.put_item(Item={
+            "station": "Tonalapa",
+            "date": "2023-02-23T16:20:00",
+            "battery": Decimal("5"),
+            "panel": Decimal("150"),
+            "alert": "low_battery",
+            "alert_since": "2023-02-22T16:20:00",
+        })
+
+        handler = self.get_handler()
+        lambda_output = handler(generate_event(), get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert data["alerts"] == [
+            {
+                "station": "Tonalapa",
+                "alert": "low_battery",
+                "since": "2023-02-22T16:20:00",
+                "date": "2023-02-23T16:20:00",
+                "battery": 5.0,
+                "panel": 150.0,
+            }
+        ]
@@ -3,6 +3,7 @@ import os
 from typing import Callable
 
 from aws_lambda_powertools.utilities.validation import validate
+import boto3
 import pytest
 
 from .lambda_args import generate_event, get_context
@@ -27,6 +28,12 @@ class TestListReports:
         from src.last_report.last_report import lambda_handler
         return lambda_handler
 
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        yield
+        from src.last_report.last_report import cache
+        cache.clear()
+
     @pytest.mark.usefixtures("mock_dynamo_db")
     def test_station_last_report_happy_path(self, station_fixture):
         station = station_fixture
@@ -41,6 +48,24 @@ class TestListReports:
            "station": station, "date": "2023-02-23T16:20:00", "battery": 55.0, "panel": 60.0
         }
 
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_last_report_is_cached(self, station_fixture):
+        from src.last_report.last_report import cache
+
+        handler = self.get_handler()
+        event = generate_event({"station": station_fixture})
+        lambda_output = handler(event, get_context())
+        assert lambda_output["statusCode"] == 200
+
+        # The second request does not need to read DynamoDB
+        last_reports_tb = boto3.resource("dynamodb").Table(LAST_REPORTS_TABLE_NAME)
+        last_reports_tb.delete_item(Key={"station": station_fixture})
+        cached_output = handler(event, get_context())
+
+        assert cached_output == lambda_output
+        assert cache.hits == 1
+        assert cache.misses == 1
+
     @pytest.mark.usefixtures("mock_dynamo_db")
     def test_station_not_found(self):
         handler = self.get_handler()
@@ -66,6 +91,40 @@ class TestListReports:
         assert data["message"] == "Need to pass a station"
 
 
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_not_modified(self, station_fixture):
+        handler = self.get_handler()
+        lambda_output = handler(generate_event({"station": station_fixture}), get_context())
+        etag = lambda_output["headers"]["ETag"]
+        last_modified = lambda_output["headers"]["Last-Modified"]
+        assert last_modified == "Thu, 23 Feb 2023 16:20:00 GMT"
+
+        for headers in [{"If-None-Match": etag}, {"if-modified-since": last_modified}]:
+            event = generate_event({"station": station_fixture}, headers=headers)
+            lambda_output = handler(event, get_context())
+            assert lambda_output["statusCode"] == 304
+            assert lambda_output["body"] == ""
+            assert lambda_output["headers"]["ETag"] == etag
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_modified(self, station_fixture):
+        handler = self.get_handler()
+        headers = {
+            "If-None-Match": '"0123456789abcdef"',
+            "If-Modified-Since": "Thu, 23 Feb 2023 16:20:00 GMT",
+        }
+        event = generate_event({"station": station_fixture}, headers=headers)
+        lambda_output = handler(event, get_context())
+        # If-Modified-Since is ignored when the request has If-None-Match
+        assert lambda_output["statusCode"] == 200
+
+        event = generate_event(
+            {"station": station_fixture},
+            headers={"If-Modified-Since": "Wed, 22 Feb 2023 16:20:00 GMT"}
+        )
+        lambda_output = handler(event, get_context())
+        assert lambda_output["statusCode"] == 200
+
 def test_schema_validation():
     event = {
         "statusCode": 200,
@@ -76,3 +135,4 @@ def test_schema_validation():
         }),
     }
     validate(event, schema=OUTPUT_SCHEMA)  # should not raise
+
@@ -1,3 +1,4 @@
+from decimal import Decimal
 import json
 import os
 from typing import Callable
@@ -28,6 +29,12 @@ class TestListReports:
         from src.list_last.list_last import lambda_handler
         return lambda_handler
 
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        yield
+        from src.list_last.list_last import cache
+        cache.clear()
+
     @pytest.mark.usefixtures("mock_dynamo_db")
     def test_last_reports_happy_path(self, station_fixture):
         handler = self.get_handler()
@@ -39,8 +46,8 @@ class TestListReports:
 
         assert lambda_output["statusCode"] == 200
         assert data["reports"] == [
-            {"station": station_fixture, "date": "2023-02-23T16:20:00", "battery": 55.0, "panel": 60.0},
             {"station": "Piedra Grande", "date": "2023-02-22T16:20:00", "battery": 34.0, "panel": 40.0},
+            {"station": station_fixture, "date": "2023-02-23T16:20:00", "battery": 55.0, "panel": 60.0},
         ]
 
     @pytest.fixture
@@ -62,3 +69,98 @@ class TestListReports:
 
         assert lambda_output["statusCode"] == 200
         assert len(data["reports"]) == 0
+
+    def test_all_segments_are_merged(self, last_reports_table):
+        last_reports_tb = boto3.resource("dynamodb").Table(LAST_REPORTS_TABLE_NAME)
+        stations = [f"Station {ii:03d}" for ii in range(120)]
+        with last_reports_tb.batch_writer() as batch:
+            for station in stations:
+                batch.put_item(Item={
+                    "station": station,
+                    "date": "2023-02-23T16:20:00",
+                    "battery": Decimal("55.0"),
+                    "panel": Decimal("60.0"),
+                })
+
+        handler = self.get_handler()
+        lambda_output = handler(generate_event(), get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert [rep["station"] for rep in data["reports"]] == stations
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_last_reports_of_stations(self, station_fixture):
+        handler = self.get_handler()
+        event = generate_event(query_string_params={"stations": f"{station_fixture}, Caracol,"})
+
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert data["reports"] == {
+            station_fixture: {
+                "station": station_fixture, "date": "2023-02-23T16:20:00", "battery": 55.0, "panel": 60.0
+            },
+        }
+
+    def test_last_reports_of_many_stations(self, last_reports_table):
+        last_reports_tb = boto3.resource("dynamodb").Table(LAST_REPORTS_TABLE_NAME)
+        stations = [f"Station {ii:03d}" for ii in range(250)]
+        with last_reports_tb.batch_writer() as batch:
+            for station in stations:
+                batch.put_item(Item={
+                    "station": station,
+                    "date": "2023-02-23T16:20:00",
+                    "battery": Decimal("55.0"),
+                    "panel": Decimal("60.0"),
+                })
+
+        handler = self.get_handler()
+        requested = stations[::2]
+        event = generate_event(query_string_params={"stations": ",".join(requested)})
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert sorted(data["reports"]) == requested
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_not_modified_without_reading_the_table(self, station_fixture):
+        handler = self.get_handler()
+        lambda_output = handler(generate_event(), get_context())
+        etag = lambda_output["headers"]["ETag"]
+
+        from src.list_last.list_last import cache
+        misses = cache.misses
+        event = generate_event(headers={"If-None-Match": etag})
+        lambda_output = handler(event, get_context())
+
+        assert lambda_output["statusCode"] == 304
+        assert cache.misses == misses
+
+    def test_modified_when_a_station_in_the_middle_changes(self, last_reports_table):
+        last_reports_tb = boto3.resource("dynamodb").Table(LAST_REPORTS_TABLE_NAME)
+        dates = ["2023-02-21T16:20:00", "2023-02-22T16:20:00", "2023-02-23T16:20:00"]
+        for ii, date in enumerate(dates):
+            last_reports_tb.put_item(Item={
+                "station": f"Station {ii}", "date": date, "battery": Decimal("55.0"), "panel": Decimal("60.0"),
+            })
+
+        handler = self.get_handler()
+        lambda_output = handler(generate_event(), get_context())
+        etag = lambda_output["headers"]["ETag"]
+
+        # Neither the newest nor the oldest report, nor the number of reports change
+        last_reports_tb.put_item(Item={
+            "station": "Station 1", "date": "2023-02-22T16:30:00", "battery": Decimal("4.0"), "panel": Decimal("60.0"),
+        })
+        from src.list_last.list_last import cache
+        cache.clear()
+        event = generate_event(headers={"If-None-Match": etag})
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert lambda_output["headers"]["ETag"] != etag
+        assert data["reports"][1]["battery"] == 4.0
@@ -1,7 +1,11 @@
+import base64
+from decimal import Decimal
+import gzip
 import json
 import os
 from typing import Callable
 
+import boto3
 import pytest
 
 from .lambda_args import generate_event, get_context
@@ -75,3 +79,244 @@ class TestListReports:
         assert data["reports"] == [
             {"station": station_fixture, "date": "2023-02-23T16:20:00", "battery": 55.0, "panel": 60.0},
         ]
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_get_reports_in_date_range(self, station_fixture):
+        handler = self.get_handler()
+        event = generate_event(
+            path_params={"station": station_fixture},
+            query_string_params={
+                "start_date": "2023-02-22T00:00:00",
+                "end_date": "2023-02-22T23:59:59",
+            }
+        )
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert data["reports"] == [
+            {"station": station_fixture, "date": "2023-02-22T16:20:00", "battery": 45.0, "panel": 68.0},
+        ]
+        assert data["nextKey"] is None
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_paginate_reports(self, station_fixture):
+        handler = self.get_handler()
+        event = generate_event(
+            path_params={"station": station_fixture},
+            query_string_params={"limit": "1"}
+        )
+        lambda_output = handler(event, get_context())
+        first_page = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert [rep["date"] for rep in first_page["reports"]] == ["2023-02-23T16:20:00"]
+        assert first_page["nextKey"] is not None
+
+        event = generate_event(
+            path_params={"station": station_fixture},
+            query_string_params={"limit": "1", "next_key": first_page["nextKey"]}
+        )
+        lambda_output = handler(event, get_context())
+        second_page = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert [rep["date"] for rep in second_page["reports"]] == ["2023-02-22T16:20:00"]
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    @pytest.mark.parametrize("params", [
+        {"limit": "0"},
+        {"limit": "ten"},
+        {"next_key": "not a cursor"},
+        # A cursor of another station
+        {"next_key": "UGllZHJhIEdyYW5kZQoyMDIzLTAyLTIyVDE2OjIwOjAw"},
+    ])
+    def test_invalid_pagination_parameters(self, station_fixture, params):
+        handler = self.get_handler()
+        event = generate_event(
+            path_params={"station": station_fixture},
+            query_string_params=params
+        )
+        lambda_output = handler(event, get_context())
+        assert lambda_output["statusCode"] == 400
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_get_reports_of_stations(self, station_fixture):
+        handler = self.get_handler()
+        event = generate_event(
+            query_string_params={
+                "stations": f"{station_fixture},Piedra Grande,Caracol",
+                "start_date": "2023-02-22T00:00:00",
+                "end_date": "2023-02-22T23:59:59",
+            }
+        )
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert data["reports"] == {
+            station_fixture: [
+                {"station": station_fixture, "date": "2023-02-22T16:20:00", "battery": 45.0, "panel": 68.0},
+            ],
+            "Piedra Grande": [
+                {"station": "Piedra Grande", "date": "2023-02-22T16:20:00", "battery": 34.0, "panel": 40.0},
+            ],
+            "Caracol": [],
+        }
+        assert data["nextKeys"] == {station_fixture: None, "Piedra Grande": None, "Caracol": None}
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_paginate_reports_of_stations(self, station_fixture):
+        handler = self.get_handler()
+        stations = f"{station_fixture},Piedra Grande"
+        event = generate_event(query_string_params={"stations": stations, "limit": "1"})
+        lambda_output = handler(event, get_context())
+        first_page = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert [rep["date"] for rep in first_page["reports"][station_fixture]] == ["2023-02-23T16:20:00"]
+        assert first_page["nextKeys"][station_fixture] is not None
+
+        next_keys = ",".join(key for key in first_page["nextKeys"].values() if key)
+        event = generate_event(
+            query_string_params={"stations": stations, "limit": "1", "next_keys": next_keys}
+        )
+        lambda_output = handler(event, get_context())
+        second_page = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert [rep["date"] for rep in second_page["reports"][station_fixture]] == ["2023-02-22T16:20:00"]
+        # The stations exhausted in the first page are not queried again
+        exhausted = [station for station, key in first_page["nextKeys"].items() if key is None]
+        assert all(station not in second_page["reports"] for station in exhausted)
+
+        # Every report is returned once when following the cursors to the end
+        returned = [
+            (station, rep["date"])
+            for page in (first_page, second_page) for station, reports in page["reports"].items()
+            for rep in reports
+        ]
+        page = second_page
+        while any(page["nextKeys"].values()):
+            next_keys = ",".join(key for key in page["nextKeys"].values() if key)
+            event = generate_event(
+                query_string_params={"stations": stations, "limit": "1", "next_keys": next_keys}
+            )
+            page = json.loads(handler(event, get_context())["body"])
+            returned += [
+                (station, rep["date"]) for station, reports in page["reports"].items() for rep in reports
+            ]
+        assert sorted(returned) == [
+            ("Piedra Grande", "2023-02-22T16:20:00"),
+            (station_fixture, "2023-02-22T16:20:00"),
+            (station_fixture, "2023-02-23T16:20:00"),
+        ]
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_too_many_stations(self):
+        handler = self.get_handler()
+        stations = ",".join(f"Station {ii}" for ii in range(51))
+        event = generate_event(query_string_params={"stations": stations})
+        lambda_output = handler(event, get_context())
+        assert lambda_output["statusCode"] == 400
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_reports_not_modified(self, station_fixture):
+        handler = self.get_handler()
+        event = generate_event(path_params={"station": station_fixture})
+        lambda_output = handler(event, get_context())
+        etag = lambda_output["headers"]["ETag"]
+        # The same body is sent with any content encoding
+        assert etag.startswith("W/")
+
+        for if_none_match in [etag, etag.removeprefix("W/")]:
+            event = generate_event(
+                path_params={"station": station_fixture},
+                headers={"If-None-Match": if_none_match, "Accept-Encoding": "gzip"}
+            )
+            lambda_output = handler(event, get_context())
+            assert lambda_output["statusCode"] == 304
+            assert lambda_output["headers"]["Vary"] == "Accept-Encoding"
+
+        # Another page has another ETag
+        event = generate_event(
+            path_params={"station": station_fixture},
+            query_string_params={"limit": "1"},
+            headers={"If-None-Match": etag}
+        )
+        lambda_output = handler(event, get_context())
+        assert lambda_output["statusCode"] == 200
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_reports_modified_when_a_report_is_corrected(self, station_fixture):
+        handler = self.get_handler()
+        event = generate_event(path_params={"station": station_fixture})
+        etag = handler(event, get_context())["headers"]["ETag"]
+
+        boto3.resource("dynamodb").Table(REPORTS_TABLE_NAME).put_item(Item={
+            "station": station_fixture, "date": "2023-02-22T16:20:00", "battery": Decimal("46.0"), "panel": Decimal("68.0"),
+        })
+        event = generate_event(path_params={"station": station_fixture}, headers={"If-None-Match": etag})
+        lambda_output = handler(event, get_context())
+        assert lambda_output["statusCode"] == 200
+        assert lambda_output["headers"]["ETag"] != etag
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_large_pages_are_compressed(self, station_fixture, monkeypatch):
+        from src.layers.voltage_common.voltage_common import compression
+        monkeypatch.setattr(compression, "COMPRESSION_THRESHOLD", 10)
+        handler = self.get_handler()
+        event = generate_event(
+            path_params={"station": station_fixture},
+            headers={"Accept-Encoding": "gzip"}
+        )
+        lambda_output = handler(event, get_context())
+
+        assert lambda_output["statusCode"] == 200
+        assert lambda_output["isBase64Encoded"] is True
+        data = json.loads(gzip.decompress(base64.b64decode(lambda_output["body"])))
+        assert len(data["reports"]) == 2
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_get_reports_in_columns(self, station_fixture):
+        handler = self.get_handler()
+        event = generate_event(
+            path_params={"station": station_fixture},
+            query_string_params={"format": "columnar"}
+        )
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert data["reports"] == {
+            "date": ["2023-02-23T16:20:00", "2023-02-22T16:20:00"],
+            "battery": [55.0, 45.0],
+            "panel": [60.0, 68.0],
+        }
+        assert data["nextKey"] is None
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_get_reports_of_stations_in_columns(self, station_fixture):
+        handler = self.get_handler()
+        event = generate_event(
+            query_string_params={"stations": f"{station_fixture},Piedra Grande", "format": "columnar"}
+        )
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert data["reports"]["Piedra Grande"] == {
+            "date": ["2023-02-22T16:20:00"],
+            "battery": [34.0],
+            "panel": [40.0],
+        }
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_invalid_format(self, station_fixture):
+        handler = self.get_handler()
+        event = generate_event(
+            path_params={"station": station_fixture},
+            query_string_params={"format": "csv"}
+        )
+        lambda_output = handler(event, get_context())
+        assert lambda_output["statusCode"] == 400
@@ -1,4 +1,5 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from decimal import Decimal
 import json
 import os
 from typing import Callable
@@ -8,11 +9,16 @@ from boto3.dynamodb.conditions import Key
 import pytest
 
 from .lambda_args import generate_event, get_context
-from tests.unit.table import REPORTS_TABLE_NAME, LAST_REPORTS_TABLE_NAME
+from tests.unit.table import (
+    REPORTS_TABLE_NAME,
+    LAST_REPORTS_TABLE_NAME,
+    REPORT_COUNTS_TABLE_NAME,
+)
 
 # Set the table name variable before importing lambda function to avoid raising an error
 os.environ["REPORTS_TABLE"] = REPORTS_TABLE_NAME
 os.environ["LAST_REPORTS_TABLE"] = LAST_REPORTS_TABLE_NAME
+os.environ["REPORT_COUNTS_TABLE"] = REPORT_COUNTS_TABLE_NAME
 
 
 class TestAddNewReport:
@@ -103,9 +109,145 @@ class TestAddNewReport:
             "station": station,
             "date": date2.isoformat(),
             "battery": 50.0,
-            "panel": 30.0
+            "panel": 30.0,
+            "fleet": "all"
         }
 
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_late_reports_do_not_replace_last_report(self, capsys):
+        import src.new_report.new_report as new_report
+        station = "Caracol"
+        newer = datetime(2023, 3, 22, 16, 20, 0)
+        older = datetime(2023, 2, 22, 16, 20, 0)
+        handler = self.get_handler()
+        context = get_context()
+        skipped = new_report.skipped_late_reports
+
+        for date, battery in [(newer, 50.0), (older, 20.0)]:
+            event = generate_event(body={
+                "station": station,
+                "date": date.strftime("%Y/%m/%d,%H:%M:%S"),
+                "battery": battery,
+                "panel": 15.5
+            })
+            assert handler(event, context)["statusCode"] == 201
+
+        last_reports_tb = boto3.resource("dynamodb").Table(LAST_REPORTS_TABLE_NAME)
+        report = last_reports_tb.get_item(Key={"station": station})["Item"]
+        assert report["date"] == newer.isoformat()
+        assert report["battery"] == 50
+        assert new_report.skipped_late_reports == skipped + 1
+        assert '"SkippedLateReports": 1' in capsys.readouterr().out
+
+        # The late report is still stored in the history
+        reports_tb = boto3.resource("dynamodb").Table(REPORTS_TABLE_NAME)
+        ddb_res = reports_tb.query(KeyConditionExpression=Key("station").eq(station))
+        assert len(ddb_res["Items"]) == 2
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_report_counts_are_updated(self):
+        station = "Caracol"
+        dates = [
+            datetime(2023, 2, 22, 4, 20, 0),
+            datetime(2023, 2, 22, 16, 20, 0),
+            datetime(2023, 2, 23, 4, 20, 0),
+        ]
+        handler = self.get_handler()
+        context = get_context()
+        for date in dates:
+            event = generate_event(body={
+                "station": station,
+                "date": date.strftime("%Y/%m/%d,%H:%M:%S"),
+                "battery": 20.0,
+                "panel": 15.5
+            })
+            assert handler(event, context)["statusCode"] == 201
+
+        # Sending a report again does not change the counts
+        assert handler(event, context)["statusCode"] == 201
+
+        counts_tb = boto3.resource("dynamodb").Table(REPORT_COUNTS_TABLE_NAME)
+        ddb_res = counts_tb.query(KeyConditionExpression=Key("station").eq(station))
+        assert ddb_res["Items"] == [
+            {"station": station, "day": "2023-02-22", "count": 2},
+            {"station": station, "day": "2023-02-23", "count": 1},
+        ]
+
+    @pytest.mark.parametrize("mode", ["sequential", "transaction", "concurrent"])
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_ingest_write_modes(self, mode, monkeypatch):
+        import src.new_report.new_report as new_report
+        monkeypatch.setattr(new_report, "ingest_write_mode", mode)
+        station = "Caracol"
+        handler = self.get_handler()
+        context = get_context()
+        skipped = new_report.skipped_late_reports
+
+        # A new report, the same report sent again and a late report
+        for date, battery in [
+            (datetime(2023, 3, 22, 16, 20, 0), 50.0),
+            (datetime(2023, 3, 22, 16, 20, 0), 50.0),
+            (datetime(2023, 3, 21, 16, 20, 0), 20.0),
+        ]:
+            event = generate_event(body={
+                "station": station,
+                "date": date.strftime("%Y/%m/%d,%H:%M:%S"),
+                "battery": battery,
+                "panel": 15.5
+            })
+            assert handler(event, context)["statusCode"] == 201
+
+        ddb_resource = boto3.resource("dynamodb")
+        reports_tb = ddb_resource.Table(REPORTS_TABLE_NAME)
+        ddb_res = reports_tb.query(KeyConditionExpression=Key("station").eq(station))
+        assert [rep["date"] for rep in ddb_res["Items"]] == ["2023-03-21T16:20:00", "2023-03-22T16:20:00"]
+
+        last_reports_tb = ddb_resource.Table(LAST_REPORTS_TABLE_NAME)
+        report = last_reports_tb.get_item(Key={"station": station})["Item"]
+        assert report["date"] == "2023-03-22T16:20:00"
+        assert report["battery"] == 50
+        # The report sent again is not late, its date is not older
+        assert new_report.skipped_late_reports == skipped + 1
+
+        counts_tb = ddb_resource.Table(REPORT_COUNTS_TABLE_NAME)
+        ddb_res = counts_tb.query(KeyConditionExpression=Key("station").eq(station))
+        assert ddb_res["Items"] == [
+            {"station": station, "day": "2023-03-21", "count": 1},
+            {"station": station, "day": "2023-03-22", "count": 1},
+        ]
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_low_battery_alert_with_hysteresis(self):
+        from src.alerts.alerts import lambda_handler as alerts_handler
+        station = "Caracol"
+        handler = self.get_handler()
+        context = get_context()
+        last_reports_tb = boto3.resource("dynamodb").Table(LAST_REPORTS_TABLE_NAME)
+
+        # Default threshold of 10 V with a hysteresis of 0.5 V
+        expected_alerts = [
+            (datetime(2023, 2, 22, 4, 20, 0), 9.5, True),
+            (datetime(2023, 2, 22, 16, 20, 0), 8.0, True),
+            (datetime(2023, 2, 23, 4, 20, 0), 10.2, True),
+            (datetime(2023, 2, 23, 16, 20, 0), 10.5, False),
+        ]
+        for date, battery, has_alert in expected_alerts:
+            event = generate_event(body={
+                "station": station,
+                "date": date.strftime("%Y/%m/%d,%H:%M:%S"),
+                "battery": battery,
+                "panel": 15.5
+            })
+            assert handler(event, context)["statusCode"] == 201
+
+            item = last_reports_tb.get_item(Key={"station": station})["Item"]
+            assert ("alert" in item) == has_alert, f"Alert after a battery of {battery}"
+            alerts = json.loads(alerts_handler(generate_event(), context)["body"])["alerts"]
+            assert [alert["station"] for alert in alerts] == ([station] if has_alert else [])
+            if has_alert:
+                # The alert keeps the date of the report that raised it
+                assert item["alert_since"] == "2023-02-22T04:20:00"
+
     @pytest.mark.usefixtures("mock_dynamo_db")
     def test_event_with_no_body(self):
         handler = self.get_handler()
@@ -118,6 +260,42 @@ class TestAddNewReport:
         assert lambda_output["statusCode"] == 400
         assert data["message"] == "Need to pass the body with the new report parameters"
 
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_iso_and_epoch_dates(self):
+        handler = self.get_handler()
+        context = get_context()
+        for date in ["2023-02-22T10:20:00-06:00", 1677082800]:
+            event = generate_event(body={"station": "Caracol", "date": date, "battery": 20.0, "panel": 15.5})
+            lambda_output = handler(event, context)
+            assert lambda_output["statusCode"] == 201
+            assert json.loads(lambda_output["body"])["date"] == "2023-02-22T16:20:00"
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_invalid_date(self):
+        handler = self.get_handler()
+        event = generate_event(body={"station": "Caracol", "date": "2023/02/30,16:20:00", "battery": 20.0, "panel": 15.5})
+
+        lambda_output = handler(event, get_context())
+
+        assert lambda_output["statusCode"] == 400
+        assert json.loads(lambda_output["body"])["message"] == "Invalid report date"
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    @pytest.mark.parametrize("values", [
+        {"battery": "twenty"},
+        {"panel": [15.5]},
+        {"station": 42},
+    ])
+    def test_invalid_report_values(self, values):
+        handler = self.get_handler()
+        report = {"station": "Caracol", "date": "2023/02/22,16:20:00", "battery": 20.0, "panel": 15.5}
+        event = generate_event(body={**report, **values})
+
+        lambda_output = handler(event, get_context())
+
+        assert lambda_output["statusCode"] == 400
+        assert json.loads(lambda_output["body"])["message"] == "Invalid report values"
+
     @pytest.mark.usefixtures("mock_dynamo_db")
     def test_incomplete_report_parameters(self):
         handler = self.get_handler()
@@ -131,3 +309,141 @@ class TestAddNewReport:
         assert lambda_output["statusCode"] == 400
         msg = data["message"]
         assert msg == "The new report must include station, date, report and panel attributes"
+
+
+class TestAddReportsBatch:
+    """ Class for unit testing the lambda function that adds a batch
+        of reports.
+    """
+    @staticmethod
+    def get_handler() -> Callable:
+        """ Returns the lambda handler.
+
+            Handler is imported here to make sure boto3 gets mocked
+        """
+        from src.new_report.new_report import batch_handler
+        return batch_handler
+
+    @staticmethod
+    def generate_reports(station: str, n_reports: int) -> list[dict]:
+        start = datetime(2023, 2, 1, 0, 0, 0)
+        return [
+            {
+                "station": station,
+                "date": (start + timedelta(hours=12 * ii)).strftime("%Y/%m/%d,%H:%M:%S"),
+                "battery": 20.0 + ii,
+                "panel": 15.5
+            }
+            for ii in range(n_reports)
+        ]
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_add_reports_batch_happy_path(self):
+        reports = self.generate_reports("Caracol", 40) + self.generate_reports("Tonalapa", 30)
+        # Reports don't need to be sorted by date
+        reports.reverse()
+
+        handler = self.get_handler()
+        lambda_output = handler(generate_event(body={"reports": reports}), get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 201
+        assert data == {"reports": 70, "stations": ["Caracol", "Tonalapa"]}
+
+        ddb_resource = boto3.resource("dynamodb")
+        reports_tb = ddb_resource.Table(REPORTS_TABLE_NAME)
+        last_reports_tb = ddb_resource.Table(LAST_REPORTS_TABLE_NAME)
+
+        ddb_res = reports_tb.query(KeyConditionExpression=Key("station").eq("Caracol"))
+        assert len(ddb_res["Items"]) == 40
+        ddb_res = reports_tb.query(KeyConditionExpression=Key("station").eq("Tonalapa"))
+        assert len(ddb_res["Items"]) == 30
+
+        last_report = last_reports_tb.get_item(Key={"station": "Caracol"})["Item"]
+        assert last_report == {
+            "station": "Caracol",
+            "date": datetime(2023, 2, 20, 12, 0, 0).isoformat(),
+            "battery": 59,
+            "panel": Decimal("15.5"),
+            "fleet": "all"
+        }
+
+        counts_tb = ddb_resource.Table(REPORT_COUNTS_TABLE_NAME)
+        ddb_res = counts_tb.query(KeyConditionExpression=Key("station").eq("Tonalapa"))
+        assert len(ddb_res["Items"]) == 15
+        assert all(cnt["count"] == 2 for cnt in ddb_res["Items"])
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_batch_sent_again_is_not_counted_twice(self):
+        import src.new_report.new_report as new_report
+        reports = self.generate_reports("Caracol", 5)
+
+        handler = self.get_handler()
+        skipped = new_report.skipped_late_reports
+        for _ in range(2):
+            lambda_output = handler(generate_event(body={"reports": reports}), get_context())
+            assert lambda_output["statusCode"] == 201
+        # Nor are its reports late
+        assert new_report.skipped_late_reports == skipped
+
+        counts_tb = boto3.resource("dynamodb").Table(REPORT_COUNTS_TABLE_NAME)
+        ddb_res = counts_tb.query(KeyConditionExpression=Key("station").eq("Caracol"))
+        assert sum(cnt["count"] for cnt in ddb_res["Items"]) == 5
+
+        # A batch with a single new report only counts that one
+        reports.append(self.generate_reports("Caracol", 6)[-1])
+        lambda_output = handler(generate_event(body={"reports": reports}), get_context())
+        assert lambda_output["statusCode"] == 201
+        ddb_res = counts_tb.query(KeyConditionExpression=Key("station").eq("Caracol"))
+        assert sum(cnt["count"] for cnt in ddb_res["Items"]) == 6
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_empty_batch(self):
+        handler = self.get_handler()
+        lambda_output = handler(generate_event(body={"reports": []}), get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 400
+        assert data["message"] == "The body must include a non empty list of reports"
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_batch_with_incomplete_report(self):
+        reports = self.generate_reports("Caracol", 3)
+        del reports[1]["panel"]
+
+        handler = self.get_handler()
+        lambda_output = handler(generate_event(body={"reports": reports}), get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 400
+        msg = data["message"]
+        assert msg == "Every report must include station, date, report and panel attributes"
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    @pytest.mark.parametrize("values, message", [
+        ({"date": "2023/02/30,16:20:00"}, "Invalid report date"),
+        ({"battery": "twenty"}, "Invalid report values"),
+        ({"station": ["Caracol"]}, "Invalid report values"),
+    ])
+    def test_batch_with_invalid_report(self, values, message):
+        reports = self.generate_reports("Caracol", 3)
+        reports[1].update(values)
+
+        handler = self.get_handler()
+        lambda_output = handler(generate_event(body={"reports": reports}), get_context())
+
+        assert lambda_output["statusCode"] == 400
+        assert json.loads(lambda_output["body"])["message"] == message
+
+
+@pytest.mark.parametrize("stored_date, late", [
+    ("2023-03-22T16:20:00", False),
+    ("2023-03-23T16:20:00", True),
+])
+def test_late_report_from_the_returned_last_report(stored_date, late):
+    """ DynamoDB returns the last report that failed the condition, so its
+        date is not read again.
+    """
+    from src.new_report.new_report import is_late_report
+    item = {"station": "Caracol", "date": "2023-03-22T16:20:00"}
+    assert is_late_report(None, item, {"station": {"S": "Caracol"}, "date": {"S": stored_date}}) == late
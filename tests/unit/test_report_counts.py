@@ -1,14 +1,18 @@
+from decimal import Decimal
 import json
 import os
 from typing import Callable
 
+import boto3
+from boto3.dynamodb.conditions import Key
 import pytest
 
 from .lambda_args import generate_event, get_context
-from tests.unit.table import REPORTS_TABLE_NAME
+from tests.unit.table import REPORTS_TABLE_NAME, REPORT_COUNTS_TABLE_NAME
 
 # Set the table name variable before importing lambda function to avoid raising an error
 os.environ["REPORTS_TABLE"] = REPORTS_TABLE_NAME
+os.environ["REPORT_COUNTS_TABLE"] = REPORT_COUNTS_TABLE_NAME
 
 
 class TestReportCounts:
@@ -49,3 +53,68 @@ class TestReportCounts:
 
         assert lambda_output["statusCode"] == 404
         assert data["message"] == "Station 'Caracol' not found"
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_report_counts_in_date_range(self, station_fixture):
+        handler = self.get_handler()
+        event = generate_event(
+            path_params={"station": station_fixture},
+            query_string_params={"start_date": "2023-02-20", "end_date": "2023-02-22T23:59:59"}
+        )
+
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert data["reports"] == [{"date": "2023-02-22", "count": 1}]
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_reports_without_counts_are_not_counted(self, station_fixture):
+        """ The counts are read from the report counts table alone, the
+            reports before it are counted by the backfill-counts command.
+        """
+        ddb_resource = boto3.resource("dynamodb")
+        ddb_resource.Table(REPORT_COUNTS_TABLE_NAME).delete_item(
+            Key={"station": station_fixture, "day": "2023-02-22"})
+        ddb_resource.Table(REPORTS_TABLE_NAME).put_item(Item={
+            "station": station_fixture,
+            "date": "2023-02-21T04:20:00",
+            "battery": Decimal("50.0"),
+            "panel": Decimal("60.0"),
+        })
+
+        handler = self.get_handler()
+        event = generate_event(path_params={"station": station_fixture})
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert data["reports"] == [{"date": "2023-02-23", "count": 1}]
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_query_follows_every_page(self, station_fixture):
+        from src.report_counts.report_counts import query_items
+
+        reports_tb = boto3.resource("dynamodb").Table(REPORTS_TABLE_NAME)
+        items = query_items(
+            reports_tb,
+            KeyConditionExpression=Key("station").eq(station_fixture),
+            Limit=1
+        )
+        assert [it["date"] for it in items] == ["2023-02-22T16:20:00", "2023-02-23T16:20:00"]
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_report_counts_not_modified(self, station_fixture):
+        handler = self.get_handler()
+        lambda_output = handler(generate_event({"station": station_fixture}), get_context())
+        etag = lambda_output["headers"]["ETag"]
+        assert "Last-Modified" not in lambda_output["headers"]
+
+        event = generate_event({"station": station_fixture}, headers={"If-None-Match": etag})
+        lambda_output = handler(event, get_context())
+        assert lambda_output["statusCode"] == 304
+
+        report_counts_tb = boto3.resource("dynamodb").Table(REPORT_COUNTS_TABLE_NAME)
+        report_counts_tb.put_item(Item={"station": station_fixture, "day": "2023-02-23", "count": 2})
+        lambda_output = handler(event, get_context())
+        assert lambda_output["statusCode"] == 200
@@ -0,0 +1,124 @@
+from decimal import Decimal
+import json
+import os
+from typing import Callable
+
+import boto3
+import pytest
+
+from .lambda_args import generate_event, generate_stream_event, get_context
+from tests.unit.table import REPORTS_TABLE_NAME, ROLLUPS_TABLE_NAME
+
+# Set the table name variable before importing lambda function to avoid raising an error
+os.environ["REPORTS_TABLE"] = REPORTS_TABLE_NAME
+os.environ["ROLLUPS_TABLE"] = ROLLUPS_TABLE_NAME
+
+REPORTS = [
+    {"station": "Caracol", "date": "2023-02-23T16:20:00", "battery": 12.5, "panel": 18.25},
+    {"station": "Caracol", "date": "2023-02-23T16:50:00", "battery": 12.0, "panel": 17.75},
+    {"station": "Caracol", "date": "2023-02-23T17:20:00", "battery": 13.0, "panel": 19.0},
+    {"station": "Tonalapa", "date": "2023-02-23T16:20:00", "battery": 5.0, "panel": 0.0},
+]
+
+
+class TestReportRollups:
+    """ Class for unit testing the stream consumer that maintains the
+        rollups of the reports.
+    """
+
+    @staticmethod
+    def get_handler() -> Callable:
+        """ Returns the lambda handler.
+
+            Handler is imported here to make sure boto3 gets mocked
+        """
+        from src.report_rollups.report_rollups import lambda_handler
+        return lambda_handler
+
+    @staticmethod
+    def get_rollup(station: str, bucket: str) -> dict:
+        table = boto3.resource("dynamodb").Table(ROLLUPS_TABLE_NAME)
+        return table.get_item(Key={"station": station, "bucket": bucket})["Item"]
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_rollups_of_a_batch(self):
+        handler = self.get_handler()
+        output = handler(generate_stream_event(REPORTS), get_context())
+
+        # Two hours and a day of Caracol, an hour and a day of Tonalapa
+        assert output == {"records": 4, "rollups": 5}
+        hour = self.get_rollup("Caracol", "1h#2023-02-23T16:00:00")
+        assert hour["count"] == 2
+        assert hour["battery_min"] == Decimal("12")
+        assert hour["battery_max"] == Decimal("12.5")
+        assert hour["battery_sum"] == Decimal("24.5")
+        assert hour["panel_last"] == Decimal("17.75")
+        day = self.get_rollup("Caracol", "1d#2023-02-23T00:00:00")
+        assert day["count"] == 3
+        assert day["battery_max"] == Decimal("13")
+        assert day["panel_sum"] == Decimal("55")
+        assert day["last_date"] == "2023-02-23T17:20:00"
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_rollups_are_merged_across_batches(self):
+        handler = self.get_handler()
+        # Newest report first, the older one must not replace the last values
+        handler(generate_stream_event(REPORTS[2:3]), get_context())
+        handler(generate_stream_event(REPORTS[:2]), get_context())
+
+        day = self.get_rollup("Caracol", "1d#2023-02-23T00:00:00")
+        assert day["count"] == 3
+        assert day["battery_min"] == Decimal("12")
+        assert day["battery_max"] == Decimal("13")
+        assert day["battery_last"] == Decimal("13")
+        assert day["last_date"] == "2023-02-23T17:20:00"
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_only_inserts_are_aggregated(self):
+        handler = self.get_handler()
+        output = handler(generate_stream_event(REPORTS, event_name="MODIFY"), get_context())
+        assert output == {"records": 4, "rollups": 0}
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_series_from_rollups(self):
+        self.get_handler()(generate_stream_event(REPORTS), get_context())
+
+        from src.report_series.report_series import lambda_handler
+        event = generate_event(
+            path_params={"station": "Caracol"},
+            query_string_params={"resolution": "1h", "start_date": "2023-02-23T16:30:00"}
+        )
+        lambda_output = lambda_handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert data["series"] == {
+            "date": ["2023-02-23T16:00:00", "2023-02-23T17:00:00"],
+            "count": [2, 1],
+            "battery": {"min": [12.0, 13.0], "max": [12.5, 13.0], "mean": [12.25, 13.0], "last": [12.0, 13.0]},
+            "panel": {"min": [17.75, 19.0], "max": [18.25, 19.0], "mean": [18.0, 19.0], "last": [17.75, 19.0]},
+        }
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_retried_batch_is_not_counted_twice(self):
+        handler = self.get_handler()
+        event = generate_stream_event(REPORTS)
+        handler(event, get_context())
+        # The stream retries the batch, or its first half when bisecting it
+        handler(event, get_context())
+        handler({"Records": event["Records"][:2]}, get_context())
+
+        day = self.get_rollup("Caracol", "1d#2023-02-23T00:00:00")
+        assert day["count"] == 3
+        assert day["battery_sum"] == Decimal("37.5")
+        assert day["battery_min"] == Decimal("12")
+        assert day["last_date"] == "2023-02-23T17:20:00"
+
+        # Newer records are still merged
+        handler(generate_stream_event([
+            {"station": "Caracol", "date": "2023-02-23T18:20:00", "battery": 11.5, "panel": 0.0},
+        ]), get_context())
+        day = self.get_rollup("Caracol", "1d#2023-02-23T00:00:00")
+        assert day["count"] == 4
+        assert day["battery_min"] == Decimal("11.5")
+        assert day["panel_last"] == Decimal("0")
@@ -0,0 +1,105 @@
+import json
+import os
+from typing import Callable
+
+import numpy as np
+import pytest
+
+from .lambda_args import generate_event, get_context
+from tests.unit.table import REPORTS_TABLE_NAME, ROLLUPS_TABLE_NAME
+
+# Set the table name variable before importing lambda function to avoid raising an error
+os.environ["REPORTS_TABLE"] = REPORTS_TABLE_NAME
+os.environ["ROLLUPS_TABLE"] = ROLLUPS_TABLE_NAME
+
+
+class TestReportSeries:
+    """ Class for unit testing the lambda function that resamples the
+        reports of a station.
+    """
+
+    @staticmethod
+    def get_handler() -> Callable:
+        """ Returns the lambda handler.
+
+            Handler is imported here to make sure boto3 gets mocked
+        """
+        from src.report_series.report_series import lambda_handler
+        return lambda_handler
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_daily_series_happy_path(self, station_fixture):
+        handler = self.get_handler()
+        event = generate_event(
+            path_params={"station": station_fixture},
+            query_string_params={"resolution": "1d"}
+        )
+
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert data["resolution"] == "1d"
+        assert data["series"] == {
+            "date": ["2023-02-22T00:00:00", "2023-02-23T00:00:00"],
+            "count": [1, 1],
+            "battery": {"min": [45.0, 55.0], "max": [45.0, 55.0], "mean": [45.0, 55.0], "last": [45.0, 55.0]},
+            "panel": {"min": [68.0, 60.0], "max": [68.0, 60.0], "mean": [68.0, 60.0], "last": [68.0, 60.0]},
+        }
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_series_in_date_range(self, station_fixture):
+        handler = self.get_handler()
+        event = generate_event(
+            path_params={"station": station_fixture},
+            query_string_params={"start_date": "2023-02-23T00:00:00"}
+        )
+
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert data["resolution"] == "1h"
+        assert data["series"]["date"] == ["2023-02-23T16:00:00"]
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_station_not_found(self):
+        handler = self.get_handler()
+        event = generate_event({"station": "Caracol"})
+
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 404
+        assert data["message"] == "Station 'Caracol' not found"
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_invalid_resolution(self, station_fixture):
+        handler = self.get_handler()
+        event = generate_event(
+            path_params={"station": station_fixture},
+            query_string_params={"resolution": "5m"}
+        )
+
+        lambda_output = handler(event, get_context())
+        assert lambda_output["statusCode"] == 400
+
+    def test_resample_buckets(self):
+        from src.report_series.report_series import resample
+        dates = np.array([
+            "2023-02-22T16:05:00",
+            "2023-02-22T16:35:00",
+            "2023-02-22T16:55:00",
+            "2023-02-22T18:10:00",
+        ], dtype="datetime64[s]")
+        battery = np.array([10.0, 30.0, 20.0, 40.0])
+        panel = np.array([1.0, 2.0, 3.0, 4.0])
+
+        series = resample(dates, battery, panel, "h")
+
+        assert series["date"] == ["2023-02-22T16:00:00", "2023-02-22T18:00:00"]
+        assert series["count"] == [3, 1]
+        assert series["battery"] == {
+            "min": [10.0, 40.0], "max": [30.0, 40.0], "mean": [20.0, 40.0], "last": [20.0, 40.0]
+        }
+        assert series["panel"]["last"] == [3.0, 4.0]
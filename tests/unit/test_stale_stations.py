@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import json
+import os
+from typing import Callable
+
+import boto3
+import pytest
+
+from .lambda_args import generate_event, get_context
+from tests.unit.table import LAST_REPORTS_TABLE_NAME
+
+# Set the table name variable before importing lambda function to avoid raising an error
+os.environ["LAST_REPORTS_TABLE"] = LAST_REPORTS_TABLE_NAME
+
+
+class TestStaleStations:
+    """ Class for unit testing the lambda function that returns the
+        stations that stopped reporting.
+    """
+
+    @staticmethod
+    def get_handler() -> Callable:
+        """ Returns the lambda handler.
+
+            Handler is imported here to make sure boto3 gets mocked
+        """
+        from src.stale_stations.stale_stations import lambda_handler
+        return lambda_handler
+
+    @staticmethod
+    def put_last_report(station: str, age: timedelta) -> str:
+        date = (datetime.now(timezone.utc).replace(tzinfo=None) - age).isoformat(timespec="seconds")
+        last_reports_tb = boto3.resource("dynamodb").Table(LAST_REPORTS_TABLE_NAME)
+        last_reports_tb.put_item(Item={
+            "station": station,
+            "date": date,
+            "battery": Decimal("150"),
+            "panel": Decimal("150"),
+            "fleet": "all",
+        })
+        return date
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_stale_stations(self, station_fixture):
+        caracol_date = self.put_last_report("Caracol", timedelta(hours=36))
+        self.put_last_report("Tonalapa", timedelta(hours=1))
+
+        handler = self.get_handler()
+        lambda_output = handler(generate_event(), get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        # The reports of the fixture are from 2023, oldest first
+        assert [rep["station"] for rep in data["stations"]] == ["Piedra Grande", station_fixture, "Caracol"]
+        assert data["stations"][-1] == {
+            "station": "Caracol", "date": caracol_date, "battery": 150.0, "panel": 150.0
+        }
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    def test_older_than(self):
+        self.put_last_report("Caracol", timedelta(hours=36))
+        self.put_last_report("Tonalapa", timedelta(hours=1))
+
+        handler = self.get_handler()
+        event = generate_event(query_string_params={"older_than": "PT30M"})
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+
+        assert lambda_output["statusCode"] == 200
+        assert [rep["station"] for rep in data["stations"]][-2:] == ["Caracol", "Tonalapa"]
+
+        event = generate_event(query_string_params={"older_than": "P2D"})
+        lambda_output = handler(event, get_context())
+        data = json.loads(lambda_output["body"])
+        assert "Caracol" not in [rep["station"] for rep in data["stations"]]
+
+    @pytest.mark.usefixtures("mock_dynamo_db")
+    @pytest.mark.parametrize("older_than", ["24H", "P1M", "PT", "P1DT", "P99999999W", "P999999D"])
+    def test_invalid_duration(self, older_than):
+        handler = self.get_handler()
+        event = generate_event(query_string_params={"older_than": older_than})
+        lambda_output = handler(event, get_context())
+        assert lambda_output["statusCode"] == 400
+
+
+@pytest.mark.parametrize("duration, expected", [
+    ("PT24H", timedelta(hours=24)),
+    ("P1DT12H", timedelta(days=1, hours=12)),
+    ("P2W", timedelta(weeks=2)),
+    ("PT90M", timedelta(minutes=90)),
+    ("PT1.5S", timedelta(seconds=1.5)),
+])
+def test_parse_duration(duration, expected):
+    from src.stale_stations.stale_stations import parse_duration
+    assert parse_duration(duration) == expected
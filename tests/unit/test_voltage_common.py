@@ -0,0 +1,240 @@
+import base64
+from decimal import Decimal
+import gzip
+import json
+import time
+
+from fastjsonschema import JsonSchemaException
+import pytest
+
+from src.layers.voltage_common.voltage_common.cache import TTLCache
+from src.layers.voltage_common.voltage_common import compression
+from src.layers.voltage_common.voltage_common.dynamodb import get_endpoint_url
+from src.layers.voltage_common.voltage_common.reports import (
+    batch_get_reports,
+    deserialize_report,
+    deserialize_reports,
+    parse_stations,
+)
+from src.layers.voltage_common.voltage_common.responses import respond
+from src.layers.voltage_common.voltage_common.serialization import get_serializer
+from src.layers.voltage_common.voltage_common import timestamps
+from src.layers.voltage_common.voltage_common.validation import (
+    get_validation_mode,
+    outbound_validator,
+)
+
+
+class TestTTLCache:
+
+    def test_entries_expire(self):
+        cache = TTLCache(ttl=0.01, max_size=10)
+        cache.put("Caracol", 1)
+        assert cache.get("Caracol") == 1
+
+        time.sleep(0.02)
+        assert cache.get("Caracol") is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TTLCache(ttl=60, max_size=2)
+        cache.put("Caracol", 1)
+        cache.put("Tonalapa", 2)
+        cache.get("Caracol")
+        cache.put("Ayutla", 3)
+
+        assert cache.get("Tonalapa") is None
+        assert cache.get("Caracol") == 1
+        assert cache.get("Ayutla") == 3
+
+
+def test_local_tables_use_local_endpoint():
+    assert get_endpoint_url("VoltageReportsTableLocal") == "http://dynamo-local:8000"
+    assert get_endpoint_url("voltage-dev-ReportsTable-YFR5XT9RWVJQ") is None
+
+
+def test_deserialize_reports():
+    items = [
+        {
+            "station": {"S": "Caracol"},
+            "date": {"S": "2023-02-23T16:20:00"},
+            "battery": {"N": "55.5"},
+            "panel": {"N": "60"},
+        }
+    ]
+    reports = deserialize_reports(items)
+    assert reports == [
+        {"station": "Caracol", "date": "2023-02-23T16:20:00", "battery": 55.5, "panel": 60.0}
+    ]
+    assert reports == [deserialize_report(it) for it in items]
+    assert type(reports[0]["panel"]) is float
+
+
+class UnprocessedKeysClient:
+    """ Client whose BatchGetItem leaves the last key of every request
+        unprocessed the given number of times.
+    """
+
+    def __init__(self, unprocessed: int):
+        self.unprocessed = unprocessed
+        self.calls = 0
+
+    def batch_get_item(self, RequestItems: dict) -> dict:
+        self.calls += 1
+        (table_name, request), = RequestItems.items()
+        keys = request["Keys"]
+        if self.unprocessed > 0:
+            self.unprocessed -= 1
+            keys, unprocessed = keys[:-1], keys[-1:]
+        else:
+            unprocessed = []
+        items = [
+            {**key, "date": {"S": "2023-02-23T16:20:00"}, "battery": {"N": "55"}, "panel": {"N": "60"}}
+            for key in keys
+        ]
+        ddb_res = {"Responses": {table_name: items}}
+        if unprocessed:
+            ddb_res["UnprocessedKeys"] = {table_name: {**request, "Keys": unprocessed}}
+        return ddb_res
+
+
+def test_batch_get_retries_unprocessed_keys(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    stations = [f"Station {ii:03d}" for ii in range(150)]
+    client = UnprocessedKeysClient(unprocessed=2)
+
+    reports, failed = batch_get_reports(client, "VoltageLastReportsTable", stations)
+
+    assert sorted(reports) == stations
+    assert failed == []
+    # Two chunks, the first one retried twice
+    assert client.calls == 4
+
+
+def test_batch_get_returns_failed_stations(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    client = UnprocessedKeysClient(unprocessed=10)
+
+    reports, failed = batch_get_reports(client, "VoltageLastReportsTable", ["Caracol"])
+
+    assert reports == {}
+    assert failed == ["Caracol"]
+
+
+def test_parse_stations():
+    assert parse_stations(" Caracol,,Tonalapa ,Caracol") == ["Caracol", "Tonalapa"]
+    assert parse_stations("") == []
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson"])
+def test_serializer_encodes_decimals(backend):
+    if backend == "orjson":
+        pytest.importorskip("orjson")
+    dumps = get_serializer(backend)
+    body = {"reports": [{"battery": Decimal("55.5"), "panel": Decimal("60"), "count": Decimal(2)}]}
+    assert json.loads(dumps(body)) == {"reports": [{"battery": 55.5, "panel": 60, "count": 2}]}
+
+
+def test_invalid_serializer_backend():
+    with pytest.raises(ValueError):
+        get_serializer("simplejson")
+
+
+class TestOutboundValidator:
+
+    schema = {
+        "type": "object",
+        "properties": {"statusCode": {"type": "integer"}, "body": {"type": "string"}},
+        "required": ["statusCode", "body"],
+    }
+
+    @staticmethod
+    def handler(event, context) -> dict:
+        return event
+
+    def test_full_validation(self):
+        handler = outbound_validator(self.schema, mode="full")(self.handler)
+        assert handler({"statusCode": 200, "body": "{}"}, None) == {"statusCode": 200, "body": "{}"}
+        with pytest.raises(JsonSchemaException):
+            handler({"statusCode": 200}, None)
+
+    @pytest.mark.parametrize("mode", ["sampled", "off"])
+    def test_responses_not_validated(self, mode):
+        handler = outbound_validator(self.schema, mode=mode, sample_rate=0.0)(self.handler)
+        assert handler({"statusCode": 200}, None) == {"statusCode": 200}
+
+    def test_validation_mode_from_env(self, monkeypatch):
+        monkeypatch.delenv("OUTBOUND_VALIDATION", raising=False)
+        monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "voltage-prod-ListLastReports")
+        assert get_validation_mode() == "sampled"
+
+        monkeypatch.setenv("OUTBOUND_VALIDATION", "off")
+        assert get_validation_mode() == "off"
+
+
+@pytest.mark.parametrize("accept_encoding, encoding", [
+    ("gzip, deflate, br", "br"),
+    ("gzip;q=1.0, br;q=0", "gzip"),
+    ("*", "br"),
+    ("identity", None),
+    ("", None),
+])
+def test_choose_encoding(monkeypatch, accept_encoding, encoding):
+    monkeypatch.setattr(compression, "brotli", object())
+    assert compression.choose_encoding(accept_encoding) == encoding
+
+
+def test_large_responses_are_compressed():
+    reports = [{"station": "Caracol", "date": "2023-02-23T16:20:00", "battery": 55.0}] * 1000
+    response = respond(200, {"reports": reports}, accept_encoding="gzip")
+
+    assert response["isBase64Encoded"] is True
+    assert response["headers"]["Content-Encoding"] == "gzip"
+    body = gzip.decompress(base64.b64decode(response["body"]))
+    assert json.loads(body) == {"reports": reports}
+
+
+def test_small_responses_are_not_compressed():
+    response = respond(200, {"message": "Caracol"}, accept_encoding="gzip")
+
+    assert response["isBase64Encoded"] is False
+    assert "Content-Encoding" not in response["headers"]
+    assert response["headers"]["Vary"] == "Accept-Encoding"
+    assert json.loads(response["body"]) == {"message": "Caracol"}
+
+
+def test_get_base64_encoded_body():
+    event = {"body": base64.b64encode(b'{"station": "Caracol"}').decode(), "isBase64Encoded": True}
+    assert compression.get_body(event) == '{"station": "Caracol"}'
+
+
+@pytest.mark.parametrize("value, date", [
+    ("2023/02/22,16:20:00", "2023-02-22T16:20:00"),
+    ("2024/02/29,00:00:59", "2024-02-29T00:00:59"),
+    ("2023-02-22T16:20:00", "2023-02-22T16:20:00"),
+    ("2023-02-22T16:20:00.250", "2023-02-22T16:20:00"),
+    ("2023-02-22T10:20:00-06:00", "2023-02-22T16:20:00"),
+    ("2023-02-22T16:20:00Z", "2023-02-22T16:20:00"),
+    (1677082800, "2023-02-22T16:20:00"),
+    (1677082800.5, "2023-02-22T16:20:00"),
+    (0, "1970-01-01T00:00:00"),
+])
+def test_parse_timestamp(value, date):
+    assert timestamps.parse_timestamp(value) == date
+
+
+@pytest.mark.parametrize("value", [
+    "2023/02/30,16:20:00",
+    "2023/13/22,16:20:00",
+    "2023/02/22,24:20:00",
+    "2023/+2/22,16:20:00",
+    "2023/02/22 16:20:00",
+    "22/02/2023",
+    10 ** 12,
+    "",
+    True,
+    None,
+])
+def test_parse_invalid_timestamp(value):
+    with pytest.raises(ValueError):
+        timestamps.parse_timestamp(value)